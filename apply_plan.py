@@ -0,0 +1,66 @@
+import os
+import sys
+
+import runner
+from change_set import ChangeSet
+from config_reader import ConfigReader
+from mirror_plan.mirror_plan import MirrorPlan
+from mirror_plan.mirror_state import MirrorState
+from mirror_plan.plan_applier import PlanApplier
+from retry_queue import RetryQueue
+
+# Plans are usually applied to a network mount, where links are bound by round trips.
+APPLY_WORKERS = 8
+
+
+def find_config_group(configs, plan_path: str):
+    """Return the config group whose ``plan_path`` is ``plan_path``, if any."""
+    for config_group in configs:
+        if config_group.get('plan_path') and os.path.abspath(config_group['plan_path']) == os.path.abspath(plan_path):
+            return config_group
+    return None
+
+
+def commit_state(config_group, plan_path: str):
+    """Make the state the dry run left next to the plan the group's mirror state."""
+    pending_path = runner.pending_state_path(plan_path)
+    state_path = config_group.get('state_path')
+    if not state_path or not os.path.exists(pending_path):
+        return
+    MirrorState(pending_path).save(state_path)
+    os.remove(pending_path)
+
+
+def main(argv=None):
+    """Apply plan files written by the runner's ``plan_path`` option.
+
+    When a config group writes the plan, the group's mirror state is updated
+    as its dry run planned it, and the change set is written and sent
+    downstream as after a regular run.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if not args:
+        print('Usage: apply_plan.py PLAN_FILE [PLAN_FILE ...]', file=sys.stderr)
+        return 2
+    configs = ConfigReader(runner.CONFIG_PATH).configs
+    for plan_path in args:
+        config_group = find_config_group(configs, plan_path)
+        plan = MirrorPlan.read(plan_path)
+        print(f'Applying {len(plan)} operations from {plan_path}')
+        changes = ChangeSet(config_group.get('mirror_path', runner.MIRROR_PATH)) if config_group else None
+        applier = PlanApplier(workers=APPLY_WORKERS, retries=RetryQueue(),
+                              on_applied=changes.record if changes is not None else None)
+        applier.apply(plan)
+        applier.finish()
+        applier.report()
+        print(f'Applied plan: {applier.summary}')
+        if config_group is None:
+            print(f'No config group writes {plan_path}, the mirror state and change set are not updated')
+            continue
+        commit_state(config_group, plan_path)
+        runner.publish_changes(config_group, changes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Apply time of a large link plan against storage with a fixed round-trip latency.
+
+Every stat, link and mkdir the applier makes sleeps for ``LATENCY`` seconds,
+the way each call costs a round trip on an NFS or SMB mount, so the numbers
+show how far concurrency hides latency rather than how fast the local disk is.
+
+Run with ``python -m benchmarks.bench_apply [LINKS]``.
+"""
+import os
+import sys
+import time
+import types
+
+from mirror_plan import plan_applier
+from mirror_plan.mirror_plan import MirrorPlan, PlanOperation
+
+DEFAULT_LINKS = 5000
+BOOKS_PER_DIR = 5
+LATENCY = 0.002
+WORKERS = (1, 4, 16, 64)
+
+
+class SlowOs(types.SimpleNamespace):
+    """Stands in for ``os`` inside the applier: every call succeeds after one round trip."""
+
+    path = os.path
+    _stat = os.stat_result((0o100644, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+
+    def stat(self, path):
+        time.sleep(LATENCY)
+        return self._stat
+
+    def link(self, source, target):
+        time.sleep(LATENCY)
+
+    def makedirs(self, path, exist_ok=False):
+        time.sleep(LATENCY)
+
+
+def build_plan(links):
+    plan = MirrorPlan()
+    for i in range(links):
+        target = f'/mirror/Author {i // BOOKS_PER_DIR}/Book {i}.epub'
+        plan.add_mkdir(os.path.dirname(target))
+        plan.operations.append(PlanOperation('link', target, f'/library/{i}/book.kepub', 1, 0))
+    return plan
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    links = int(args[0]) if args else DEFAULT_LINKS
+    plan = build_plan(links)
+    plan_applier.os = SlowOs()
+    print(f'{links} links in {links // BOOKS_PER_DIR} directories, {LATENCY * 1000:.0f} ms per call')
+    baseline = None
+    for workers in WORKERS:
+        applier = plan_applier.PlanApplier(workers=workers)
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        start = time.perf_counter()
+        applier.apply(plan)
+        elapsed = time.perf_counter() - start
+        sys.stdout.close()
+        sys.stdout = stdout
+        baseline = baseline or elapsed
+        print(f'workers {workers:>3}  {elapsed:.2f}s ({baseline / elapsed:.1f}x)  {applier.summary}')
+    plan_applier.os = os
+
+
+if __name__ == '__main__':
+    main()
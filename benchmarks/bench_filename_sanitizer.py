@@ -0,0 +1,57 @@
+"""Compare the project sanitizer with pathvalidate on a link-path workload.
+
+Run with ``python -m benchmarks.bench_filename_sanitizer``.
+"""
+import random
+import time
+
+from pathvalidate import sanitize_filename as pathvalidate_sanitize_filename
+
+from filename_sanitizer import sanitize_filename
+
+BOOKS = 50000
+AUTHORS = 2000
+SERIES = 5000
+
+
+def build_components(seed=0):
+    """Names in the proportions construct_link_path sanitizes them: author and
+    series repeat across many books, titles are mostly unique."""
+    rng = random.Random(seed)
+    authors = [f'Author {i}: {rng.choice(["Smith", "Ng", "Müller"])}' for i in range(AUTHORS)]
+    series = [f'Series {i}/{rng.choice(["Saga", "Chronicles", "Epic Collection"])}' for i in range(SERIES)]
+    components = []
+    for book in range(BOOKS):
+        index = rng.randint(1, 30)
+        title = f'Book {book}: A "Title" <{rng.random():.4f}>'
+        components.append(rng.choice(authors))
+        components.append(rng.choice(series))
+        components.append(f'{index} - {title}')
+        components.append(f'{index} - {title}.epub')
+    return components
+
+
+def timed(sanitize, components):
+    start = time.perf_counter()
+    for component in components:
+        sanitize(component)
+    return time.perf_counter() - start
+
+
+def main():
+    components = build_components()
+    baseline = timed(pathvalidate_sanitize_filename, components)
+    sanitize_filename.cache_clear()
+    cold = timed(sanitize_filename, components)
+    warm = timed(sanitize_filename, components)
+    info = sanitize_filename.cache_info()
+
+    print(f'{len(components)} components ({BOOKS} books)')
+    print(f'pathvalidate:        {baseline:.3f}s')
+    print(f'filename_sanitizer:  {cold:.3f}s first run ({baseline / cold:.1f}x)')
+    print(f'filename_sanitizer:  {warm:.3f}s second run ({baseline / warm:.1f}x)')
+    print(f'cache: {info.hits} hits, {info.misses} misses')
+
+
+if __name__ == '__main__':
+    main()
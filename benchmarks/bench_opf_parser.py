@@ -0,0 +1,61 @@
+"""Compare the ElementTree and lxml OPF backends on the parser test fixtures.
+
+Each round reads every field a ``BookRecord`` needs from every fixture, the
+same work the runner does per book. The fixtures are first checked to give
+identical results on both backends.
+
+Run with ``python -m benchmarks.bench_opf_parser``.
+"""
+import os
+import time
+
+from calibre_library.book_catalog import BookRecord
+from opf_parser.opf_parser import OPFParser
+from opf_parser.xml_backend import get_backend, lxml_etree
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'test', 'opf_parser', 'fixtures')
+ROUNDS = 2000
+
+
+def load_fixtures():
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            fixtures.append(f.read())
+    return fixtures
+
+
+def read_records(backend, fixtures, rounds=1):
+    return [BookRecord.from_opf('/library/metadata.opf', OPFParser(contents, backend))
+            for _ in range(rounds) for contents in fixtures]
+
+
+def parse_only(backend, fixtures, rounds=1):
+    for _ in range(rounds):
+        for contents in fixtures:
+            backend.parse(contents)
+
+
+def timed(work, backend, fixtures):
+    start = time.perf_counter()
+    work(backend, fixtures, ROUNDS)
+    return time.perf_counter() - start
+
+
+def main():
+    if lxml_etree is None:
+        print('lxml is not installed; only the ElementTree backend is available')
+        return
+    fixtures = load_fixtures()
+    etree, lxml = get_backend('etree'), get_backend('lxml')
+    assert read_records(etree, fixtures) == read_records(lxml, fixtures), 'backends disagree on the fixtures'
+
+    print(f'{len(fixtures) * ROUNDS} OPFs ({len(fixtures)} fixtures x {ROUNDS})')
+    for label, work in (('parse', parse_only), ('record', read_records)):
+        baseline = timed(work, etree, fixtures)
+        fast = timed(work, lxml, fixtures)
+        print(f'{label:<7} etree {baseline:.3f}s  lxml {fast:.3f}s ({baseline / fast:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
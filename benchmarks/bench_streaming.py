@@ -0,0 +1,139 @@
+"""Peak memory and time to first link for stream mode versus plan-then-apply.
+
+Each measurement runs in a fresh interpreter so ``ru_maxrss`` reflects that
+run alone. The library is synthetic: OPF paths, OPF text and file stats are
+generated on the fly, so a million books need no disk space and the numbers
+show only what the runner itself holds on to.
+
+Run with ``python -m benchmarks.bench_streaming [BOOKS ...]``.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+import types
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# Distinct author and series names. Their sanitized forms are memoized in a
+# bounded cache, so these are kept below the smallest size to measure the
+# runner rather than the cache filling up.
+AUTHORS = 1000
+SERIES = 3000
+BATCH_SIZES_LIMIT = 100_000
+# Peak RSS may grow by at most this factor (plus a small allowance for
+# allocator noise) between the smallest and largest stream run.
+FLAT_RSS_FACTOR = 1.25
+RSS_SLACK_KB = 4096
+
+OPF = '''<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+        <dc:title>Book {i}</dc:title>
+        <dc:creator opf:role="aut">Author {author}</dc:creator>
+        <meta name="calibre:series" content="Series {series}"/>
+        <meta name="calibre:series_index" content="{index}"/>
+        <meta name="calibre:user_metadata:#ext_library" content="{{&quot;#value#&quot;: [&quot;test-ext-lib&quot;]}}"/>
+    </metadata>
+</package>
+'''
+
+
+def synthetic_opf_files(books):
+    for i in range(books):
+        yield f'/synthetic/Author {i % AUTHORS}/Book {i} ({i})/metadata.opf'
+
+
+def synthetic_read_opf(file):
+    i = int(file.rsplit('(', 1)[1].split(')', 1)[0])
+    return OPF.format(i=i, author=i % AUTHORS, series=i % SERIES, index=i % 7 + 1)
+
+
+class FakeOs(types.SimpleNamespace):
+    """Stands in for ``os`` inside the planner: every book has one source
+    file and no link exists yet."""
+
+    path = os.path
+    _source_stat = os.stat_result((0o100644, 1, 1, 1, 0, 0, 0, 0, 0, 0))
+
+    def listdir(self, path):
+        return ['book.kepub']
+
+    def stat(self, path):
+        if path.startswith('/synthetic/'):
+            return self._source_stat
+        raise FileNotFoundError(path)
+
+
+def child(mode, books):
+    import runner
+    from mirror_plan import mirror_planner
+    from mirror_plan.plan_applier import PlanApplier
+
+    mirror_planner.os = FakeOs()
+    runner.read_opf = synthetic_read_opf
+    runner.list_book_dir = lambda book_dir: ['book.kepub']
+    config_group = {'mirror_path': '/mirror', 'dry_run': False}
+
+    class CountingApplier(PlanApplier):
+        first_link = None
+        links = 0
+
+        def apply_operation(self, op):
+            if op.op == 'link':
+                if CountingApplier.first_link is None:
+                    CountingApplier.first_link = time.perf_counter()
+                CountingApplier.links += 1
+
+    applier = CountingApplier()
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    if mode == 'stream':
+        runner.stream_config_group(config_group, applier, opf_files=synthetic_opf_files(books))
+    else:
+        runner.scan_library = lambda config_group, retries=None: list(synthetic_opf_files(books))
+        applier.apply(runner.plan_config_group(config_group))
+    total = time.perf_counter() - start
+    sys.stdout = sys.__stdout__
+
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(CountingApplier.links, CountingApplier.first_link - start, total, max_rss_kb)
+
+
+def measure(mode, books):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_streaming', '--child', mode, str(books)],
+                            check=True, capture_output=True, text=True).stdout
+    links, first_link, total, max_rss_kb = output.split()
+    assert int(links) == books, f'{mode} linked {links} of {books} books'
+    return float(first_link), float(total), int(max_rss_kb)
+
+
+def main(argv):
+    if argv[:1] == ['--child']:
+        child(argv[1], int(argv[2]))
+        return 0
+
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES)
+    print(f'{"mode":<7}{"books":>10}{"first link":>13}{"total":>10}{"peak RSS":>12}')
+    stream_rss = []
+    for books in sizes:
+        first_links = {}
+        for mode in ('stream', 'batch'):
+            if mode == 'batch' and books > BATCH_SIZES_LIMIT:
+                continue
+            first_link, total, max_rss_kb = measure(mode, books)
+            first_links[mode] = first_link
+            if mode == 'stream':
+                stream_rss.append(max_rss_kb)
+            print(f'{mode:<7}{books:>10}{first_link:>12.3f}s{total:>9.1f}s{max_rss_kb / 1024:>10.1f}MB')
+        if 'batch' in first_links:
+            assert first_links['stream'] < first_links['batch'] / 100, 'stream mode did not link first book early'
+
+    limit = min(stream_rss) * FLAT_RSS_FACTOR + RSS_SLACK_KB
+    assert max(stream_rss) <= limit, f'stream peak RSS grew from {min(stream_rss)}KB to {max(stream_rss)}KB'
+    print('stream peak RSS is flat across sizes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
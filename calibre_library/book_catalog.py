@@ -0,0 +1,139 @@
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from calibre_library.calibre_library import CalibreLibrary
+from opf_parser.opf_parser import OPFParser
+
+# Fields with an inverted index; custom columns are indexed under their '#label'.
+INDEXED_FIELDS = ('tags', 'authors', 'series', 'languages')
+# Formats come from the book directory's listing, which is only made for
+# books a selection gets as far as, so they are matched per record.
+SELECTABLE_FIELDS = INDEXED_FIELDS + ('formats',)
+
+# Files Calibre keeps in every book directory that are not book formats.
+_NON_FORMAT_FILES = frozenset(('metadata.opf', 'cover.jpg'))
+
+
+def normalize_value(value) -> str:
+    """Index key for a metadata value; matching is case-insensitive like Calibre's search."""
+    return str(value).casefold()
+
+
+def normalize_format(value) -> str:
+    return '.' + normalize_value(value).lstrip('.')
+
+
+@dataclass
+class BookRecord:
+    """Metadata of one book, read once and shared by every config group.
+
+    Provides the getters ``LinkPathConstructor`` uses, so a record can stand
+    in for the ``OPFParser`` it was built from.
+    """
+    opf_path: str
+    title: str | None = None
+    authors: tuple[str, ...] = ()
+    series: str | None = None
+    series_index: str | None = None
+    tags: tuple[str, ...] = ()
+    languages: tuple[str, ...] = ()
+    # The book directory's listing; None until ``list_files`` is called.
+    files: tuple[str, ...] | None = None
+    custom: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_opf(cls, opf_path: str, parser: OPFParser, files=None) -> 'BookRecord':
+        return cls(opf_path, parser.get_title(), tuple(parser.get_authors()), parser.get_series(),
+                   parser.get_series_index(), tuple(parser.get_tags()), tuple(parser.get_languages()),
+                   None if files is None else tuple(files), parser.get_custom_columns())
+
+    @property
+    def book_id(self) -> str:
+        return CalibreLibrary.book_id(self.opf_path)
+
+    def list_files(self) -> tuple[str, ...]:
+        """Return the book directory's file names, listing it on first use.
+
+        Books are read without a listing, so the many a group does not select
+        cost no listing on top of the walk's.
+        """
+        if self.files is None:
+            self.files = tuple(os.listdir(os.path.dirname(self.opf_path)))
+        return self.files
+
+    @property
+    def formats(self) -> tuple[str, ...]:
+        return tuple(os.path.splitext(f)[1].lower() for f in self.list_files()
+                     if f not in _NON_FORMAT_FILES and os.path.splitext(f)[1])
+
+    def values(self, field_name: str) -> tuple:
+        """Return the values of a selectable field, always as a tuple."""
+        if field_name.startswith('#'):
+            value = self.custom.get(field_name)
+            if value is None:
+                return ()
+            return tuple(value) if isinstance(value, list) else (value,)
+        if field_name == 'series':
+            return (self.series,) if self.series else ()
+        if field_name in SELECTABLE_FIELDS:
+            return getattr(self, field_name)
+        raise KeyError(field_name)
+
+    def get_title(self):
+        return self.title
+
+    def get_series(self):
+        return self.series
+
+    def get_series_index(self):
+        return self.series_index
+
+    def get_author(self):
+        return self.authors[0] if self.authors else None
+
+
+class BookCatalog:
+    """All books of a library with inverted indexes over their metadata.
+
+    Built once per library and run, so config groups select books with index
+    lookups instead of each reparsing every OPF.
+    """
+
+    def __init__(self, records=()):
+        self._records = {}
+        self._positions = {}
+        self._index = defaultdict(lambda: defaultdict(set))
+        # Filled in by whoever loads the catalog: ids of books whose OPF could
+        # not be read, and whether every directory of the library was listed.
+        # Books missing for either reason must not be mistaken for deleted ones.
+        self.unreadable = set()
+        self.complete = True
+        for record in records:
+            self.add(record)
+
+    def add(self, record: BookRecord):
+        book_id = record.book_id
+        self._positions.setdefault(book_id, len(self._positions))
+        self._records[book_id] = record
+        for field_name in INDEXED_FIELDS + tuple(record.custom):
+            for value in record.values(field_name):
+                self._index[field_name][normalize_value(value)].add(book_id)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def book_ids(self) -> set[str]:
+        return set(self._records)
+
+    def lookup(self, field_name: str, value) -> set[str]:
+        """Return the ids of books whose ``field_name`` contains ``value``."""
+        index = self._index.get(field_name)
+        return set(index.get(normalize_value(value), ())) if index else set()
+
+    def records(self, book_ids) -> list[BookRecord]:
+        """Return the records for ``book_ids`` in library scan order."""
+        return [self._records[book_id] for book_id in sorted(book_ids, key=self._positions.__getitem__)]
@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+
+from calibre_library.book_catalog import (SELECTABLE_FIELDS, BookCatalog, BookRecord, normalize_format,
+                                         normalize_value)
+
+
+class SelectionError(ValueError):
+    """A config group's ``select`` spec is malformed."""
+
+
+class Selection(ABC):
+    """A compiled book predicate.
+
+    ``matches`` decides a single record. ``candidates`` narrows a catalog to
+    a superset of the matching book ids with index lookups, or returns None
+    when the predicate cannot be answered from the indexes alone.
+    """
+
+    @abstractmethod
+    def matches(self, record: BookRecord) -> bool:
+        ...
+
+    def candidates(self, catalog: BookCatalog) -> set[str] | None:
+        return None
+
+    def select(self, catalog: BookCatalog, errors: list | None = None) -> list[BookRecord]:
+        """Return the matching records in library scan order.
+
+        Matching a record on ``formats`` lists its directory. With
+        ``errors``, a record whose directory cannot be listed is left out
+        and added to ``errors`` as ``(record, error)`` instead of failing
+        the whole selection.
+        """
+        book_ids = self.candidates(catalog)
+        records = iter(catalog) if book_ids is None else catalog.records(book_ids)
+        if errors is None:
+            return [record for record in records if self.matches(record)]
+        selected = []
+        for record in records:
+            try:
+                if self.matches(record):
+                    selected.append(record)
+            except OSError as e:
+                errors.append((record, e))
+        return selected
+
+
+class FieldSelection(Selection):
+    """Books with at least one of ``values`` in ``field_name``."""
+
+    def __init__(self, field_name: str, values):
+        self.field_name = field_name
+        normalize = normalize_format if field_name == 'formats' else normalize_value
+        self._normalize = normalize
+        self.values = frozenset(normalize(v) for v in values)
+
+    def matches(self, record: BookRecord) -> bool:
+        return any(self._normalize(v) in self.values for v in record.values(self.field_name))
+
+    def candidates(self, catalog: BookCatalog) -> set[str] | None:
+        if self.field_name == 'formats':
+            return None
+        book_ids = set()
+        for value in self.values:
+            book_ids |= catalog.lookup(self.field_name, value)
+        return book_ids
+
+
+class ExtLibrarySelection(Selection):
+    """Books whose ``#ext_library`` column contains ``lib_name``, the default without a ``select`` spec.
+
+    Keeps the original ``ext_lib_name`` semantics: membership for a list
+    column and a case-sensitive substring match for a text column, so a
+    text value such as ``"Kobo, Kindle"`` selects the book for ``Kobo``.
+    """
+
+    def __init__(self, lib_name: str):
+        self.lib_name = lib_name
+
+    def matches(self, record: BookRecord) -> bool:
+        value = record.custom.get('#ext_library')
+        return isinstance(value, (str, list)) and self.lib_name in value
+
+
+class AllSelection(Selection):
+    def __init__(self, selections: list[Selection]):
+        self.selections = selections
+
+    def matches(self, record: BookRecord) -> bool:
+        return all(s.matches(record) for s in self.selections)
+
+    def candidates(self, catalog: BookCatalog) -> set[str] | None:
+        # Any indexed clause bounds the result; the others are checked per record.
+        book_ids = None
+        for selection in self.selections:
+            found = selection.candidates(catalog)
+            if found is not None:
+                book_ids = found if book_ids is None else book_ids & found
+                if not book_ids:
+                    break
+        return book_ids
+
+
+class AnySelection(Selection):
+    def __init__(self, selections: list[Selection]):
+        self.selections = selections
+
+    def matches(self, record: BookRecord) -> bool:
+        return any(s.matches(record) for s in self.selections)
+
+    def candidates(self, catalog: BookCatalog) -> set[str] | None:
+        book_ids = set()
+        for selection in self.selections:
+            found = selection.candidates(catalog)
+            if found is None:
+                return None
+            book_ids |= found
+        return book_ids
+
+
+class NotSelection(Selection):
+    def __init__(self, selection: Selection):
+        self.selection = selection
+
+    def matches(self, record: BookRecord) -> bool:
+        return not self.selection.matches(record)
+
+
+def compile_selection(spec) -> Selection:
+    """Compile a ``select`` spec from the config into a ``Selection``.
+
+    A mapping selects books matching every key in it. Keys are a field
+    (``tags``, ``authors``, ``series``, ``languages``, ``formats`` or a
+    custom column such as ``'#genre'``) mapped to one value or a list of
+    values, any of which may match; or ``all``/``any`` mapped to a list of
+    specs; or ``not`` mapped to a spec. A list is the same as ``all``.
+
+    Raises:
+        SelectionError: If the spec uses an unknown key or the wrong shape
+    """
+    if isinstance(spec, list):
+        return _combine(AllSelection, spec, 'all')
+    if not isinstance(spec, dict) or not spec:
+        raise SelectionError(f'Selection must be a non-empty mapping or list, got {spec!r}')
+
+    selections = []
+    for key, value in spec.items():
+        if key in ('all', 'any'):
+            selections.append(_combine(AllSelection if key == 'all' else AnySelection, value, key))
+        elif key == 'not':
+            selections.append(NotSelection(compile_selection(value)))
+        elif key in SELECTABLE_FIELDS or (isinstance(key, str) and key.startswith('#') and len(key) > 1):
+            values = value if isinstance(value, list) else [value]
+            if not values or any(v is None or isinstance(v, (dict, list)) for v in values):
+                raise SelectionError(f'Selection field {key!r} needs one or more plain values, got {value!r}')
+            selections.append(FieldSelection(key, values))
+        else:
+            raise SelectionError(f'Unknown selection key {key!r}')
+    return selections[0] if len(selections) == 1 else AllSelection(selections)
+
+
+def _combine(cls, specs, key: str) -> Selection:
+    if not isinstance(specs, list) or not specs:
+        raise SelectionError(f'{key!r} needs a non-empty list of selections, got {specs!r}')
+    return cls([compile_selection(spec) for spec in specs])
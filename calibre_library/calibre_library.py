@@ -1,26 +1,203 @@
 import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from calibre_library.concurrent_walker import ConcurrentWalker
+from calibre_library.incremental_walker import IncrementalWalker, cached_book_dir
+from opf_parser.opf_parser import OPFParser
+
+
+_BOOK_DIR_ID = re.compile(r'\((\d+)\)$')
+METADATA_DB = 'metadata.db'
+
+
+def _timestamp_ns(value: str) -> int:
+    """Convert a metadata.db timestamp such as ``2024-05-01 12:00:00.5+00:00`` to epoch nanoseconds."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1_000_000) * 1000
+
+
+class UnknownBookError(LookupError):
+    """A book id that cannot be resolved without walking the library.
+
+    Raised when neither metadata.db nor the walk cache can place the book,
+    which says nothing about whether it still exists.
+    """
 
 
 class CalibreLibrary:
-    def __init__(self, path: str):
+    def __init__(self, path: str, scan_workers: int = 1, scan_max_in_flight: int | None = None,
+                 scan_controller=None, walk_cache_path: str | None = None, walk_trust_mtimes: bool | None = None):
         self._path = path
+        self._scan_workers = scan_workers
+        self._scan_max_in_flight = scan_max_in_flight
+        self._scan_controller = scan_controller
+        self._walk_cache_path = walk_cache_path
+        self._walk_trust_mtimes = walk_trust_mtimes
+        self.scan_errors = []
+
+    @staticmethod
+    def book_id(opf_path: str) -> str:
+        """Return the Calibre book id for an OPF path.
+
+        Calibre names book directories ``Title (id)``; paths that do not follow
+        that convention fall back to the book directory itself.
+        """
+        book_dir = os.path.dirname(opf_path)
+        match = _BOOK_DIR_ID.search(os.path.basename(book_dir))
+        return match.group(1) if match else book_dir
+
+    def book_dir(self, book_id: str) -> str | None:
+        """Return the directory of a book by id without walking the library.
 
-    def list_all_opf(self):
+        Calibre's metadata.db is authoritative when present; otherwise the
+        walk cache is consulted. Returns None only if metadata.db says the
+        book does not exist.
+
+        Raises:
+            UnknownBookError: If metadata.db cannot be read, or there is none
+                and the walk cache does not have the book
+        """
+        db_path = os.path.join(self._path, METADATA_DB)
+        if os.path.exists(db_path):
+            try:
+                # Read-only, so a running Calibre is never blocked on our behalf.
+                with closing(sqlite3.connect(f'{Path(db_path).as_uri()}?mode=ro', uri=True)) as db:
+                    row = db.execute('SELECT path FROM books WHERE id = ?', (int(book_id),)).fetchone()
+            except sqlite3.Error as e:
+                raise UnknownBookError(f'Could not look up book {book_id} in {db_path}: {e}') from e
+            return os.path.join(self._path, row[0]) if row else None
+        book_dir = cached_book_dir(self._walk_cache_path, self._path, book_id) if self._walk_cache_path else None
+        if book_dir is None:
+            raise UnknownBookError(f'Book {book_id} is in neither a metadata.db nor the walk cache of {self._path}')
+        return book_dir
+
+    def resolve_book(self, target: str) -> tuple[str, str | None] | None:
+        """Resolve a book id or a path inside a book directory.
+
+        Returns:
+            ``(book_id, opf_path)``, with opf_path None if the book no longer
+            exists, or None if ``target`` is a path outside this library
+
+        Raises:
+            UnknownBookError: If ``target`` is an id that cannot be resolved,
+                including one whose directory has no OPF (yet)
+        """
+        if target.isdigit():
+            book_dir = self.book_dir(target)
+            if book_dir is None:
+                return target, None
+            opf_path = os.path.join(book_dir, 'metadata.opf')
+            if not os.path.exists(opf_path):
+                raise UnknownBookError(f'Book {target} has no metadata.opf in {book_dir}')
+            return target, opf_path
+
+        path = os.path.abspath(target)
+        if os.path.basename(path) == 'metadata.opf' or os.path.isfile(path):
+            path = os.path.dirname(path)
+        root = os.path.abspath(self._path)
+        if os.path.commonpath([root, path]) != root or path == root:
+            return None
+        opf_path = os.path.join(path, 'metadata.opf')
+        return self.book_id(opf_path), opf_path if os.path.exists(opf_path) else None
+
+    def list_all_opf(self, retries=None):
         print(f'Looking for opf files in {self._path}')
 
         file_paths = []
         count = 0
-        for dirpath, dirnames, filenames in os.walk(self._path):
-            for filename in filenames:
-                if filename == 'metadata.opf':
-                    file_path = os.path.join(dirpath, filename)
-                    file_paths.append(file_path)
-                    count += 1
-                    if count % 100 == 0:
-                        print('.', end='', flush=True)
-                    # print(f'Found opf: {file_path}')
+        for file_path in self.iter_opf(retries):
+            file_paths.append(file_path)
+            count += 1
+            if count % 100 == 0:
+                print('.', end='', flush=True)
+            # print(f'Found opf: {file_path}')
         print (f'\nDone looking for opf files in {self._path}')
         return file_paths
 
+    def book_mtimes(self, retries=None) -> dict[str, int]:
+        """Map each book's OPF path to when the book last changed, in nanoseconds.
+
+        Calibre's metadata.db records ``last_modified`` for every book, so the
+        whole library is listed with one query. Without it the library is
+        walked and each OPF stat'ed; Calibre rewrites the OPF whenever the
+        book's metadata or formats change.
+        """
+        db_path = os.path.join(self._path, METADATA_DB)
+        if os.path.exists(db_path):
+            self.scan_errors = []
+            with closing(sqlite3.connect(f'{Path(db_path).as_uri()}?mode=ro', uri=True)) as db:
+                rows = db.execute('SELECT path, last_modified FROM books').fetchall()
+            return {os.path.join(self._path, path, 'metadata.opf'): _timestamp_ns(last_modified)
+                    for path, last_modified in rows}
+        mtimes = {}
+        for opf_path in self.iter_opf(retries):
+            try:
+                mtimes[opf_path] = os.stat(opf_path).st_mtime_ns
+            except FileNotFoundError:
+                continue  # a book deleted while the walk was running
+        return mtimes
+
+    def iter_books(self):
+        """Yield ``(opf_path, OPFParser)`` for each book as the walk finds it."""
+        for file_path in self.iter_opf():
+            yield file_path, OPFParser(Path(file_path).read_text())
+
+    def iter_opf(self, retries=None):
+        """Yield OPF paths as the walk finds them, without building a list.
+
+        Directories that cannot be listed end up in ``scan_errors``, except
+        book directories deleted while the walk was running. With a
+        ``RetryQueue``, directories that failed with a transient error are
+        walked again once the rest of the library has been yielded.
+        """
+        self.scan_errors = []
+        yield from self._walk(self._path, self._walk_cache_path)
+        if retries is None:
+            return
+        failed, self.scan_errors = self.scan_errors, []
+        for error in failed:
+            self._retry_scan(retries, error, 1)
+        for path, attempts in retries.drain():
+            seen = len(self.scan_errors)
+            yield from self._walk(path)
+            failed, self.scan_errors[seen:] = self.scan_errors[seen:], []
+            for error in failed:
+                self._retry_scan(retries, error, attempts + 1)
+
+    def _retry_scan(self, retries, error: OSError, attempts: int):
+        if not retries.defer(error.filename, error, attempts):
+            retries.fail(error.filename, error)
+            self.scan_errors.append(error)
 
+    def _walk(self, root: str, walk_cache_path: str | None = None):
+        workers = self._scan_workers
+        if self._scan_controller is not None:
+            workers = max(workers, self._scan_controller.max_concurrency)
+        if walk_cache_path:
+            walker = IncrementalWalker(root, walk_cache_path, workers, self._scan_max_in_flight,
+                                       controller=self._scan_controller, trust_mtimes=self._walk_trust_mtimes)
+        elif self._scan_workers > 1 or self._scan_controller is not None:
+            walker = ConcurrentWalker(root, workers, self._scan_max_in_flight, controller=self._scan_controller)
+        else:
+            errors = []
+            for dirpath, dirnames, filenames in os.walk(root, onerror=errors.append):
+                for filename in filenames:
+                    if filename == 'metadata.opf':
+                        yield os.path.join(dirpath, filename)
+            self._record_scan_errors(errors)
+            return
+        yield from walker.iter_opf()
+        self._record_scan_errors(walker.errors)
 
+    def _record_scan_errors(self, errors):
+        for error in errors:
+            if isinstance(error, FileNotFoundError) and error.filename != self._path:
+                continue  # a book deleted while the walk was running
+            print(f'Could not list {error.filename}: {error}')
+            self.scan_errors.append(error)
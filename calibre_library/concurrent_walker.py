@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class ConcurrentWalker:
+    """Finds OPF files by listing directories concurrently.
+
+    On network mounts every directory listing is a round trip, so a sequential
+    ``os.walk`` spends nearly all of its time waiting. The walker lists each
+    directory as a separate task on a bounded thread pool, starting with the
+    top-level author directories, and yields OPF paths as listings complete.
+    """
+
+    def __init__(self, path: str, max_workers: int = 8, max_in_flight: int | None = None,
+                 filename: str = 'metadata.opf', controller=None):
+        """
+        Initialize the ConcurrentWalker.
+
+        Args:
+            path: Root directory to walk
+            max_workers: Number of threads listing directories
+            max_in_flight: Maximum number of outstanding listings; defaults to max_workers
+            filename: Name of the files to look for
+            controller: Optional AdaptiveConcurrencyController that further
+                limits outstanding listings based on observed latency
+        """
+        self._path = path
+        self.max_workers = max(1, max_workers)
+        self.max_in_flight = max(1, max_in_flight or self.max_workers)
+        self.filename = filename
+        self.controller = controller
+        self.errors = []
+
+    def list_dir(self, path: str) -> tuple[list[str], list[str]]:
+        """Return the file and subdirectory names in ``path``.
+
+        Unreadable directories are treated as empty, matching ``os.walk``,
+        and their errors are kept in ``errors``.
+        """
+        try:
+            return self.scan_dir(path)
+        except OSError as e:
+            self.errors.append(e)
+            return [], []
+
+    @staticmethod
+    def scan_dir(path: str) -> tuple[list[str], list[str]]:
+        """Like ``list_dir``, but raise OSError if ``path`` cannot be listed."""
+        filenames, dirnames = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                (dirnames if is_dir else filenames).append(entry.name)
+        return filenames, dirnames
+
+    def iter_opf(self):
+        """Yield OPF file paths in completion order."""
+        if not self._path:
+            return
+        yield from self.walk([self._path])
+
+    def walk(self, roots: list[str]):
+        """Yield OPF file paths found under each of ``roots``, in completion order."""
+        pending_dirs = [(root, 0) for root in roots]
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending_dirs or in_flight:
+                while pending_dirs and len(in_flight) < self._in_flight_limit():
+                    path, depth = pending_dirs.pop()
+                    in_flight[executor.submit(self.visit, path, depth)] = path, depth
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, depth = in_flight.pop(future)
+                    found, dirnames = future.result()
+                    yield from found
+                    pending_dirs.extend((os.path.join(path, d), depth + 1) for d in dirnames)
+
+    def visit(self, path: str, depth: int) -> tuple[list[str], list[str]]:
+        """List one directory for the walk.
+
+        Args:
+            path: Directory to visit
+            depth: Distance from the walk root, 0 for the root itself
+
+        Returns:
+            The OPF paths found and the subdirectory names to descend into
+        """
+        filenames, dirnames = self._timed_list_dir(path)
+        return ([os.path.join(path, self.filename)] if self.filename in filenames else []), dirnames
+
+    def _in_flight_limit(self) -> int:
+        if self.controller is None:
+            return self.max_in_flight
+        return min(self.max_in_flight, self.controller.limit)
+
+    def _timed_list_dir(self, path: str):
+        return self.timed(self.list_dir, path)
+
+    def timed(self, fn, *args):
+        """Call ``fn`` under the adaptive controller, if there is one."""
+        if self.controller is None:
+            return fn(*args)
+        return self.controller.run(fn, *args)
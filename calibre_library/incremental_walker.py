@@ -0,0 +1,239 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+from calibre_library.concurrent_walker import ConcurrentWalker
+
+WALK_CACHE_VERSION = 1
+# Directories modified this close to the previous walk may have changed again
+# within the same mtime tick (2s on FAT, 1s on HFS+), so they are listed again.
+RACY_WINDOW_NS = 2_000_000_000
+# Filesystems whose directory mtimes are not reliably bumped when entries
+# change, or are served stale from client caches.
+UNTRUSTED_FS_TYPES = frozenset((
+    'cifs', 'smb3', 'smbfs', 'afpfs', 'webdav', '9p', 'davfs', 'fuse.davfs2', 'fuse.rclone', 'fuse.s3fs',
+    'fuse.gcsfuse', 'fuse.goofys', 'fuse.mergerfs', 'macfuse', 'osxfuse',
+))
+MOUNTS_PATH = '/proc/self/mounts'
+# Where there is no /proc (macOS, BSD), e.g. "//nas/Books on /Volumes/Books (smbfs, nodev, nosuid)".
+MOUNT_COMMAND = ('mount',)
+_MOUNT_LINE = re.compile(r'^.*? on (/.*) \(([^,()]+)[^()]*\)$')
+
+
+def _mount_table() -> list[tuple[str, str]]:
+    """Return ``(mount_point, type)`` for every mount, or an empty list if they cannot be read."""
+    try:
+        with open(MOUNTS_PATH, 'r', encoding='utf-8') as f:
+            return [(re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1]), fields[2])  # e.g. \040
+                    for fields in map(str.split, f) if len(fields) >= 3]
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(MOUNT_COMMAND, capture_output=True, text=True, check=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return [match.groups() for match in map(_MOUNT_LINE.match, output.splitlines()) if match]
+
+
+def filesystem_type(path: str) -> str | None:
+    """Return the type of the filesystem mounted at or above ``path``, if known."""
+    path = os.path.realpath(path)
+    best, fs_type = '', None
+    for mount_point, mount_type in _mount_table():
+        prefix = mount_point.rstrip('/') + '/'
+        if (path == mount_point or path.startswith(prefix)) and len(mount_point) >= len(best):
+            best, fs_type = mount_point, mount_type
+    return fs_type
+
+
+def cached_book_dir(cache_path: str, root: str, book_id: str) -> str | None:
+    """Look up the directory of ``book_id`` in a walk cache, without touching the library."""
+    suffix = f'({book_id})'
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data['root'] != root:
+            return None
+        for rel in data['dirs']:
+            if rel.endswith(suffix):
+                return os.path.join(root, rel)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+class IncrementalWalker(ConcurrentWalker):
+    """A ``ConcurrentWalker`` that skips directories unchanged since the last walk.
+
+    Adding or removing an entry bumps its parent directory's mtime. The
+    walker saves the mtime and listing of every directory, and on the next
+    walk it stats a directory before listing it. The root's cached listing
+    is reused but its children are still checked. Below the root, an
+    unchanged directory's cached subtree is reused without further I/O,
+    except for directories in it that had no OPF, which are checked again.
+    A walk of an unchanged library therefore costs one stat for the root
+    and one for each author directory.
+    """
+
+    def __init__(self, path: str, cache_path: str, max_workers: int = 8, max_in_flight: int | None = None,
+                 filename: str = 'metadata.opf', controller=None, trust_mtimes: bool | None = None,
+                 racy_window_ns: int = RACY_WINDOW_NS):
+        """
+        Initialize the IncrementalWalker.
+
+        Args:
+            cache_path: File the directory mtimes and listings are kept in
+            trust_mtimes: Whether directory mtimes can be relied on; None
+                detects it from the filesystem type
+            racy_window_ns: Directories modified less than this long before
+                the previous walk started are listed again
+
+        The other arguments are as for ``ConcurrentWalker``.
+        """
+        super().__init__(path, max_workers, max_in_flight, filename, controller)
+        self.cache_path = cache_path
+        self.trust_mtimes = trust_mtimes
+        self.racy_window_ns = racy_window_ns
+        self.listed = 0
+        self.reused = 0
+        self._cached = {}
+        self._trusted_before_ns = 0
+        self._entries = {}
+        self._use_cache = False
+        self._root_mtime_ns = None
+        self._lock = threading.Lock()
+
+    def mtimes_trustworthy(self, root_stat: os.stat_result) -> bool:
+        if self.trust_mtimes is not None:
+            return self.trust_mtimes
+        fs_type = filesystem_type(self._path)
+        if fs_type is None:
+            print('Could not tell the filesystem type, walking the whole library; '
+                  'set walk_trust_mtimes to use the walk cache')
+            return False
+        if fs_type in UNTRUSTED_FS_TYPES:
+            print(f'Directory mtimes on {fs_type} are not reliable, walking the whole library')
+            return False
+        return root_stat.st_mtime_ns != 0
+
+    def iter_opf(self):
+        """Yield OPF file paths, reusing listings of unchanged directories."""
+        if not self._path:
+            return
+        try:
+            root_stat = os.stat(self._path)
+        except OSError as e:
+            self.errors.append(e)
+            return
+        self._use_cache = self.mtimes_trustworthy(root_stat)
+        if not self._use_cache:
+            yield from self.walk([self._path])
+            return
+
+        started_ns = time.time_ns()
+        self._root_mtime_ns = root_stat.st_mtime_ns
+        self._load(root_stat)
+        self._entries = {}
+        self.listed = self.reused = 0
+        yield from self.walk([self._path])
+        self._save(root_stat, started_ns)
+        print(f'Walk cache: reused {self.reused} directories, listed {self.listed}')
+
+    def visit(self, path: str, depth: int) -> tuple[list[str], list[str]]:
+        if not self._use_cache:
+            return super().visit(path, depth)
+        try:
+            # The root was stat'ed when the walk started.
+            mtime_ns = self._root_mtime_ns if depth == 0 else os.stat(path).st_mtime_ns
+        except OSError as e:
+            self.errors.append(e)
+            return [], []
+        entry = self._cached.get(path)
+        if entry is not None and entry[0] == mtime_ns and mtime_ns < self._trusted_before_ns:
+            if depth == 0:
+                with self._lock:
+                    self._entries[path] = entry
+                    self.reused += 1
+                return self._found(path, entry), entry[2]
+            cached = self._cached_subtree(path)
+            if cached is not None:
+                subtree, unchecked = cached
+                with self._lock:
+                    self._entries.update(subtree)
+                    self.reused += len(subtree)
+                return [opf for p, e in subtree.items() for opf in self._found(p, e)], unchecked
+
+        try:
+            filenames, dirnames = self.timed(self.scan_dir, path)
+        except OSError as e:
+            # Not recorded, so the directory is tried again next walk.
+            self.errors.append(e)
+            return [], []
+        entry = (mtime_ns, self.filename in filenames, dirnames)
+        with self._lock:
+            self._entries[path] = entry
+            self.listed += 1
+        return self._found(path, entry), dirnames
+
+    def _found(self, path: str, entry) -> list[str]:
+        return [os.path.join(path, self.filename)] if entry[1] else []
+
+    def _cached_subtree(self, path: str) -> tuple[dict, list[str]] | None:
+        """Cached entries for ``path`` and everything below it, or None if any are missing.
+
+        Directories below ``path`` that had no OPF are left out and returned
+        separately, relative to ``path``, to be visited again: a book
+        directory listed before Calibre wrote its OPF gets the OPF without
+        its author directory's mtime changing.
+        """
+        subtree = {}
+        unchecked = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            entry = self._cached.get(current)
+            if entry is None:
+                return None
+            if current != path and not entry[1]:
+                unchecked.append(os.path.relpath(current, path))
+                continue
+            subtree[current] = entry
+            stack.extend(os.path.join(current, d) for d in entry[2])
+        return subtree, unchecked
+
+    def _load(self, root_stat: os.stat_result):
+        self._cached = {}
+        self._trusted_before_ns = 0
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (data['version'], data['root'], data['dev']) != (WALK_CACHE_VERSION, self._path, root_stat.st_dev):
+                print(f'Walk cache {self.cache_path} is for another library, walking the whole library')
+                return
+            self._cached = {
+                self._path if rel == '.' else os.path.join(self._path, rel): (mtime_ns, bool(found), dirnames)
+                for rel, (mtime_ns, found, dirnames) in data['dirs'].items()
+            }
+            self._trusted_before_ns = data['started_ns'] - self.racy_window_ns
+        except (OSError, ValueError, KeyError, TypeError):
+            print(f'Walk cache {self.cache_path} is unreadable, walking the whole library')
+            self._cached = {}
+
+    def _save(self, root_stat: os.stat_result, started_ns: int):
+        data = {
+            'version': WALK_CACHE_VERSION,
+            'root': self._path,
+            'dev': root_stat.st_dev,
+            'started_ns': started_ns,
+            'dirs': {os.path.relpath(path, self._path): [mtime_ns, int(found), dirnames]
+                     for path, (mtime_ns, found, dirnames) in self._entries.items()},
+        }
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.cache_path)
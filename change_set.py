@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import urllib.request
+
+from mirror_plan.mirror_plan import LINK, RELINK, REMOVE, RENAME, PlanOperation
+
+CHANGE_SET_VERSION = 1
+NOTIFY_TIMEOUT = 10
+
+
+class ChangeSet:
+    """Mirror paths added, removed and renamed by one run, grouped by top-level mirror directory.
+
+    Downstream servers treat each top-level directory (a series in Komga
+    mode, an author in Audiobookshelf mode) as one library folder, so the
+    groups are exactly the folders that need a rescan. Relinked files count
+    as added, since their contents changed.
+    """
+
+    def __init__(self, mirror_path: str):
+        self.mirror_path = mirror_path
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._folders)
+
+    def record(self, op: PlanOperation):
+        """Record an applied operation; directory creations are not changes on their own."""
+        if op.op in (LINK, RELINK):
+            self._add(op.target, 'added', self._relative(op.target))
+        elif op.op == REMOVE:
+            self._add(op.target, 'removed', self._relative(op.target))
+        elif op.op == RENAME:
+            entry = {'from': self._relative(op.source), 'to': self._relative(op.target)}
+            self._add(op.source, 'renamed', entry)
+            if self._folder(op.target) != self._folder(op.source):
+                self._add(op.target, 'renamed', entry)
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.mirror_path)
+
+    def _folder(self, path: str) -> str:
+        return self._relative(path).split(os.sep, 1)[0]
+
+    def _add(self, path: str, kind: str, entry):
+        with self._lock:
+            folder = self._folders.setdefault(self._folder(path), {'added': [], 'removed': [], 'renamed': []})
+            folder[kind].append(entry)
+
+    def folders(self, mirror_path: str | None = None) -> list[str]:
+        """Changed top-level directories, under ``mirror_path`` if the mirror is mounted elsewhere downstream."""
+        return [os.path.join(mirror_path or self.mirror_path, folder) for folder in sorted(self._folders)]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'version': CHANGE_SET_VERSION,
+                'mirror_path': self.mirror_path,
+                'folders': {folder: self._folders[folder] for folder in sorted(self._folders)},
+            }
+
+    def write(self, changes_path: str):
+        """Write the change set as JSON, replacing any existing file atomically."""
+        tmp_path = f'{changes_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, changes_path)
+
+
+class HttpNotifier:
+    """POSTs the changed folders of a run as JSON to a local HTTP endpoint.
+
+    The body is ``{"folders": [...], "changes": {...}}``: the absolute
+    folder paths as the downstream server sees them, followed by the full
+    change set. A small hook script or proxy behind the endpoint can turn
+    the folder list into the server's own targeted-scan API calls.
+    """
+
+    def __init__(self, url: str, mirror_path: str | None = None, timeout: float = NOTIFY_TIMEOUT,
+                 headers: dict | None = None):
+        """
+        Initialize the HttpNotifier.
+
+        Args:
+            url: Endpoint receiving the POST
+            mirror_path: Where the downstream server sees the mirror, if it
+                is mounted at another path than on this host
+            timeout: Seconds to wait for the endpoint
+            headers: Extra request headers, e.g. an API key
+        """
+        self.url = url
+        self.mirror_path = mirror_path
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def notify(self, changes: ChangeSet):
+        body = json.dumps({'folders': changes.folders(self.mirror_path), 'changes': changes.to_dict()},
+                          ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json', **self.headers})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+NOTIFIERS = {'http': HttpNotifier}
+
+
+def build_notifier(config: dict):
+    """Create the notifier described by a ``notify`` config section.
+
+    ``type`` picks an entry of ``NOTIFIERS`` (default ``'http'``); the other
+    keys are passed to its constructor.
+
+    Raises:
+        ValueError: If ``type`` is not a known notifier
+    """
+    options = dict(config)
+    kind = options.pop('type', 'http')
+    if kind not in NOTIFIERS:
+        raise ValueError(f"Unknown notifier type {kind!r}, expected one of {sorted(NOTIFIERS)}")
+    return NOTIFIERS[kind](**options)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from functools import partial
+
+HASH_CHUNK_SIZE = 1 << 20
+HASH_DIGEST_SIZE = 20
+
+
+def file_digest(path: str) -> str:
+    """Hash a file in fixed-size chunks, so memory does not depend on file size.
+
+    BLAKE2b is in the standard library, faster than SHA-256 on 64-bit CPUs
+    and releases the GIL while hashing, so a thread pool hashes in parallel.
+    """
+    h = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stat_key(stat: os.stat_result) -> tuple[int, int, int, int]:
+    """Cache key for a file's contents: any write changes size or mtime_ns."""
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ContentHashCache:
+    """Content hashes keyed by ``(dev, inode, size, mtime_ns)``, persisted across runs.
+
+    Each line of the cache file is one JSON entry. On save only entries for
+    files seen in this run are kept, so deleted books drop out of the cache.
+    """
+
+    def __init__(self, cache_path: str | None = None, hasher=file_digest):
+        self.cache_path = cache_path
+        self._hasher = hasher
+        self._digests = {}
+        self._live = set()
+        self.hits = 0
+        self.misses = 0
+        if cache_path and os.path.exists(cache_path):
+            self._load()
+
+    def _load(self):
+        with open(self.cache_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key = (entry['dev'], entry['ino'], entry['size'], entry['mtime_ns'])
+                    self._digests[key] = entry['hash']
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def mark_live(self, stat: os.stat_result):
+        """Keep the entry for ``stat`` on save even if it was not looked up."""
+        self._live.add(stat_key(stat))
+
+    def digests(self, files, map_fn=map, errors: list | None = None) -> dict[str, str]:
+        """Return ``{path: digest}`` for ``(path, stat)`` pairs.
+
+        Files missing from the cache are hashed through ``map_fn``, which may
+        be a pool's ``map`` to hash several files at once. With ``errors``, a
+        file that cannot be read is left out of the result and added to
+        ``errors`` as ``(path, error)``.
+        """
+        hasher = self._hasher if errors is None else partial(_hash_isolated, self._hasher)
+        result = {}
+        missing = []
+        for path, stat in files:
+            key = stat_key(stat)
+            self._live.add(key)
+            if key in self._digests:
+                self.hits += 1
+                result[path] = self._digests[key]
+            else:
+                self.misses += 1
+                missing.append((path, key))
+        for (path, key), digest in zip(missing, map_fn(hasher, [path for path, key in missing])):
+            if errors is not None:
+                digest, error = digest
+                if error is not None:
+                    errors.append((path, error))
+                    continue
+            self._digests[key] = digest
+            result[path] = digest
+        return result
+
+    def save(self):
+        if not self.cache_path:
+            return
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key in self._live:
+                if key in self._digests:
+                    dev, ino, size, mtime_ns = key
+                    f.write(json.dumps({'dev': dev, 'ino': ino, 'size': size, 'mtime_ns': mtime_ns,
+                                        'hash': self._digests[key]}, separators=(',', ':')))
+                    f.write('\n')
+        os.replace(tmp_path, self.cache_path)
+
+
+def _hash_isolated(hasher, path: str) -> tuple[str | None, OSError | None]:
+    try:
+        return hasher(path), None
+    except OSError as e:
+        return None, e
+
+
+def _id_key(book_id: str):
+    return (0, int(book_id), '') if book_id.isdigit() else (1, 0, book_id)
+
+
+# Each rule orders copies of a file; the first one is kept.
+KEEP_RULES = {
+    'lowest_id': lambda book_id, stat: _id_key(book_id),
+    'highest_id': lambda book_id, stat: tuple(-v if isinstance(v, int) else v for v in _id_key(book_id)),
+    'newest': lambda book_id, stat: (-stat.st_mtime_ns, _id_key(book_id)),
+    'oldest': lambda book_id, stat: (stat.st_mtime_ns, _id_key(book_id)),
+}
+
+
+def find_duplicates(books, cache: ContentHashCache, keep: str = 'lowest_id', map_fn=map,
+                    errors: list | None = None) -> set[str]:
+    """Return the ids of books whose source file is a byte-identical copy of a kept one.
+
+    Args:
+        books: ``(book_id, source_path, source_stat)`` for each candidate book
+        cache: Content hash cache
+        keep: Name of the ``KEEP_RULES`` entry choosing the copy to keep
+        map_fn: Map function used to hash files that are not cached
+        errors: Optional list collecting ``(path, error)`` for files that
+            could not be hashed; their books are never counted as copies.
+            Without it the error is raised
+
+    Only files sharing a size with another file are hashed; the same inode
+    reached through two books counts as a copy without reading it.
+    """
+    if keep not in KEEP_RULES:
+        raise ValueError(f"Unknown dedup keep rule {keep!r}, expected one of {sorted(KEEP_RULES)}")
+    by_size = defaultdict(list)
+    for book in books:
+        cache.mark_live(book[2])
+        by_size[book[2].st_size].append(book)
+    candidates = [book for same_size in by_size.values() if len(same_size) > 1 for book in same_size]
+    to_hash = {}
+    for book_id, path, stat in candidates:
+        to_hash.setdefault((stat.st_dev, stat.st_ino), (path, stat))
+    digests = cache.digests(to_hash.values(), map_fn, errors)
+
+    by_digest = defaultdict(list)
+    for book_id, path, stat in candidates:
+        digest = digests.get(to_hash[(stat.st_dev, stat.st_ino)][0])
+        if digest is not None:
+            by_digest[digest].append((book_id, path, stat))
+    sort_key = KEEP_RULES[keep]
+    duplicates = set()
+    for copies in by_digest.values():
+        if len(copies) < 2:
+            continue
+        copies.sort(key=lambda book: sort_key(book[0], book[2]))
+        for book_id, path, stat in copies[1:]:
+            print(f'{path} duplicates {copies[0][1]}, skipping')
+            duplicates.add(book_id)
+    return duplicates
@@ -0,0 +1,84 @@
+import itertools
+import re
+import string
+import sys
+from functools import lru_cache
+
+# Output must stay byte-identical to pathvalidate.sanitize_filename with its
+# default arguments (universal platform, 255 byte limit, trailing underscore
+# for reserved names); otherwise existing mirrors would be reshuffled.
+# test/test_filename_sanitizer.py checks this against pathvalidate directly.
+
+MAX_FILENAME_BYTES = 255
+SANITIZE_CACHE_SIZE = 65536
+
+_UNPRINTABLE_ASCII = ''.join(chr(c) for c in range(128) if chr(c) not in string.printable)
+_INVALID_CHARS = _UNPRINTABLE_ASCII + '/' + ':*?"<>|\t\n\r\x0b\x0c' + '\\'
+_DELETE_INVALID = str.maketrans('', '', _INVALID_CHARS)
+
+_RESERVED_NAMES = frozenset(
+    ('CON', 'PRN', 'AUX', 'CLOCK$', 'NUL', ':')
+    + tuple(f'{name}{num}' for name, num in itertools.product(('COM', 'LPT'), range(10)))
+    + tuple(f'{name}{ssd}' for name, ssd in itertools.product(('COM', 'LPT'), ('¹', '²', '³')))
+)
+_RE_ROOT_NAME = re.compile(r'([^\.]+)')
+_FS_ENCODING = sys.getfilesystemencoding()
+
+
+def _root_name(name: str) -> str:
+    if name in ('.', '..') or name.startswith('...'):
+        return name
+    match = _RE_ROOT_NAME.match(name)
+    return match.group(1) if match else ''
+
+
+def _sanitize(filename: str) -> str:
+    sanitized = filename.translate(_DELETE_INVALID)
+    encoded = sanitized.encode(_FS_ENCODING)
+    if len(encoded) > MAX_FILENAME_BYTES:
+        sanitized = encoded[:MAX_FILENAME_BYTES].decode(_FS_ENCODING, 'ignore')
+
+    if not sanitized.strip():
+        return ''
+
+    root_name = _root_name(sanitized)
+    if root_name.upper() in _RESERVED_NAMES or sanitized.upper() in _RESERVED_NAMES:
+        return sanitized.replace(root_name, f'{root_name}_')
+
+    if sanitized in ('.', '..'):
+        return sanitized
+    if sanitized[-1] in (' ', '.') or sanitized[0] == ' ':
+        sanitized = sanitized.strip(' ')
+        if sanitized not in ('.', '..'):
+            sanitized = sanitized.rstrip(' .')
+    return sanitized
+
+
+def sanitize_filename_uncached(filename: str | None) -> str:
+    """
+    Make a valid filename from a string.
+
+    A drop-in replacement for ``pathvalidate.sanitize_filename(filename)``
+    built on a translate table. Use it directly for names that are unique per
+    book, such as titles, so they do not push shared names out of the memo.
+
+    Args:
+        filename: Filename to sanitize
+
+    Returns:
+        The sanitized filename, or an empty string if nothing valid is left
+    """
+    if filename is None:
+        return ''
+    if not isinstance(filename, str):
+        raise TypeError(f'text must be a string: actual={type(filename)}')
+    if not filename.strip():
+        return ''
+    return _sanitize(filename)
+
+
+@lru_cache(maxsize=SANITIZE_CACHE_SIZE)
+def sanitize_filename(filename: str | None) -> str:
+    """Memoized ``sanitize_filename_uncached`` for author and series names,
+    which are sanitized again for every book they appear on."""
+    return sanitize_filename_uncached(filename)
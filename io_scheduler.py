@@ -0,0 +1,173 @@
+import ctypes
+import os
+import platform
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Linux ioprio_set(2) constants; there is no libc wrapper for it.
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_SET_SYSCALL = {'x86_64': 251, 'aarch64': 30, 'armv7l': 314, 'i686': 289}
+
+
+class AdaptiveConcurrencyController:
+    """Adjusts how many I/O operations may run at once, AIMD-style.
+
+    Operation latencies are collected in windows. When a window's median
+    latency exceeds the target, or its throughput exceeds the ops-per-second
+    ceiling, the limit is cut multiplicatively; otherwise it grows by one.
+    The ceiling is also enforced directly by pacing operation starts, so it
+    holds even at a concurrency of one.
+    """
+
+    def __init__(self, max_concurrency: int = 16, min_concurrency: int = 1,
+                 target_latency: float | None = None, max_ops_per_second: float | None = None,
+                 initial_concurrency: int | None = None, sample_window: int = 16,
+                 decrease_factor: float = 0.5, clock=time.monotonic):
+        """
+        Initialize the AdaptiveConcurrencyController.
+
+        Args:
+            max_concurrency: Upper bound for the concurrency limit
+            min_concurrency: Lower bound for the concurrency limit
+            target_latency: Per-operation latency to hold, in seconds
+            max_ops_per_second: Throughput ceiling across all workers
+            initial_concurrency: Starting limit; defaults to min_concurrency
+            sample_window: Number of completed operations per adjustment
+            decrease_factor: Multiplier applied to the limit when overloaded
+            clock: Monotonic clock, replaceable in tests
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.target_latency = target_latency
+        self.max_ops_per_second = max_ops_per_second
+        self.sample_window = max(1, sample_window)
+        self.decrease_factor = decrease_factor
+        self._clock = clock
+        self._limit = min(self.max_concurrency, max(self.min_concurrency, initial_concurrency or self.min_concurrency))
+        self._in_flight = 0
+        self._samples = []
+        self._window_start = clock()
+        self._next_start = 0.0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'AdaptiveConcurrencyController':
+        target_latency_ms = config.get('target_latency_ms')
+        return cls(
+            max_concurrency=config.get('max_workers', 16),
+            min_concurrency=config.get('min_workers', 1),
+            target_latency=target_latency_ms / 1000 if target_latency_ms else None,
+            max_ops_per_second=config.get('max_ops_per_second'),
+            initial_concurrency=config.get('initial_workers'),
+        )
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> float:
+        """Block until an operation may start; return its start time."""
+        with self._condition:
+            while True:
+                if self._in_flight < self._limit:
+                    now = self._clock()
+                    if not self.max_ops_per_second or now >= self._next_start:
+                        break
+                    self._condition.wait(self._next_start - now)
+                else:
+                    self._condition.wait()
+            self._in_flight += 1
+            if self.max_ops_per_second:
+                self._next_start = max(now, self._next_start) + 1 / self.max_ops_per_second
+            return now
+
+    def release(self, started: float):
+        with self._condition:
+            self._in_flight -= 1
+            self.record(self._clock() - started)
+            self._condition.notify_all()
+
+    def run(self, fn, *args, **kwargs):
+        started = self.acquire()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.release(started)
+
+    def record(self, latency: float):
+        """Add a latency sample, adjusting the limit when a window is complete."""
+        self._samples.append(latency)
+        if len(self._samples) >= self.sample_window:
+            self._adjust()
+
+    def _adjust(self):
+        now = self._clock()
+        elapsed = now - self._window_start
+        window_latency = statistics.median(self._samples)
+        ops_per_second = len(self._samples) / elapsed if elapsed > 0 else None
+
+        overloaded = self.target_latency is not None and window_latency > self.target_latency
+        if self.max_ops_per_second and ops_per_second and ops_per_second > self.max_ops_per_second:
+            overloaded = True
+        if overloaded:
+            self._limit = max(self.min_concurrency, int(self._limit * self.decrease_factor))
+        else:
+            self._limit = min(self.max_concurrency, self._limit + 1)
+
+        self._samples = []
+        self._window_start = now
+
+
+class AdaptiveExecutor:
+    """Runs a function over items on a thread pool gated by a controller."""
+
+    def __init__(self, controller: AdaptiveConcurrencyController):
+        self.controller = controller
+
+    def map(self, fn, items):
+        """Like the builtin ``map``: results are yielded in input order.
+
+        Only a bounded number of items are submitted ahead of the consumer,
+        so arbitrarily long iterables can be streamed through.
+        """
+        max_pending = self.controller.max_concurrency * 2
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.controller.max_concurrency) as executor:
+            for item in items:
+                pending.append(executor.submit(self.controller.run, fn, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def lower_io_priority(niceness: int = 10) -> bool:
+    """Lower this process's CPU and, on Linux, I/O scheduling priority.
+
+    Returns:
+        True if the I/O priority was set to the idle class, False if only
+        the niceness could be changed.
+    """
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
+
+    syscall = _IOPRIO_SET_SYSCALL.get(platform.machine())
+    if platform.system() != 'Linux' or syscall is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioprio = _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT
+        return libc.syscall(syscall, _IOPRIO_WHO_PROCESS, 0, ioprio) == 0
+    except (OSError, AttributeError):
+        return False
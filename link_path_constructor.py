@@ -1,6 +1,6 @@
 import os
 from opf_parser.opf_parser import OPFParser
-from pathvalidate import sanitize_filename
+from filename_sanitizer import sanitize_filename, sanitize_filename_uncached
 
 
 class LinkPathConstructor:
@@ -45,30 +45,32 @@ class LinkPathConstructor:
             if series and (series_index or series_index == 0):
                 # author/series_name/series_number - book_title/series_number - book_title
                 series_dir = sanitize_filename(series)
-                book_dir = sanitize_filename(f'{series_index} - {title}')
+                book_dir = sanitize_filename_uncached(f'{series_index} - {title}')
                 parent_link = os.path.join(self.mirror_path, sanitize_filename(author), series_dir, book_dir)
             else:
                 # author/title/title (no series)
-                parent_link = os.path.join(self.mirror_path, sanitize_filename(author), sanitize_filename(title))
+                parent_link = os.path.join(self.mirror_path, sanitize_filename(author), sanitize_filename_uncached(title))
         else:  # komga mode (default)
             # Komga organization: series/title or title/title
             directory_name = series if series else title
             if directory_name is None:
                 directory_name = "Unknown"
-            parent_link = os.path.join(self.mirror_path, sanitize_filename(directory_name))
+            # Series names repeat across books and are worth memoizing; titles are not
+            directory = sanitize_filename(directory_name) if series else sanitize_filename_uncached(directory_name)
+            parent_link = os.path.join(self.mirror_path, directory)
         
         # Construct the filename
         if self.naming_mode == "audiobookshelf":
             if series and (series_index or series_index == 0):
                 # For audiobookshelf with series, filename is just the series_number - book_title
-                link_path = os.path.join(parent_link, sanitize_filename(f'{series_index} - {title}{self.dest_format}'))
+                link_path = os.path.join(parent_link, sanitize_filename_uncached(f'{series_index} - {title}{self.dest_format}'))
             else:
                 # For audiobookshelf without series, filename is just the title
-                link_path = os.path.join(parent_link, sanitize_filename(f'{title}{self.dest_format}'))
+                link_path = os.path.join(parent_link, sanitize_filename_uncached(f'{title}{self.dest_format}'))
         else:  # komga mode
             if series and (series_index or series_index == 0):
-                link_path = os.path.join(parent_link, sanitize_filename(f'{series_index} - {title}{self.dest_format}'))
+                link_path = os.path.join(parent_link, sanitize_filename_uncached(f'{series_index} - {title}{self.dest_format}'))
             else:
-                link_path = os.path.join(parent_link, sanitize_filename(f'{title}{self.dest_format}'))
+                link_path = os.path.join(parent_link, sanitize_filename_uncached(f'{title}{self.dest_format}'))
         
         return link_path 
\ No newline at end of file
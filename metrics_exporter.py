@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from mirror_plan.mirror_plan import LINK, RELINK, RENAME, PlanOperation
+
+METRIC_PREFIX = 'calibre_mirror'
+LAST_SUCCESS = f'{METRIC_PREFIX}_last_success_timestamp_seconds'
+
+# name -> (type, help)
+METRICS = {
+    'stage_duration_seconds': ('gauge', 'Wall-clock time spent in each stage of the last run.'),
+    'books_scanned': ('gauge', 'OPF files found by the last run.'),
+    'books_matched': ('gauge', 'Books selected by the config group in the last run.'),
+    'books_linked': ('gauge', 'Links and relinks created by the last run.'),
+    'renames': ('gauge', 'Mirror entries renamed after a metadata change in the last run.'),
+    'collisions': ('gauge', 'Books whose link path was already taken by another book.'),
+    'duplicates': ('gauge', 'Selected books skipped as byte-identical copies of another book.'),
+    'errors': ('gauge', 'Operations that failed or were skipped as stale in the last run.'),
+    'cache_hit_ratio': ('gauge', 'Hit ratio of in-process caches during the last run.'),
+    'last_run_timestamp_seconds': ('gauge', 'Unix time the last run of the group ended.'),
+    'last_success_timestamp_seconds': ('gauge', 'Unix time the group last finished without errors.'),
+}
+
+_SAMPLE_LINE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _format_labels(labels: dict) -> str:
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+class RunMetrics:
+    """Collects per config group run statistics for the node_exporter textfile collector.
+
+    Every sample is labelled with its group. One instance is shared by all
+    groups of a run, each of which may write its own textfile or share one
+    with others. Safe to update from the applier's worker threads.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._samples = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, labels: dict):
+        return name, tuple(labels.items())
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._samples[self._key(name, labels)] = value
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def get(self, name: str, **labels) -> float | None:
+        return self._samples.get(self._key(name, labels))
+
+    @contextmanager
+    def stage(self, group: str, stage: str):
+        """Time a block, adding to the group's duration for ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc('stage_duration_seconds', time.perf_counter() - start, group=group, stage=stage)
+
+    def record_applied(self, group: str, op: PlanOperation):
+        if op.op in (LINK, RELINK):
+            self.inc('books_linked', group=group)
+        elif op.op == RENAME:
+            self.inc('renames', group=group)
+
+    def record_cache(self, group: str, cache: str, hits: int, misses: int):
+        total = hits + misses
+        self.set('cache_hit_ratio', hits / total if total else 0.0, group=group, cache=cache)
+
+    def finish_group(self, group: str, success: bool):
+        now = self._clock()
+        self.set('last_run_timestamp_seconds', now, group=group)
+        if success:
+            self.set('last_success_timestamp_seconds', now, group=group)
+
+    def render(self, previous: str = '', groups=None) -> str:
+        """Render the exposition text, of only the samples of ``groups`` if given.
+
+        Last-success timestamps of groups that have not succeeded in this run
+        are carried over from ``previous`` so a failing run does not hide how
+        long the mirror has been stale.
+        """
+        with self._lock:
+            samples = {key: value for key, value in self._samples.items()
+                       if groups is None or dict(key[1]).get('group') in groups}
+        for line in previous.splitlines():
+            match = _SAMPLE_LINE.match(line)
+            if not match or match.group(1) != LAST_SUCCESS:
+                continue
+            labels = {k: _unescape(v) for k, v in re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2))}
+            if groups is not None and labels.get('group') not in groups:
+                continue
+            key = self._key('last_success_timestamp_seconds', labels)
+            samples.setdefault(key, float(match.group(3)))
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            metric_samples = sorted((labels, value) for (n, labels), value in samples.items() if n == name)
+            if not metric_samples:
+                continue
+            full_name = f'{METRIC_PREFIX}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            for labels, value in metric_samples:
+                rendered = value if isinstance(value, int) else repr(float(value))
+                lines.append(f'{full_name}{{{_format_labels(dict(labels))}}} {rendered}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str, group: str | None = None):
+        """Write the metrics atomically via a temp file and rename.
+
+        With ``group``, only the samples of the groups that have written to
+        ``path`` so far are written. node_exporter rejects a series that
+        appears in two textfiles, so groups with files of their own must not
+        each write every group's samples.
+        """
+        groups = None
+        if group is not None:
+            with self._lock:
+                self._paths[group] = path
+                groups = {g for g, p in self._paths.items() if p == path}
+        previous = ''
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                previous = f.read()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render(previous, groups))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
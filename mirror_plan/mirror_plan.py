@@ -0,0 +1,139 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+
+
+MKDIR = 'mkdir'
+LINK = 'link'
+RELINK = 'relink'
+REMOVE = 'remove'
+RENAME = 'rename'
+
+OPERATION_KINDS = (MKDIR, LINK, RELINK, REMOVE, RENAME)
+
+
+@dataclass
+class PlanOperation:
+    """A single filesystem operation in a mirror plan.
+
+    ``ino`` and ``mtime_ns`` are the stat signature captured while planning:
+    the source file for links and relinks, the target file for removals, and
+    the existing file or directory for renames.
+    """
+    op: str
+    target: str
+    source: str | None = None
+    ino: int | None = None
+    mtime_ns: int | None = None
+
+    def to_json(self) -> str:
+        return json.dumps({k: v for k, v in asdict(self).items() if v is not None},
+                          ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, line: str) -> 'PlanOperation':
+        data = json.loads(line)
+        if data.get('op') not in OPERATION_KINDS:
+            raise ValueError(f"Unknown plan operation: {data.get('op')!r}")
+        return cls(**data)
+
+
+class MirrorPlan:
+    """An ordered list of operations that brings a mirror up to date.
+
+    Plans are produced by the runner and can be written to a JSON lines file,
+    reviewed, and executed later by ``PlanApplier`` without reparsing any OPFs.
+    """
+
+    def __init__(self, operations: list[PlanOperation] | None = None):
+        self._operations = list(operations) if operations else []
+        self._dirs = {op.target for op in self._operations if op.op == MKDIR}
+
+    @property
+    def operations(self) -> list[PlanOperation]:
+        return self._operations
+
+    def __iter__(self):
+        return iter(self._operations)
+
+    def __len__(self):
+        return len(self._operations)
+
+    def add_mkdir(self, target: str):
+        if target not in self._dirs:
+            self._dirs.add(target)
+            self._operations.append(PlanOperation(MKDIR, target))
+
+    def add_link(self, source: str, target: str, source_stat: os.stat_result, relink: bool = False):
+        self.add_mkdir(os.path.dirname(target))
+        self._operations.append(PlanOperation(RELINK if relink else LINK, target, source,
+                                              source_stat.st_ino, source_stat.st_mtime_ns))
+
+    def add_remove(self, target: str, target_stat: os.stat_result):
+        self._operations.append(PlanOperation(REMOVE, target, None,
+                                              target_stat.st_ino, target_stat.st_mtime_ns))
+
+    def add_rename(self, source: str, target: str, source_stat: os.stat_result):
+        """Move the mirror entry at ``source`` to ``target``; the applier creates the parent."""
+        self._operations.append(PlanOperation(RENAME, target, source,
+                                              source_stat.st_ino, source_stat.st_mtime_ns))
+
+    def extend(self, other: 'MirrorPlan'):
+        for op in other:
+            if op.op == MKDIR:
+                self.add_mkdir(op.target)
+            else:
+                self._operations.append(op)
+
+    def counts(self) -> dict[str, int]:
+        counts = dict.fromkeys(OPERATION_KINDS, 0)
+        for op in self._operations:
+            counts[op.op] += 1
+        return counts
+
+    def write(self, plan_path: str):
+        """Write the plan as JSON lines, replacing any existing file atomically."""
+        with PlanWriter(plan_path) as writer:
+            writer.write(self)
+
+    @classmethod
+    def read(cls, plan_path: str) -> 'MirrorPlan':
+        operations = []
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    operations.append(PlanOperation.from_json(line))
+                except (ValueError, TypeError) as e:
+                    raise ValueError(f"Invalid plan file '{plan_path}' at line {line_no}: {e}") from e
+        return cls(operations)
+
+
+class PlanWriter:
+    """Writes plan operations incrementally, for plans too large to hold in memory.
+
+    Operations go to a temporary file that replaces ``plan_path`` only when
+    the writer is closed without an exception.
+    """
+
+    def __init__(self, plan_path: str):
+        self.plan_path = plan_path
+        self._tmp_path = f'{plan_path}.tmp'
+        self._file = None
+
+    def __enter__(self) -> 'PlanWriter':
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.plan_path)
+        else:
+            os.unlink(self._tmp_path)
+
+    def write(self, operations):
+        for op in operations:
+            self._file.write(op.to_json())
+            self._file.write('\n')
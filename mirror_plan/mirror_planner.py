@@ -0,0 +1,254 @@
+import os
+
+from calibre_library.calibre_library import CalibreLibrary
+from link_path_constructor import LinkPathConstructor
+from mirror_plan.mirror_plan import MKDIR, RENAME, MirrorPlan, PlanOperation
+from mirror_plan.mirror_state import MirrorState
+from opf_parser.opf_parser import OPFParser
+
+
+def _raise(error: OSError):
+    raise error
+
+
+class MirrorPlanner:
+    """Turns parsed books into mirror plan operations for one config group."""
+
+    def __init__(self, link_constructor: LinkPathConstructor, source_format: str, track_targets: bool = True,
+                 state: MirrorState | None = None, check_owners: bool = False):
+        """
+        Initialize the MirrorPlanner.
+
+        Args:
+            link_constructor: Builds the link path for each book
+            source_format: Extension of the library file to link
+            track_targets: Remember planned link paths for collision detection
+                and pruning; streaming runs turn this off to keep memory flat
+            state: Mirror state to update with each planned book; a book's
+                previous link is removed when its path changes
+            check_owners: Treat paths the state assigns to other books as
+                collisions, for runs that plan only some of the books
+        """
+        self.link_constructor = link_constructor
+        self.source_format = source_format
+        self.track_targets = track_targets
+        self.state = state
+        self.check_owners = check_owners and state is not None
+        self._planned_targets = {}
+        self._planned_removals = set()
+        self.collisions = 0
+
+    def find_source_file(self, book_dir: str, files=None) -> str | None:
+        """Return the last file in ``book_dir`` with the source format, if any.
+
+        ``files`` is the directory listing if the caller already has it.
+        """
+        matched_format = self.match_source_file(os.listdir(book_dir) if files is None else files)
+        if matched_format is not None:
+            print(f'Found {matched_format}')
+        return matched_format
+
+    def match_source_file(self, files) -> str | None:
+        """Return the last of ``files`` with the source format, if any."""
+        matched_format = None
+        for book in files:
+            if book.endswith(self.source_format):
+                matched_format = book
+        return matched_format
+
+    def plan_book(self, opf_path: str, parser: OPFParser, plan: MirrorPlan, files=None) -> str | None:
+        """Add the operations needed to mirror one book.
+
+        Returns:
+            The link path for the book, or None if it has no usable source
+            file, not enough metadata to name it, or its path is already
+            taken by another book in this run.
+        """
+        book_id = CalibreLibrary.book_id(opf_path)
+        link_path = self._plan_link(book_id, opf_path, parser, plan, files)
+        if self.state is not None:
+            self._update_state(book_id, link_path, plan)
+        return link_path
+
+    def plan_departed(self, book_id: str, plan: MirrorPlan):
+        """Remove the link of a book that is no longer mirrored, such as a
+        deleted or deselected one, according to the mirror state."""
+        if self.state is not None:
+            self._update_state(book_id, None, plan)
+
+    def _update_state(self, book_id: str, link_path: str | None, plan: MirrorPlan):
+        previous = self.state.get(book_id)
+        if previous is not None and previous != link_path and self.state.owner(previous) == book_id:
+            self._plan_remove(previous, plan)
+        self.state.set(book_id, link_path)
+
+    def _plan_remove(self, path: str, plan: MirrorPlan):
+        # A path another book is planned to link to in this run is left to that book.
+        if path in self._planned_targets or path in self._planned_removals:
+            return
+        try:
+            target_stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._planned_removals.add(path)
+        plan.add_remove(path, target_stat)
+
+    def _plan_link(self, book_id: str, opf_path: str, parser: OPFParser, plan: MirrorPlan,
+                   files=None) -> str | None:
+        book_dir = os.path.dirname(opf_path)
+        matched_format = self.find_source_file(book_dir, files)
+        if matched_format is None:
+            return None
+        link_path = self.link_constructor.construct_link_path(parser, matched_format)
+        if link_path is None:
+            return None
+
+        source_path = os.path.join(book_dir, matched_format)
+        if self._planned_targets.get(link_path, source_path) != source_path:
+            print(f'{link_path} is already planned for {self._planned_targets[link_path]}, skipping {source_path}')
+            self.collisions += 1
+            return None
+        owner = self.state.owner(link_path) if self.check_owners else None
+        if owner not in (None, book_id):
+            print(f'{link_path} belongs to book {owner}, skipping {source_path}')
+            self.collisions += 1
+            return None
+        source_stat = os.stat(source_path)
+        try:
+            target_stat = os.stat(link_path)
+        except FileNotFoundError:
+            target_stat = None
+        if target_stat is None:
+            if not self._plan_rename(book_id, link_path, source_stat, plan):
+                plan.add_link(source_path, link_path, source_stat)
+        elif (target_stat.st_dev, target_stat.st_ino) != (source_stat.st_dev, source_stat.st_ino):
+            if not self._is_stale_link(book_id, link_path, target_stat):
+                print(f'{link_path} already links another file, skipping {source_path}')
+                self.collisions += 1
+                return None
+            plan.add_link(source_path, link_path, source_stat, relink=True)
+        if self.track_targets:
+            self._planned_targets[link_path] = source_path
+        return link_path
+
+    def _is_stale_link(self, book_id: str, link_path: str, target_stat: os.stat_result) -> bool:
+        """Whether the different file at ``link_path`` is this book's own outdated link.
+
+        A file another book still links, made by this or an earlier run, is
+        left in place, so two books sharing a path do not take turns with it
+        as the scan order changes. It is only replaced if the state says it
+        is this book's, or if nothing in the library links it any more, as
+        when Calibre replaced the format file.
+        """
+        if self.state is not None and self.state.owner(link_path) is not None:
+            return self.state.owner(link_path) == book_id
+        return target_stat.st_nlink == 1
+
+    def _plan_rename(self, book_id: str, link_path: str, source_stat: os.stat_result, plan: MirrorPlan) -> bool:
+        """Move the book's previous link to ``link_path`` if it still links the source file.
+
+        Downstream servers see a renamed file as the same book and keep its
+        read progress, which a new link and a removal would lose.
+        """
+        if self.state is None:
+            return False
+        previous = self.state.get(book_id)
+        if previous in (None, link_path) or self.state.owner(previous) != book_id:
+            return False
+        if previous in self._planned_targets or previous in self._planned_removals:
+            return False
+        try:
+            previous_stat = os.stat(previous)
+        except FileNotFoundError:
+            return False
+        if (previous_stat.st_dev, previous_stat.st_ino) != (source_stat.st_dev, source_stat.st_ino):
+            return False
+        # Keeps the state update from also planning a removal of the old path.
+        self._planned_removals.add(previous)
+        plan.add_rename(previous, link_path, previous_stat)
+        return True
+
+    def plan_directory_renames(self, plan: MirrorPlan):
+        """Replace renames that move a whole mirror directory with one rename of the directory.
+
+        Renaming a series moves every book in its directory to the same names
+        under a new directory. When nothing else is in the old directory and
+        the new one does not exist yet, the directory itself is renamed, so
+        the series keeps its identity downstream as well. The directory
+        renames go first in the plan, ahead of any operation that could
+        create the new directory.
+        """
+        renames = {op.source: op.target for op in plan if op.op == RENAME}
+        candidates = {}
+        mirror_prefix = os.path.join(self.link_constructor.mirror_path, '')
+        for old, new in renames.items():
+            while os.path.basename(old) == os.path.basename(new):
+                old, new = os.path.dirname(old), os.path.dirname(new)
+                if old == new or not (old.startswith(mirror_prefix) and new.startswith(mirror_prefix)):
+                    break
+                # A directory whose files scatter to different places is not a candidate.
+                candidates[old] = new if candidates.get(old, new) == new else None
+
+        moved_dirs = {}
+        moved_files = set()
+        for old in sorted(candidates, key=lambda path: path.count(os.sep)):
+            new = candidates[old]
+            if new is None or any(old.startswith(os.path.join(d, '')) for d in moved_dirs):
+                continue
+            files = self._directory_files(old, new, renames)
+            if files is not None:
+                moved_dirs[old] = new
+                moved_files.update(files)
+        if not moved_dirs:
+            return
+
+        def created_by_move(path):
+            return any(path == new or path.startswith(os.path.join(new, '')) for new in moved_dirs.values())
+
+        kept = [op for op in plan
+                if not (op.op == RENAME and op.source in moved_files)
+                and not (op.op == MKDIR and created_by_move(op.target))]
+        dir_renames = []
+        for old, new in moved_dirs.items():
+            old_stat = os.stat(old)
+            print(f'Planning directory rename of {old} to {new}')
+            dir_renames.append(PlanOperation(RENAME, new, old, old_stat.st_ino, old_stat.st_mtime_ns))
+        plan.operations[:] = dir_renames + kept
+
+    @staticmethod
+    def _directory_files(old: str, new: str, renames: dict) -> list[str] | None:
+        """Files under ``old``, if every one is renamed to the same relative path under ``new``."""
+        if os.path.lexists(new) or new.startswith(os.path.join(old, '')) or old.startswith(os.path.join(new, '')):
+            return None
+        files = []
+        try:
+            for dirpath, dirnames, filenames in os.walk(old, onerror=_raise):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if renames.get(path) != os.path.join(new, os.path.relpath(path, old)):
+                        return None
+                    files.append(path)
+        except OSError:
+            return None
+        return files or None
+
+    def mark_planned(self, link_path: str | None):
+        """Keep ``link_path`` from being pruned without planning its book again."""
+        if link_path is not None:
+            self._planned_targets.setdefault(link_path, None)
+
+    def plan_prune(self, plan: MirrorPlan):
+        """Add removals for mirrored files that no planned book links to any more.
+
+        Only files with the destination format are considered, so anything a
+        downstream server keeps next to the books is left alone.
+        """
+        mirror_path = self.link_constructor.mirror_path
+        dest_format = self.link_constructor.dest_format
+        for dirpath, dirnames, filenames in os.walk(mirror_path):
+            for filename in filenames:
+                if not filename.endswith(dest_format):
+                    continue
+                path = os.path.join(dirpath, filename)
+                if path not in self._planned_targets:
+                    self._plan_remove(path, plan)
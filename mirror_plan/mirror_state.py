@@ -0,0 +1,77 @@
+import json
+import os
+
+MIRROR_STATE_VERSION = 1
+
+
+class MirrorState:
+    """Where each book is linked in a mirror, keyed by Calibre book id.
+
+    The runner updates the state while planning and saves it once the plan
+    has been applied, so it describes the mirror as of the last applied run.
+    It lets a book's previous link be found and cleaned up without walking
+    the mirror.
+    """
+
+    def __init__(self, state_path: str | None = None):
+        self.state_path = state_path
+        self._links = {}
+        self._owners = {}
+        if state_path and os.path.exists(state_path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MIRROR_STATE_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')!r}")
+            links = data['links']
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid mirror state file '{self.state_path}': {e}") from e
+        for book_id, link_path in links.items():
+            self.set(book_id, link_path)
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, book_id):
+        return book_id in self._links
+
+    def book_ids(self) -> list[str]:
+        return list(self._links)
+
+    def get(self, book_id: str) -> str | None:
+        return self._links.get(book_id)
+
+    def owner(self, link_path: str) -> str | None:
+        """Return the id of the book linked at ``link_path``, if any."""
+        return self._owners.get(link_path)
+
+    def set(self, book_id: str, link_path: str | None):
+        """Record the book's current link path; None forgets the book."""
+        previous = self._links.pop(book_id, None)
+        if previous is not None and self._owners.get(previous) == book_id:
+            del self._owners[previous]
+        if link_path is not None:
+            self._links[book_id] = link_path
+            self._owners[link_path] = book_id
+
+    def discard(self, book_id: str):
+        self.set(book_id, None)
+
+    def save(self, state_path: str | None = None):
+        """Write the state atomically via a temp file and rename.
+
+        Args:
+            state_path: Where to write it instead of ``self.state_path``,
+                e.g. next to a plan that has yet to be applied
+        """
+        state_path = state_path or self.state_path
+        if not state_path:
+            return
+        tmp_path = f'{state_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MIRROR_STATE_VERSION, 'links': self._links}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, state_path)
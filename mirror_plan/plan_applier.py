@@ -0,0 +1,219 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from mirror_plan.mirror_plan import LINK, MKDIR, RELINK, RENAME, MirrorPlan, PlanOperation
+from retry_queue import classify
+
+
+class PlanApplier:
+    """Executes a ``MirrorPlan`` against the filesystem.
+
+    Every link, relink and removal is revalidated against the stat signature
+    recorded at planning time, so a plan that has gone stale (a source was
+    replaced or a target changed underneath it) is skipped rather than applied.
+    """
+
+    def __init__(self, dry_run: bool = False, executor=None, on_applied=None, workers: int = 1, retries=None):
+        """
+        Initialize the PlanApplier.
+
+        Args:
+            dry_run: Print the operations instead of executing them
+            executor: Optional AdaptiveExecutor whose controller gates every
+                operation; its worker limit replaces ``workers``
+            on_applied: Optional callback receiving each operation once it
+                has been carried out
+            workers: Number of target directories worked on at once
+            retries: Optional RetryQueue; operations failing with a transient
+                error are set aside and retried by ``finish``
+        """
+        self.dry_run = dry_run
+        self.executor = executor
+        self.on_applied = on_applied
+        self.workers = executor.controller.max_concurrency if executor is not None else max(1, workers)
+        self.retries = retries
+        self.summary = dict.fromkeys(('applied', 'skipped', 'stale', 'failed'), 0)
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def apply(self, plan: MirrorPlan) -> dict[str, int]:
+        """Apply ``plan`` and return the running summary.
+
+        Renames run first, one at a time and in plan order, since a
+        directory rename must not race with anything under it. Then all
+        directories are created, and the remaining operations are grouped by
+        target directory. Each group is applied in plan order, so a removal
+        and a link of the same path never happen out of order, while with
+        more than one worker different directories proceed concurrently.
+
+        An operation that fails is recorded in ``failures`` and the rest of
+        the plan still runs. With a retry queue, a transient failure sets
+        aside the rest of its directory's group, along with the groups of a
+        directory that could not be created, until ``finish``.
+        """
+        if self.dry_run:
+            for op in plan:
+                self.apply_operation(op)
+            return self.summary
+
+        renames = []
+        mkdirs = []
+        batches = {}
+        for op in plan:
+            if op.op == RENAME:
+                renames.append(op)
+            elif op.op == MKDIR:
+                mkdirs.append(op)
+            else:
+                batches.setdefault(os.path.dirname(op.target), []).append(op)
+        self._apply_batch(renames)
+        with ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else nullcontext() as pool:
+            map_fn = pool.map if pool is not None else map
+            # makedirs tolerates another worker creating a shared parent first.
+            deferred_dirs = {deferred[0].target: deferred
+                             for deferred in map_fn(self._apply_batch, [[op] for op in mkdirs]) if deferred}
+            ready = []
+            for directory, ops in batches.items():
+                if directory in deferred_dirs:
+                    deferred_dirs[directory].extend(ops)
+                else:
+                    ready.append(ops)
+            for _ in map_fn(self._apply_batch, ready):
+                pass
+        return self.summary
+
+    def finish(self):
+        """Retry set-aside operations until they succeed or run out of attempts.
+
+        Called once the whole run has been applied, so waiting for a flaky
+        file never holds up the healthy ones.
+        """
+        if self.retries is None:
+            return
+        for ops, attempts in self.retries.drain():
+            self._apply_batch(ops, attempts)
+
+    def _apply_batch(self, ops: list[PlanOperation], attempts: int = 0) -> list[PlanOperation] | None:
+        """Apply ``ops`` in order; return the operations set aside for a retry, if any."""
+        for i, op in enumerate(ops):
+            try:
+                if self.executor is not None:
+                    self.executor.controller.run(self.apply_operation, op)
+                else:
+                    self.apply_operation(op)
+            except OSError as e:
+                rest = ops[i:]
+                # Attempts count failures of the operation at the head of the batch.
+                if self.retries is not None and self.retries.defer(rest, e, (attempts if i == 0 else 0) + 1):
+                    print(f'{self.describe(op)} failed: {e}, retrying later')
+                    return rest
+                print(f'{self.describe(op)} failed: {e}')
+                with self._lock:
+                    self.summary['failed'] += 1
+                    self.failures.append((op, e))
+        return None
+
+    def apply_operation(self, op: PlanOperation):
+        if self.dry_run:
+            print(f'<DRYRUN>{self.describe(op)}')
+            self._count('applied')
+            return
+
+        if op.op == MKDIR:
+            os.makedirs(op.target, exist_ok=True)
+            applied = True
+        elif op.op in (LINK, RELINK):
+            applied = self._apply_link(op)
+        elif op.op == RENAME:
+            applied = self._apply_rename(op)
+        else:
+            applied = self._apply_remove(op)
+        if applied:
+            self._count('applied')
+            if self.on_applied is not None:
+                self.on_applied(op)
+
+    def report(self):
+        """Print the operations that failed, once the whole plan has been applied."""
+        if not self.failures:
+            return
+        print(f'{len(self.failures)} operations failed {classify(self.failures)}:')
+        for op, error in self.failures:
+            print(f'  {self.describe(op)}: {error}')
+
+    def _count(self, key: str):
+        with self._lock:
+            self.summary[key] += 1
+
+    @staticmethod
+    def describe(op: PlanOperation) -> str:
+        if op.op == MKDIR:
+            return f'Creating {op.target}'
+        if op.op == LINK:
+            return f'Linking {op.source} to {op.target}'
+        if op.op == RELINK:
+            return f'Relinking {op.source} to {op.target}'
+        if op.op == RENAME:
+            return f'Renaming {op.source} to {op.target}'
+        return f'Removing {op.target}'
+
+    @staticmethod
+    def matches_signature(path: str, op: PlanOperation) -> bool:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino == op.ino and st.st_mtime_ns == op.mtime_ns
+
+    def _apply_link(self, op: PlanOperation) -> bool:
+        if not self.matches_signature(op.source, op):
+            print(f'{op.source} changed since planning, skipping')
+            self._count('stale')
+            return False
+
+        if op.op == LINK:
+            # Linking straight away saves an existence check per book; on a
+            # network mount each one is a round trip.
+            try:
+                os.link(op.source, op.target)
+            except FileExistsError:
+                print(f'{op.target} already exists, skipping')
+                self._count('skipped')
+                return False
+            print(self.describe(op))
+        else:
+            # Link next to the target and rename over it so the mirror never
+            # has a window where the entry is missing.
+            print(self.describe(op))
+            tmp_target = f'{op.target}.relink-tmp'
+            if os.path.lexists(tmp_target):
+                os.unlink(tmp_target)
+            os.link(op.source, tmp_target)
+            os.replace(tmp_target, op.target)
+        return True
+
+    def _apply_rename(self, op: PlanOperation) -> bool:
+        if not self.matches_signature(op.source, op):
+            print(f'{op.source} changed since planning, skipping')
+            self._count('stale')
+            return False
+        # os.rename would silently replace a file that appeared at the target.
+        if os.path.lexists(op.target):
+            print(f'{op.target} already exists, skipping')
+            self._count('skipped')
+            return False
+        print(self.describe(op))
+        os.makedirs(os.path.dirname(op.target), exist_ok=True)
+        os.rename(op.source, op.target)
+        return True
+
+    def _apply_remove(self, op: PlanOperation) -> bool:
+        if not self.matches_signature(op.target, op):
+            print(f'{op.target} changed since planning, skipping')
+            self._count('stale')
+            return False
+        print(self.describe(op))
+        os.unlink(op.target)
+        return True
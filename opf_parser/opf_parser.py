@@ -1,11 +1,25 @@
 import json
-import xml.etree.ElementTree as ET
+
+from opf_parser.xml_backend import OPFParseError, get_backend
+
+USER_METADATA_PREFIX = 'calibre:user_metadata:'
 
 
 class OPFParser:
 
-    def __init__(self, contents: str):
+    def __init__(self, contents: str, backend=None):
+        """
+        Args:
+            contents: Text of a metadata.opf
+            backend: XML backend from ``xml_backend.get_backend``; defaults
+                to lxml when installed, ElementTree otherwise
+        """
         self._contents = contents
+        self._backend = backend or get_backend()
+        self._root = None
+        self._parsed = False
+        self._error = None
+        self._meta = None
 
     def in_ext_lib(self, lib_name) -> bool:
         block = self._get_ext_lib_block()
@@ -22,23 +36,58 @@ class OPFParser:
         return False
 
     def extract_meta_field(self, field_name):
-        element = self.extract_element(f".//*[@name='{field_name}']")
-        return element.get("content") if element != None else None
+        return self._meta_fields().get(field_name)
+
+    def _meta_fields(self) -> dict:
+        """``{name: content}`` of all named elements, collected in one pass.
+
+        The first element with a name wins, as with a ``findall`` lookup.
+        """
+        if self._meta is None:
+            self._meta = {}
+            root = self._parse()
+            if root is not None:
+                for name, content in self._backend.named_elements(root):
+                    self._meta.setdefault(name, content)
+        return self._meta
+
+    def _parse(self):
+        """Parse the contents once; every getter reuses the same tree."""
+        if not self._parsed:
+            self._parsed = True
+            try:
+                self._root = self._backend.parse_strict(self._contents)
+            except OPFParseError as e:
+                self._error = str(e)
+        return self._root
+
+    @property
+    def error(self) -> str | None:
+        """Why the contents could not be parsed, or None if they parsed.
+
+        Every getter returns None or an empty value for such contents, so
+        callers that must tell a broken OPF from a sparse one check this.
+        """
+        self._parse()
+        return self._error
 
     def extract_element(self, expression: str):
-        if not self._contents:
-            return None
-        try:
-            root = ET.fromstring(self._contents.strip())
-            for meta in root.findall(expression):
-                return meta
-        except ET.ParseError:
-            return None
+        for meta in self.extract_elements(expression):
+            return meta
         return None
 
+    def extract_elements(self, expression: str) -> list:
+        """Elements matching an ElementPath ``expression``; works with either backend."""
+        root = self._parse()
+        return root.findall(expression) if root is not None else []
+
+    def _dc_texts(self, tag: str) -> list:
+        root = self._parse()
+        return self._backend.dc_texts(root, tag) if root is not None else []
+
     def get_title(self):
-        element = self.extract_element('.//{http://purl.org/dc/elements/1.1/}title')
-        return element.text if element is not None else None
+        titles = self._dc_texts('title')
+        return titles[0] if titles else None
 
     def get_series(self):
         element = self.extract_meta_field('calibre:series')
@@ -49,5 +98,32 @@ class OPFParser:
         return element if element is not None else None
 
     def get_author(self):
-        element = self.extract_element('.//{http://purl.org/dc/elements/1.1/}creator')
-        return element.text if element is not None else None
+        authors = self._dc_texts('creator')
+        return authors[0] if authors else None
+
+    def get_authors(self) -> list[str]:
+        return [text for text in self._dc_texts('creator') if text]
+
+    def get_tags(self) -> list[str]:
+        return [text for text in self._dc_texts('subject') if text]
+
+    def get_languages(self) -> list[str]:
+        return [text for text in self._dc_texts('language') if text]
+
+    def get_custom_columns(self) -> dict:
+        """Return ``{'#label': value}`` for every custom column with a value.
+
+        Values are Calibre's ``#value#``: a list for multi-value columns,
+        otherwise a string, number or bool. Empty columns are left out.
+        """
+        columns = {}
+        for name, content in self._meta_fields().items():
+            if not name.startswith(USER_METADATA_PREFIX):
+                continue
+            try:
+                value = json.loads(content or 'null')['#value#']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if value is not None and value != []:
+                columns[name[len(USER_METADATA_PREFIX):]] = value
+        return columns
@@ -0,0 +1,130 @@
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml is optional; ElementTree is always available
+    lxml_etree = None
+# Expanding internal entities only, as ElementTree does, needs lxml 5; older
+# versions would either drop them or load external ones.
+if lxml_etree is not None and lxml_etree.LXML_VERSION < (5,):
+    lxml_etree = None
+
+DC_URI = 'http://purl.org/dc/elements/1.1/'
+DC_NAMESPACE = f'{{{DC_URI}}}'
+_XML_DECLARATION = re.compile(r'^<\?xml[^>]*\?>')
+
+
+class OPFParseError(ValueError):
+    """Raised for an OPF that is empty or not well-formed XML."""
+
+
+class ElementTreeBackend:
+    """OPF parsing with the standard library's ``xml.etree.ElementTree``."""
+
+    name = 'etree'
+
+    def parse(self, contents: str | None):
+        """Return the root element, or None for empty or malformed contents."""
+        try:
+            return self.parse_strict(contents)
+        except OPFParseError:
+            return None
+
+    def parse_strict(self, contents: str | None):
+        """Return the root element, raising OPFParseError for empty or malformed contents."""
+        if not contents or not contents.strip():
+            raise OPFParseError('empty document')
+        try:
+            return ET.fromstring(contents.strip())
+        except ET.ParseError as e:
+            raise OPFParseError(str(e)) from e
+
+    def dc_texts(self, root, tag: str) -> list[str | None]:
+        return [e.text for e in root.iterfind(f'.//{DC_NAMESPACE}{tag}')]
+
+    def named_elements(self, root):
+        """Yield ``(name, content)`` for every element with a name attribute, in document order."""
+        for element in root.iterfind('.//*[@name]'):
+            yield element.get('name'), element.get('content')
+
+
+class LxmlBackend:
+    """OPF parsing with lxml, using compiled XPath expressions and a reused parser.
+
+    lxml parsers and XPath evaluators must not be shared between threads, so
+    each thread reading OPFs compiles its own set once.
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        if lxml_etree is None:
+            raise ImportError('The lxml XML backend needs lxml 5.0 or later')
+        self._local = threading.local()
+
+    def _compiled(self):
+        compiled = getattr(self._local, 'compiled', None)
+        if compiled is None:
+            compiled = self._local.compiled = {
+                # Like ElementTree: entities declared in the document are
+                # expanded, external ones are an error and nothing is fetched.
+                'parser': lxml_etree.XMLParser(resolve_entities='internal', load_dtd=False, no_network=True),
+                'named': lxml_etree.XPath('.//*[@name]'),
+                'dc': {},
+            }
+        return compiled
+
+    def parse(self, contents: str | None):
+        try:
+            return self.parse_strict(contents)
+        except OPFParseError:
+            return None
+
+    def parse_strict(self, contents: str | None):
+        if not contents or not contents.strip():
+            raise OPFParseError('empty document')
+        try:
+            # The contents are already decoded, so the declaration's encoding no
+            # longer applies; drop it and hand lxml UTF-8, its default.
+            contents = _XML_DECLARATION.sub('', contents.strip(), count=1)
+            return lxml_etree.fromstring(contents.encode('utf-8'), self._compiled()['parser'])
+        except (lxml_etree.XMLSyntaxError, ValueError) as e:
+            raise OPFParseError(str(e)) from e
+
+    def dc_texts(self, root, tag: str) -> list[str | None]:
+        expressions = self._compiled()['dc']
+        if tag not in expressions:
+            expressions[tag] = lxml_etree.XPath(f'.//dc:{tag}', namespaces={'dc': DC_URI})
+        return [e.text for e in expressions[tag](root)]
+
+    def named_elements(self, root):
+        for element in self._compiled()['named'](root):
+            yield element.get('name'), element.get('content')
+
+
+BACKENDS = {'etree': ElementTreeBackend, 'lxml': LxmlBackend}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name: str | None = None):
+    """Return the shared backend instance for ``name``.
+
+    ``None`` or ``'auto'`` picks lxml when version 5 or later is installed
+    and ElementTree otherwise; naming ``'lxml'`` explicitly fails if it is
+    missing.
+
+    Raises:
+        ValueError: If ``name`` is not a known backend
+        ImportError: If the lxml backend is requested but not installed
+    """
+    if name in (None, 'auto'):
+        name = 'lxml' if lxml_etree is not None else 'etree'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown XML backend {name!r}, expected 'auto' or one of {sorted(BACKENDS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
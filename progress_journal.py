@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+from mirror_plan.mirror_plan import PlanOperation
+
+
+class ProgressJournal:
+    """Append-only record of completed books and applied operations.
+
+    The runner appends to the journal while it works and truncates it once a
+    run finishes. A journal that still has entries when it is opened therefore
+    belongs to a run that did not finish, and its completed books can be
+    skipped. Writes are fsynced every ``fsync_every`` entries; anything after
+    the last fsync is simply redone on resume.
+    """
+
+    def __init__(self, journal_path: str, fsync_every: int = 100):
+        """
+        Initialize the ProgressJournal, loading any entries left by an unclean exit.
+
+        Args:
+            journal_path: Path of the journal file
+            fsync_every: Number of entries between fsyncs
+        """
+        self.journal_path = journal_path
+        self.fsync_every = max(1, fsync_every)
+        self.completed = {}
+        self.applied = set()
+        self._pending = 0
+        self._lock = threading.Lock()
+        valid_size = self._load()
+        self.resumed = bool(self.completed or self.applied)
+        self._file = open(journal_path, 'a+b')
+        # Drop a line torn by the crash so new entries start on a clean line.
+        self._file.truncate(valid_size)
+
+    def _load(self) -> int:
+        if not os.path.exists(self.journal_path):
+            return 0
+        valid_size = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                # Anything that is not a valid entry is treated like a torn line.
+                try:
+                    entry = json.loads(line)
+                    if not isinstance(entry, dict):
+                        break
+                    if 'book' in entry:
+                        self.completed[entry['book']] = entry.get('link')
+                    elif 'op' in entry:
+                        self.applied.add(PlanOperation.from_json(line).to_json())
+                except (ValueError, TypeError):
+                    break
+                valid_size += len(line)
+        return valid_size
+
+    def is_completed(self, book_id: str) -> bool:
+        return book_id in self.completed
+
+    def is_applied(self, op: PlanOperation) -> bool:
+        return op.to_json() in self.applied
+
+    def record_book(self, book_id: str, link_path: str | None = None):
+        self.completed[book_id] = link_path
+        self._append(json.dumps({'book': book_id, 'link': link_path},
+                                ensure_ascii=False, separators=(',', ':')))
+
+    def record_operation(self, op: PlanOperation):
+        line = op.to_json()
+        self.applied.add(line)
+        self._append(line)
+
+    def _append(self, line: str):
+        with self._lock:
+            self._file.write(line.encode('utf-8') + b'\n')
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Flush and fsync everything written so far."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        """Checkpoint and close, keeping the entries for a later resume."""
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+    def finish(self):
+        """Mark the run as complete by truncating the journal."""
+        if not self._file.closed:
+            self._file.truncate(0)
+            self.checkpoint()
+            self._file.close()
+        self.completed = {}
+        self.applied = set()
+        self.resumed = False
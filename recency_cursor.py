@@ -0,0 +1,97 @@
+import json
+import os
+
+RECENCY_CURSOR_VERSION = 1
+
+
+class RecencyCursor:
+    """Where time-budgeted runs left off in a library ordered newest first.
+
+    Books are ordered by ``(mtime_ns, book_id)``. The cursor keeps two marks:
+    ``high_water``, the newest book any run has seen, and ``backfill``, the
+    newest book the current pass over the library still has to do. Each run
+    first handles the books that changed since the high-water mark, newest
+    first, and spends whatever budget is left continuing the backfill from
+    its mark down. A pass that reaches the oldest book clears the backfill
+    mark, and the next run starts a new pass from the top.
+
+    When a run stops among the new books, the backfill resumes just below
+    the last book it finished, so the new books it did not get to are picked
+    up by later runs at the cost of revisiting part of the library. Books
+    still waiting for a retry when a run stops hold the mark above them.
+    """
+
+    def __init__(self, cursor_path: str | None = None):
+        self.cursor_path = cursor_path
+        self.high_water = None
+        self.backfill = None
+        self._last = None
+        if cursor_path and os.path.exists(cursor_path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cursor_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != RECENCY_CURSOR_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')!r}")
+            self.high_water = _key(data['high_water'])
+            self.backfill = _key(data['backfill'])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid recency cursor file '{self.cursor_path}': {e}") from e
+
+    def order(self, books: dict) -> list:
+        """Return the books to process this run: new books, then the backfill, each newest first.
+
+        Args:
+            books: ``(mtime_ns, book_id)`` keyed by book, e.g. by OPF path
+        """
+        newest_first = sorted(books, key=books.get, reverse=True)
+        if self.high_water is None:
+            return newest_first
+        new = [book for book in newest_first if books[book] > self.high_water]
+        bound = self.high_water if self.backfill is None else self.backfill
+        return new + [book for book in newest_first if books[book] <= bound]
+
+    def done(self, key: tuple):
+        """Record that the book with ``key`` has been processed, or has failed for good."""
+        if self._last is None or key < self._last:
+            self._last = key
+
+    def advance(self, books: dict, finished: bool, pending=()):
+        """Move the marks past this run's work.
+
+        Args:
+            books: The mapping passed to ``order``
+            finished: Whether every book ``order`` returned was processed
+            pending: Keys of books that were neither processed nor failed
+                for good, such as those waiting for a retry
+        """
+        if not finished and self._last is None:
+            return  # out of budget before the first book; nothing to record
+        newest = max(books.values(), default=None)
+        if newest is not None and (self.high_water is None or newest > self.high_water):
+            self.high_water = newest
+        if finished:
+            self.backfill = None
+        else:
+            rest = [key for key in books.values() if key < self._last]
+            self.backfill = max(rest + list(pending), default=None)
+        self._last = None
+
+    def save(self):
+        """Write the cursor atomically via a temp file and rename."""
+        if not self.cursor_path:
+            return
+        tmp_path = f'{self.cursor_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': RECENCY_CURSOR_VERSION, 'high_water': self.high_water, 'backfill': self.backfill},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.cursor_path)
+
+
+def _key(value) -> tuple | None:
+    if value is None:
+        return None
+    mtime_ns, book_id = value
+    return int(mtime_ns), str(book_id)
@@ -0,0 +1,143 @@
+import errno
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+
+# Errors network filesystems return for conditions that usually clear up on
+# their own: a busy or briefly unreachable server, or a file handle that went
+# stale because the server restarted.
+TRANSIENT_ERRNOS = frozenset((
+    errno.EAGAIN, errno.EIO, errno.ESTALE, errno.ETIMEDOUT, errno.EBUSY, errno.EINTR, errno.ECONNRESET,
+))
+# Errors that affect only the book at hand. Anything else is a bug and
+# still stops the run.
+BOOK_ERRORS = (OSError, ValueError)
+
+
+def is_transient(error: BaseException) -> bool:
+    return isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS
+
+
+def error_class(error: BaseException) -> str:
+    """Short label for reports: the errno name for OS errors, else the exception type."""
+    if isinstance(error, OSError) and error.errno in errno.errorcode:
+        return errno.errorcode[error.errno]
+    return type(error).__name__
+
+
+def classify(failures) -> dict[str, int]:
+    """Count ``(item, error)`` failures by ``error_class``, most common first."""
+    return dict(Counter(error_class(error) for item, error in failures).most_common())
+
+
+class RetryQueue:
+    """Deferred retries of work that failed with a transient error.
+
+    A failed item is set aside with an exponentially growing delay rather
+    than retried on the spot, so one flaky file holds up neither its worker
+    nor the books behind it. The caller picks up due items between other
+    work with ``due`` and waits out the rest with ``drain`` once everything
+    else is done. An item stops being retried after ``max_attempts`` tries,
+    and the queue stops accepting retries once ``budget`` have been spent,
+    so a mount that has gone away for good cannot hold a run up for long.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 budget: int = 1000, clock=time.monotonic, sleep=time.sleep):
+        """
+        Initialize the RetryQueue.
+
+        Args:
+            max_attempts: Tries per item, including the first
+            base_delay: Seconds before the first retry; doubles with each retry
+            max_delay: Upper bound for the delay between tries
+            budget: Retries allowed across all items
+            clock: Monotonic clock, replaceable in tests
+            sleep: Sleep function, replaceable in tests
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retries = 0
+        self.failures = []
+        self._clock = clock
+        self._sleep = sleep
+        self._pending = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> 'RetryQueue':
+        config = config or {}
+        return cls(
+            max_attempts=config.get('max_attempts', 5),
+            base_delay=config.get('base_delay', 0.5),
+            max_delay=config.get('max_delay', 30.0),
+            budget=config.get('budget', 1000),
+        )
+
+    def __len__(self):
+        return len(self._pending)
+
+    def defer(self, item, error: BaseException, attempts: int = 1) -> bool:
+        """Schedule ``item`` for another try after it failed ``attempts`` times.
+
+        Returns:
+            False if the error is not transient or the item is out of
+            attempts or the queue out of budget; the caller then treats
+            the item as failed
+        """
+        if not is_transient(error) or attempts >= self.max_attempts:
+            return False
+        with self._lock:
+            if self.retries >= self.budget:
+                return False
+            self.retries += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            heapq.heappush(self._pending, (self._clock() + delay, next(self._sequence), item, attempts))
+        return True
+
+    def fail(self, item, error: BaseException):
+        """Record an item that will not be retried, for the end-of-run report."""
+        with self._lock:
+            self.failures.append((item, error))
+
+    def pending(self) -> list:
+        """Items still waiting for a retry, e.g. after the caller stopped without draining."""
+        with self._lock:
+            return [item for ready_at, sequence, item, attempts in self._pending]
+
+    def due(self) -> list[tuple]:
+        """Remove and return ``(item, attempts)`` for every item whose delay has passed."""
+        now = self._clock()
+        ready = []
+        with self._lock:
+            while self._pending and self._pending[0][0] <= now:
+                ready_at, sequence, item, attempts = heapq.heappop(self._pending)
+                ready.append((item, attempts))
+        return ready
+
+    def drain(self):
+        """Yield ``(item, attempts)`` as each pending item becomes due, waiting in between.
+
+        Items deferred again while draining are yielded in turn.
+        """
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                wait = self._pending[0][0] - self._clock()
+            if wait > 0:
+                self._sleep(wait)
+            yield from self.due()
+
+    def report(self, label: str):
+        """Print how many retries were spent and what failed for good."""
+        if not self.retries and not self.failures:
+            return
+        print(f'{label}: {self.retries} retries, {len(self.failures)} failed {classify(self.failures)}')
+        for item, error in self.failures:
+            print(f'  {item}: {error}')
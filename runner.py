@@ -1,10 +1,32 @@
+import itertools
 import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
 
-from calibre_library.calibre_library import CalibreLibrary
+from calibre_library.book_catalog import BookCatalog, BookRecord
+from calibre_library.book_selection import ExtLibrarySelection, Selection, compile_selection
+from calibre_library.calibre_library import CalibreLibrary, UnknownBookError
+from change_set import ChangeSet, build_notifier
 from config_reader import ConfigReader
+from content_dedup import ContentHashCache, find_duplicates
+from filename_sanitizer import sanitize_filename
+from io_scheduler import AdaptiveConcurrencyController, AdaptiveExecutor, lower_io_priority
+from metrics_exporter import RunMetrics
+from mirror_plan.mirror_plan import MirrorPlan, PlanWriter
+from mirror_plan.mirror_planner import MirrorPlanner
+from mirror_plan.mirror_state import MirrorState
+from mirror_plan.plan_applier import PlanApplier
 from opf_parser.opf_parser import OPFParser
-from pathvalidate import sanitize_filename
+from opf_parser.xml_backend import OPFParseError, get_backend
+from progress_journal import ProgressJournal
+from recency_cursor import RecencyCursor
+from retry_queue import BOOK_ERRORS, RetryQueue
 from link_path_constructor import LinkPathConstructor
 
 LIBRARY_PATH = '/Volumes/Scratch/calibre-staging-library-test-2'
@@ -13,53 +35,715 @@ EXT_LIB_NAME = 'test-ext-lib'
 DRY_RUN = True
 SOURCE_FORMAT = '.kepub'
 DEST_FORMAT = '.epub'
+SCAN_WORKERS = 1
+JOURNAL_FSYNC_EVERY = 100
+DEDUP_KEEP = 'lowest_id'
+DEDUP_WORKERS = 4
+APPLY_WORKERS = 1
 
 CONFIG_PATH = './config.yaml'
 
 
+def stage_executor(config_group) -> AdaptiveExecutor | None:
+    """Return an executor with its own adaptive controller if io_control is configured."""
+    io_control = config_group.get('io_control')
+    if not io_control:
+        return None
+    return AdaptiveExecutor(AdaptiveConcurrencyController.from_config(io_control))
 
 
+def read_opf(file) -> str:
+    return Path(file).read_text()
 
-def main():
+
+def build_planner(config_group, track_targets: bool = True, state: MirrorState | None = None,
+                  check_owners: bool = False) -> MirrorPlanner:
+    source_format = config_group.get('source_format', SOURCE_FORMAT)
+    dest_format = config_group.get('dest_format', DEST_FORMAT)
+
+    # Create LinkPathConstructor instance for this config
+    link_constructor = LinkPathConstructor(
+        config_group.get('mirror_path', MIRROR_PATH),
+        dest_format,
+        config_group.get('naming_mode', 'komga')
+    )
+    return MirrorPlanner(link_constructor, source_format, track_targets, state, check_owners)
+
+
+def build_library(config_group) -> CalibreLibrary:
+    lib_path = config_group.get('library_path', LIBRARY_PATH)
+    scan_executor = stage_executor(config_group)
+    return CalibreLibrary(
+        lib_path,
+        config_group.get('scan_workers', SCAN_WORKERS),
+        config_group.get('scan_max_in_flight'),
+        scan_executor.controller if scan_executor else None,
+        config_group.get('walk_cache_path'),
+        config_group.get('walk_trust_mtimes')
+    )
+
+
+def scan_library(config_group, retries: RetryQueue | None = None) -> list[str]:
+    return build_library(config_group).list_all_opf(retries)
+
+
+def list_book_dir(book_dir) -> list[str]:
+    return os.listdir(book_dir)
+
+
+def read_record(file, backend=None, selection: Selection | None = None) -> BookRecord:
+    """Read one book.
+
+    The book directory is only listed if ``selection`` selects the book, so
+    a failed listing is handled like a failed read.
+
+    Raises:
+        OPFParseError: If the OPF is empty or malformed, rather than reading
+            it as a book without metadata
+    """
+    parser = OPFParser(read_opf(file), backend)
+    if parser.error is not None:
+        raise OPFParseError(f'malformed OPF: {parser.error}')
+    record = BookRecord.from_opf(file, parser)
+    if selection is not None and selection.matches(record) and record.files is None:
+        record.files = tuple(list_book_dir(os.path.dirname(file)))
+    return record
+
+
+def build_selection(config_group) -> Selection:
+    """Compile the group's ``select`` spec, defaulting to ``ext_lib_name`` membership."""
+    spec = config_group.get('select')
+    if spec is None:
+        return ExtLibrarySelection(config_group.get('ext_lib_name', EXT_LIB_NAME))
+    return compile_selection(spec)
+
+
+def _read_isolated(read, file):
+    """Return ``(file, record, None)``, or ``(file, None, error)`` for an error confined to this book."""
+    try:
+        return file, read(file), None
+    except BOOK_ERRORS as e:
+        return file, None, e
+
+
+def iter_records(config_group, opf_files, retries: RetryQueue | None = None, selection: Selection | None = None):
+    """Yield a ``BookRecord`` for every readable OPF, reading them on the stage executor if configured.
+
+    Books ``selection`` selects are read with their directory listing. A
+    book that cannot be read is not yielded. Transient failures are
+    retried through ``retries``, between later books while the walk goes on
+    and after the last one for the rest; other failures, and transient ones
+    out of attempts, are recorded in ``retries.failures``.
+    """
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    read_executor = stage_executor(config_group)
+    read = partial(_read_isolated, partial(read_record, backend=get_backend(config_group.get('xml_backend')),
+                                           selection=selection))
+
+    def settle(result, attempts):
+        file, record, error = result
+        if error is not None and not retries.defer(file, error, attempts):
+            print(f'Could not read {file}: {error}')
+            retries.fail(file, error)
+        return record
+
+    for result in read_executor.map(read, opf_files) if read_executor else map(read, opf_files):
+        if (record := settle(result, 1)) is not None:
+            yield record
+        for file, attempts in retries.due():
+            if (record := settle(read(file), attempts + 1)) is not None:
+                yield record
+    for file, attempts in retries.drain():
+        if (record := settle(read(file), attempts + 1)) is not None:
+            yield record
+
+
+def iter_selected_books(config_group, opf_files, retries: RetryQueue | None = None):
+    """Yield ``(opf_path, record)`` for every readable OPF, with record None for unselected books."""
+    selection = build_selection(config_group)
+    for record in iter_records(config_group, opf_files, retries, selection):
+        yield record.opf_path, record if selection.matches(record) else None
+
+
+def load_catalog(config_group, retries: RetryQueue | None = None) -> BookCatalog:
+    """Scan the group's library and read every book into an indexed catalog.
+
+    Directories that could not be listed and books that could not be read
+    are noted on the catalog, so the planner leaves their links alone.
+    """
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    failed_before = len(retries.failures)
+    opf_files = scan_library(config_group, retries)
+    failed_scan = len(retries.failures)
+    catalog = BookCatalog(iter_records(config_group, opf_files, retries))
+    catalog.complete = failed_scan == failed_before
+    catalog.unreadable = {CalibreLibrary.book_id(file) for file, error in retries.failures[failed_scan:]}
+    return catalog
+
+
+def plan_record(planner: MirrorPlanner, file, record: BookRecord | None, plan: MirrorPlan) -> str | None:
+    """Plan one book, or the departure of an unselected one if ``record`` is None.
+
+    The book's operations are only added to ``plan`` once all of them are
+    planned, so a book that fails halfway leaves nothing behind to retry
+    on top of.
+
+    Returns:
+        The book's link path, as ``MirrorPlanner.plan_book``
+    """
+    book_plan = MirrorPlan()
+    if record is None:
+        planner.plan_departed(CalibreLibrary.book_id(file), book_plan)
+        link_path = None
+    else:
+        link_path = planner.plan_book(file, record, book_plan, record.files)
+    plan.extend(book_plan)
+    return link_path
+
+
+def settle_plan_error(retries: RetryQueue, file, error: BaseException, attempts: int) -> bool:
+    """Defer a book whose planning failed, or record it as failed.
+
+    Returns:
+        True if the book was deferred and will be planned again
+    """
+    if retries.defer(file, error, attempts):
+        return True
+    print(f'Could not plan {file}: {error}')
+    retries.fail(file, error)
+    return False
+
+
+def group_name(config_group) -> str:
+    """Label identifying a config group in logs and metrics."""
+    return str(config_group.get('name') or config_group.get('mirror_path', MIRROR_PATH))
+
+
+def record_plan_metrics(config_group, metrics: RunMetrics, planner: MirrorPlanner, scanned: int, matched: int):
+    group = group_name(config_group)
+    metrics.set('books_scanned', scanned, group=group)
+    metrics.set('books_matched', matched, group=group)
+    metrics.set('collisions', planner.collisions, group=group)
+    info = sanitize_filename.cache_info()
+    metrics.record_cache(group, 'sanitize_filename', info.hits, info.misses)
+
+
+def dedup_records(config_group, records: list[BookRecord], planner: MirrorPlanner,
+                  metrics: RunMetrics, retries: RetryQueue) -> list[BookRecord]:
+    """Drop books whose source file is a byte-identical copy of another selected book's.
+
+    A book whose source file cannot be stat'ed or read is kept out of the
+    comparison, and so mirrored, and recorded in ``retries.failures``.
+    """
+    dedup = config_group['dedup']
+    dedup = dedup if isinstance(dedup, dict) else {}
+    cache = ContentHashCache(dedup.get('cache_path'))
+    books = []
+    errors = []
+    for record in records:
+        matched_format = planner.match_source_file(record.files)
+        if matched_format is not None:
+            source_path = os.path.join(os.path.dirname(record.opf_path), matched_format)
+            try:
+                books.append((record.book_id, source_path, os.stat(source_path)))
+            except OSError as e:
+                errors.append((source_path, e))
+
+    hash_executor = stage_executor(config_group)
+    with (nullcontext(hash_executor) if hash_executor
+          else ThreadPoolExecutor(dedup.get('workers', DEDUP_WORKERS))) as executor:
+        duplicates = find_duplicates(books, cache, dedup.get('keep', DEDUP_KEEP), executor.map, errors)
+    cache.save()
+    for path, error in errors:
+        print(f'Could not check {path} for duplicates: {error}')
+        retries.fail(path, error)
+
+    group = group_name(config_group)
+    metrics.set('duplicates', len(duplicates), group=group)
+    metrics.record_cache(group, 'content_hash', cache.hits, cache.misses)
+    return [record for record in records if record.book_id not in duplicates]
+
+
+def pending_state_path(plan_path: str) -> str:
+    """Where a dry run leaves the mirror state its plan leads to, for ``apply_plan.py`` to commit."""
+    return f'{plan_path}.state.json'
+
+
+def publish_changes(config_group, changes: ChangeSet):
+    """Write the run's change set and notify downstream servers of the changed folders, as configured.
+
+    A failed notification is reported but does not fail the run; the
+    mirror itself is already up to date.
+    """
+    changes_path = config_group.get('changes_path')
+    if changes_path:
+        changes.write(changes_path)
+    notify = config_group.get('notify')
+    if notify and len(changes):
+        try:
+            build_notifier(notify).notify(changes)
+        except OSError as e:
+            print(f'Could not notify downstream of {len(changes)} changed folders: {e}')
+            return
+        print(f'Notified downstream of {len(changes)} changed folders')
+
+
+def list_selected(config_group, selection: Selection, catalog: BookCatalog,
+                  retries: RetryQueue) -> tuple[list[BookRecord], set[str]]:
+    """Select books from ``catalog`` and list the directories not listed yet, on the stage executor if configured.
+
+    Books whose directory cannot be listed, whether to match a ``formats``
+    selection or afterwards, are recorded in ``retries.failures`` and left
+    for the next run.
+
+    Returns:
+        The listed records, and the ids of the books that could not be listed
+    """
+    def list_record(record):
+        if record.files is None:
+            record.files = tuple(list_book_dir(os.path.dirname(record.opf_path)))
+        return record
+
+    match_errors = []
+    records = selection.select(catalog, match_errors)
+    executor = stage_executor(config_group)
+    isolated = partial(_read_isolated, list_record)
+    listed, unlisted = [], set()
+    results = executor.map(isolated, records) if executor else map(isolated, records)
+    for record, _, error in itertools.chain(results, ((record, None, error) for record, error in match_errors)):
+        if error is None:
+            listed.append(record)
+            continue
+        print(f'Could not list {os.path.dirname(record.opf_path)}: {error}')
+        retries.fail(record.opf_path, error)
+        unlisted.add(record.book_id)
+    return listed, unlisted
+
+
+def plan_config_group(config_group, metrics: RunMetrics | None = None, catalog: BookCatalog | None = None,
+                      state: MirrorState | None = None, retries: RetryQueue | None = None) -> MirrorPlan:
+    """Plan the group's mirror from ``catalog``, loading the library if none is given.
+
+    With a mirror state, books that are no longer selected or no longer in
+    the library have their previous links removed, and books whose link
+    path changed have their link renamed, a whole directory at a time when
+    all of its books moved together. Books the catalog could not read, and
+    selected books whose directory could not be listed or that could not be
+    planned, keep their links. Planning failures are retried through
+    ``retries`` once the other books are planned.
+    """
+    metrics = metrics or RunMetrics()
+    group = group_name(config_group)
+    selection = build_selection(config_group)
+    planner = build_planner(config_group, state=state)
+    plan = MirrorPlan()
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    if catalog is None:
+        with metrics.stage(group, 'scan'):
+            catalog = load_catalog(config_group, retries)
+    with metrics.stage(group, 'plan'):
+        selected, unlisted = list_selected(config_group, selection, catalog, retries)
+    if config_group.get('dedup'):
+        with metrics.stage(group, 'dedup'):
+            selected = dedup_records(config_group, selected, planner, metrics, retries)
+    with metrics.stage(group, 'plan'):
+        by_file = {record.opf_path: record for record in selected}
+        unplanned = set()
+
+        def plan_isolated(record, attempts):
+            try:
+                plan_record(planner, record.opf_path, record, plan)
+            except BOOK_ERRORS as e:
+                if not settle_plan_error(retries, record.opf_path, e, attempts):
+                    unplanned.add(record.book_id)
+
+        for record in selected:
+            plan_isolated(record, 1)
+        for file, attempts in retries.drain():
+            plan_isolated(by_file[file], attempts + 1)
+        if state is not None:
+            selected_ids = {record.book_id for record in selected} | unlisted
+            if not catalog.complete:
+                print('Parts of the library could not be listed, keeping the links of books not found')
+            for book_id in state.book_ids() if catalog.complete else ():
+                if book_id not in selected_ids and book_id not in catalog.unreadable:
+                    planner.plan_departed(book_id, plan)
+            planner.plan_directory_renames(plan)
+        if config_group.get('prune_mirror', False):
+            if catalog.complete and not catalog.unreadable and not unlisted and not unplanned:
+                planner.plan_prune(plan)
+            else:
+                print('Some books could not be read, skipping pruning')
+    record_plan_metrics(config_group, metrics, planner, len(catalog), len(selected) + len(unlisted))
+    return plan
+
+
+def run_journaled(config_group, journal: ProgressJournal, applier: PlanApplier,
+                  metrics: RunMetrics | None = None, on_batch=None, state: MirrorState | None = None,
+                  retries: RetryQueue | None = None) -> MirrorPlan:
+    """Plan and apply in batches, recording finished books so a killed run can resume.
+
+    Each batch is applied before its books are recorded, and a book is only
+    recorded once ``applier`` has reported every one of its operations
+    applied to the journal, so a book is only skipped on resume once its
+    links are on disk. Books with operations that failed or were set aside
+    for ``applier.finish`` are redone by a resumed run. ``on_batch`` is
+    called after every batch, e.g. to publish metrics.
+    """
+    metrics = metrics or RunMetrics()
+    group = group_name(config_group)
+    planner = build_planner(config_group, state=state)
+    if config_group.get('dedup'):
+        print('dedup is not supported with journal_path, mirroring duplicates')
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    with metrics.stage(group, 'scan'):
+        opf_files = scan_library(config_group, retries)
+    scanned = len(opf_files)
+    if journal.resumed:
+        print(f'Resuming unfinished run: {len(journal.completed)} books already done')
+        for link_path in journal.completed.values():
+            planner.mark_planned(link_path)
+        opf_files = [f for f in opf_files if not journal.is_completed(CalibreLibrary.book_id(f))]
+
+    plan = MirrorPlan()
+    batch = MirrorPlan()
+    batch_books = []
+    matched = 0
+    plan_attempts = Counter()
+
+    def apply_batch():
+        with metrics.stage(group, 'apply'):
+            applier.apply(MirrorPlan([op for op in batch if not journal.is_applied(op)]))
+        for book_id, link_path, ops in batch_books:
+            if all(journal.is_applied(op) for op in ops):
+                journal.record_book(book_id, link_path)
+        journal.checkpoint()
+        plan.extend(batch)
+        batch.operations.clear()
+        batch_books.clear()
+        record_plan_metrics(config_group, metrics, planner, scanned, matched)
+        if on_batch is not None:
+            on_batch()
+
+    books = iter_selected_books(config_group, opf_files, retries)
+    while True:
+        with metrics.stage(group, 'plan'):
+            file, record = next(books, (None, None))
+            if file is None:
+                break
+            book_plan = MirrorPlan()
+            try:
+                link_path = plan_record(planner, file, record, book_plan)
+            except BOOK_ERRORS as e:
+                # A deferred book is read and planned again once due.
+                plan_attempts[file] += 1
+                settle_plan_error(retries, file, e, plan_attempts[file])
+                continue
+            matched += record is not None
+            batch.extend(book_plan)
+            batch_books.append((CalibreLibrary.book_id(file), link_path, book_plan.operations))
+        if len(batch_books) >= journal.fsync_every:
+            apply_batch()
+    apply_batch()
+
+    if config_group.get('prune_mirror', False):
+        if retries.failures:
+            print('Some books could not be read, skipping pruning')
+        else:
+            with metrics.stage(group, 'plan'):
+                planner.plan_prune(batch)
+            apply_batch()
+    return plan
+
+
+def stream_config_group(config_group, applier: PlanApplier, metrics: RunMetrics | None = None,
+                        opf_files=None, state: MirrorState | None = None, retries: RetryQueue | None = None,
+                        stop=None) -> int:
+    """Scan, match, plan and apply each book as the walk reaches it.
+
+    Nothing proportional to the library size is kept in memory, and the first
+    link is made as soon as the first matching book is found. Pruning needs
+    the full set of targets and is not available in this mode. ``stop`` is
+    called with each book's OPF path once the book is done; the run ends
+    early when it returns True.
+
+    Returns:
+        The number of books scanned
+    """
+    metrics = metrics or RunMetrics()
+    group = group_name(config_group)
+    planner = build_planner(config_group, track_targets=False, state=state)
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    walk_retries = None
+    if opf_files is None:
+        # A queue of its own: the walk drains it while books are still being read.
+        walk_retries = RetryQueue.from_config(config_group.get('retry'))
+        opf_files = build_library(config_group).iter_opf(walk_retries)
+    if config_group.get('prune_mirror', False):
+        print('prune_mirror is not supported in stream mode, skipping pruning')
+    if config_group.get('dedup'):
+        print('dedup is not supported in stream mode, mirroring duplicates')
+
+    plan_path = config_group.get('plan_path')
+    with PlanWriter(plan_path) if plan_path else nullcontext() as plan_writer:
+        scanned = matched = 0
+        plan_attempts = Counter()
+        with metrics.stage(group, 'stream'):
+            for file, record in iter_selected_books(config_group, opf_files, retries):
+                book_plan = MirrorPlan()
+                try:
+                    plan_record(planner, file, record, book_plan)
+                except BOOK_ERRORS as e:
+                    # A deferred book is read and planned again once due.
+                    plan_attempts[file] += 1
+                    if settle_plan_error(retries, file, e, plan_attempts[file]):
+                        continue
+                scanned += 1
+                matched += record is not None
+                if book_plan:
+                    if plan_writer is not None:
+                        plan_writer.write(book_plan)
+                    applier.apply(book_plan)
+                if stop is not None and stop(file):
+                    break
+    if walk_retries is not None:
+        # Directories that could not be listed count as failures of the run.
+        retries.retries += walk_retries.retries
+        retries.failures.extend(walk_retries.failures)
+    record_plan_metrics(config_group, metrics, planner, scanned, matched)
+    return scanned
+
+
+def run_scheduled(config_group, applier: PlanApplier, metrics: RunMetrics | None = None,
+                  state: MirrorState | None = None, retries: RetryQueue | None = None, clock=time.monotonic) -> int:
+    """Stream the most recently changed books first, within the schedule's time budget.
+
+    Books are ordered by when they last changed according to metadata.db or
+    the OPF mtimes, and a ``RecencyCursor`` persisted at the schedule's
+    ``cursor_path`` carries the remaining backfill over to the next run, so
+    new books are mirrored first even while a large backfill is under way.
+    Books missing from the library listing lose their links up front.
+
+    Returns:
+        The number of books processed
+    """
+    metrics = metrics or RunMetrics()
+    group = group_name(config_group)
+    retries = retries if retries is not None else RetryQueue.from_config(config_group.get('retry'))
+    schedule = config_group['schedule']
+    budget = schedule.get('budget_seconds')
+    deadline = None if budget is None else clock() + budget
+    library = build_library(config_group)
+    with metrics.stage(group, 'scan'):
+        mtimes = library.book_mtimes(retries)
+    books = {opf_path: (mtime_ns, CalibreLibrary.book_id(opf_path)) for opf_path, mtime_ns in mtimes.items()}
+
+    if state is not None and not library.scan_errors:
+        listed = {book_id for mtime_ns, book_id in books.values()}
+        planner = build_planner(config_group, track_targets=False, state=state)
+        departed = MirrorPlan()
+        for book_id in state.book_ids():
+            if book_id not in listed:
+                planner.plan_departed(book_id, departed)
+        applier.apply(departed)
+
+    cursor = RecencyCursor(schedule.get('cursor_path'))
+    stopped = False
+
+    def stop(file):
+        nonlocal stopped
+        cursor.done(books[file])
+        stopped = deadline is not None and clock() >= deadline
+        return stopped
+
+    processed = stream_config_group(config_group, applier, metrics, cursor.order(books), state, retries, stop)
+    # Books still waiting for a retry were passed over, not done.
+    cursor.advance(books, finished=not stopped, pending=[books[file] for file in retries.pending() if file in books])
+    if not config_group.get('dry_run', DRY_RUN):
+        cursor.save()
+    if stopped:
+        print(f'Time budget of {budget}s used up after {processed} books, continuing next run')
+    return processed
+
+
+def run_config_group(config_group, metrics: RunMetrics, catalogs: dict | None = None) -> dict[str, int]:
+    """Mirror one config group and return the applier summary.
+
+    ``catalogs`` maps library paths to loaded catalogs; batch runs reuse and
+    fill it so groups sharing a library read it only once.
+    """
+    group = group_name(config_group)
+    dry_run = config_group.get('dry_run', DRY_RUN)
+    metrics_path = config_group.get('metrics_path')
+    plan_path = config_group.get('plan_path')
+
+    def write_metrics():
+        if metrics_path:
+            metrics.write_textfile(metrics_path, group)
+
+    def on_applied(op):
+        if journal is not None:
+            journal.record_operation(op)
+        metrics.record_applied(group, op)
+        changes.record(op)
+
+    schedule = config_group.get('schedule')
+    stream = config_group.get('stream', False) or bool(schedule)
+    build_selection(config_group)  # reject a malformed spec before doing any work
+    get_backend(config_group.get('xml_backend'))
+    if config_group.get('notify'):
+        build_notifier(config_group['notify'])
+    changes = ChangeSet(config_group.get('mirror_path', MIRROR_PATH))
+    journal = None
+    journal_path = config_group.get('journal_path')
+    if journal_path and not dry_run and not stream:
+        journal = ProgressJournal(journal_path, config_group.get('journal_fsync_every', JOURNAL_FSYNC_EVERY))
+    state_path = config_group.get('state_path')
+    state = MirrorState(state_path) if state_path else None
+    # Streaming applies one book at a time, too little work per call for a pool.
+    executor = None if stream else stage_executor(config_group)
+    workers = 1 if stream else config_group.get('apply_workers', APPLY_WORKERS)
+    read_retries = RetryQueue.from_config(config_group.get('retry'))
+    applier = PlanApplier(dry_run=dry_run, executor=executor, on_applied=on_applied, workers=workers,
+                          retries=RetryQueue.from_config(config_group.get('retry')))
+
+    try:
+        if schedule:
+            run_scheduled(config_group, applier, metrics, state, read_retries)
+        elif stream:
+            stream_config_group(config_group, applier, metrics, state=state, retries=read_retries)
+        else:
+            if journal is not None:
+                plan = run_journaled(config_group, journal, applier, metrics, on_batch=write_metrics, state=state,
+                                     retries=read_retries)
+            else:
+                lib_path = config_group.get('library_path', LIBRARY_PATH)
+                catalogs = catalogs if catalogs is not None else {}
+                if lib_path not in catalogs:
+                    with metrics.stage(group, 'scan'):
+                        catalogs[lib_path] = load_catalog(config_group, read_retries)
+                plan = plan_config_group(config_group, metrics, catalogs[lib_path], state, read_retries)
+
+            if plan_path:
+                plan.write(plan_path)
+                print(f'Wrote {len(plan)} operations to {plan_path}: {plan.counts()}')
+
+            if journal is None:
+                with metrics.stage(group, 'apply'):
+                    applier.apply(plan)
+        with metrics.stage(group, 'apply'):
+            applier.finish()
+    except BaseException:
+        if journal is not None:
+            journal.close()
+        metrics.inc('errors', 1, group=group)
+        metrics.finish_group(group, success=False)
+        write_metrics()
+        raise
+
+    if journal is not None:
+        journal.finish()
+    if state is not None and not dry_run:
+        state.save()
+    elif state is not None and plan_path:
+        # The state this plan leads to, committed by apply_plan.py once applied.
+        state.save(pending_state_path(plan_path))
+    if not dry_run:
+        publish_changes(config_group, changes)
+    read_retries.report('Reading the library')
+    applier.report()
+    errors = applier.summary['stale'] + applier.summary['failed'] + len(read_retries.failures)
+    metrics.inc('errors', errors, group=group)
+    metrics.finish_group(group, success=errors == 0)
+    write_metrics()
+    return applier.summary
+
+
+def sync_config_group(config_group, targets: list[str]) -> dict[str, int] | None:
+    """Re-plan and apply only the books named by ``targets``.
+
+    Targets are Calibre book ids or paths inside book directories. They are
+    resolved without walking the library. Books that are gone or no longer
+    selected lose their previous links according to the mirror state. Ids
+    the library cannot resolve are reported and left as they are.
+
+    Returns:
+        The applier summary, or None if no target belongs to this group's library
+    """
+    library = build_library(config_group)
+    resolved = []
+    for target in targets:
+        try:
+            book = library.resolve_book(target)
+        except UnknownBookError as e:
+            print(f'{e}, leaving it as it is')
+            continue
+        if book is not None:
+            resolved.append(book)
+    if not resolved:
+        return None
+    dry_run = config_group.get('dry_run', DRY_RUN)
+    state_path = config_group.get('state_path')
+    if not state_path:
+        print('No state_path configured, previous links of synced books cannot be cleaned up')
+    state = MirrorState(state_path)
+    selection = build_selection(config_group)
+    backend = get_backend(config_group.get('xml_backend'))
+    planner = build_planner(config_group, state=state, check_owners=True)
+    plan = MirrorPlan()
+    for book_id, opf_path in resolved:
+        try:
+            record = read_record(opf_path, backend, selection) if opf_path else None
+        except BOOK_ERRORS as e:
+            print(f'Could not read {opf_path}: {e}, leaving book {book_id} as it is')
+            continue
+        book_plan = MirrorPlan()
+        try:
+            if record is not None and selection.matches(record):
+                planner.plan_book(opf_path, record, book_plan, record.files)
+            else:
+                planner.plan_departed(book_id, book_plan)
+        except BOOK_ERRORS as e:
+            print(f'Could not plan book {book_id}: {e}, leaving it as it is')
+            continue
+        plan.extend(book_plan)
+    changes = ChangeSet(config_group.get('mirror_path', MIRROR_PATH))
+    applier = PlanApplier(dry_run=dry_run, on_applied=changes.record,
+                          workers=config_group.get('apply_workers', APPLY_WORKERS),
+                          retries=RetryQueue.from_config(config_group.get('retry')))
+    summary = applier.apply(plan)
+    applier.finish()
+    if not dry_run:
+        state.save()
+        publish_changes(config_group, changes)
+    applier.report()
+    return summary
+
+
+def main() -> int:
+    """Mirror every config group; a group that fails does not stop the others.
+
+    Returns:
+        The exit status: 1 if any group failed, 0 otherwise
+    """
     configs = ConfigReader(CONFIG_PATH).configs
+    if any((config_group.get('io_control') or {}).get('low_priority') for config_group in configs):
+        lower_io_priority()
+    metrics = RunMetrics()
+    catalogs = {}
+    failed = []
     for config_group in configs:
-        lib_path = config_group.get('library_path', LIBRARY_PATH)
-        calibre = CalibreLibrary(lib_path)
-        dry_run = config_group.get('dry_run', DRY_RUN)
-        source_format = config_group.get('source_format', SOURCE_FORMAT)
-        dest_format = config_group.get('dest_format', DEST_FORMAT)
-        
-        # Create LinkPathConstructor instance for this config
-        link_constructor = LinkPathConstructor(
-            config_group.get('mirror_path', MIRROR_PATH), 
-            dest_format,
-            config_group.get('naming_mode', 'komga')
-        )
-
-        for file in calibre.list_all_opf():
-            file_path = Path(file)
-            parser = OPFParser(file_path.read_text())
-            if parser.in_ext_lib(config_group.get('ext_lib_name', EXT_LIB_NAME)):
-                parent_dir = os.path.dirname(file)
-                matched_format = None
-                for book in os.listdir(parent_dir):
-                    if book.endswith(source_format):
-                        print(f'Found {book}')
-                        matched_format = book
-                if matched_format is not None:
-                    source_path = os.path.join(parent_dir, matched_format)
-                    link_path = link_constructor.construct_link_path(parser, matched_format)
-                    parent_link = os.path.dirname(link_path)
-                    os.makedirs(parent_link, exist_ok=True)
-                    if not dry_run:
-                        if not os.path.exists(link_path):
-                            print(f'Linking {source_path} to {link_path}')
-                            os.link(source_path, link_path)
-                        else:
-                            print(f'{link_path} already exists, skipping')
-                    else:
-                        print(f'<DRYRUN>Linking {source_path} to {link_path}')
+        try:
+            summary = run_config_group(config_group, metrics, catalogs)
+        except Exception:
+            traceback.print_exc()
+            failed.append(group_name(config_group))
+            continue
+        print(f'Applied plan: {summary}')
+    if failed:
+        print(f'Failed config groups: {", ".join(failed)}')
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import sys
+
+import runner
+from config_reader import ConfigReader
+
+
+def main(argv=None, stdin=None):
+    """Mirror just the given books, e.g. from a Calibre hook after an add or edit.
+
+    Books are Calibre ids or book directories, given as arguments or one per
+    line on stdin.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    stdin = sys.stdin if stdin is None else stdin
+    targets = args if args else ([] if stdin.isatty() else [line.strip() for line in stdin])
+    targets = [t for t in targets if t]
+    if not targets:
+        print('Usage: sync_books.py BOOK_ID_OR_DIR [...]  (or one per line on stdin)', file=sys.stderr)
+        return 2
+    for config_group in ConfigReader(runner.CONFIG_PATH).configs:
+        summary = runner.sync_config_group(config_group, targets)
+        if summary is not None:
+            print(f'Synced {runner.group_name(config_group)}: {summary}')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
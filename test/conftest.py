@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, quoteattr
+
+import pytest
+
+OPF_TEMPLATE = '''<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="uuid_id" version="2.0">
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+        <dc:identifier opf:scheme="calibre" id="calibre_id">{book_id}</dc:identifier>
+        <dc:title>{title}</dc:title>
+{creators}{subjects}{languages}{metas}    </metadata>
+</package>
+'''
+
+
+def make_opf(book_id, title, authors=('Test Author',), series=None, series_index=None,
+             ext_libs=('test-ext-lib',), tags=(), languages=('en',), custom_columns=None):
+    """Return the text of a Calibre-style metadata.opf."""
+    creators = ''.join(f'        <dc:creator opf:role="aut">{escape(a)}</dc:creator>\n' for a in authors)
+    subjects = ''.join(f'        <dc:subject>{escape(t)}</dc:subject>\n' for t in tags)
+    langs = ''.join(f'        <dc:language>{escape(lang)}</dc:language>\n' for lang in languages)
+    meta = {}
+    if series is not None:
+        meta['calibre:series'] = series
+    if series_index is not None:
+        meta['calibre:series_index'] = str(series_index)
+    columns = dict(custom_columns or {})
+    if ext_libs is not None:
+        columns.setdefault('#ext_library', list(ext_libs))
+    for name, value in columns.items():
+        meta[f'calibre:user_metadata:{name}'] = json.dumps({'label': name[1:], '#value#': value})
+    metas = ''.join(f'        <meta name={quoteattr(k)} content={quoteattr(v)}/>\n' for k, v in meta.items())
+    return OPF_TEMPLATE.format(book_id=book_id, title=escape(title), creators=creators,
+                               subjects=subjects, languages=langs, metas=metas)
+
+
+class StubServer:
+    """Local HTTP server recording the JSON bodies POSTed to it."""
+
+    def __init__(self, status=200):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append((self.path, dict(self.headers), json.loads(body)))
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/rescan'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    """Clock whose sleep advances time instantly and records each wait."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def make_book():
+    """Factory creating ``root/Author/Title (id)/metadata.opf`` plus format files.
+
+    Works on the real filesystem and under pyfakefs alike.
+    """
+    def _make_book(root, book_id, title, formats=('.kepub',), **opf_fields):
+        author = (opf_fields.get('authors') or ('Test Author',))[0]
+        book_dir = os.path.join(root, author, f'{title} ({book_id})')
+        os.makedirs(book_dir, exist_ok=True)
+        opf_path = os.path.join(book_dir, 'metadata.opf')
+        with open(opf_path, 'w', encoding='utf-8') as f:
+            f.write(make_opf(book_id, title, **opf_fields))
+        for fmt in formats:
+            with open(os.path.join(book_dir, f'{title}{fmt}'), 'w') as f:
+                f.write(f'{title}{fmt}')
+        return opf_path
+    return _make_book
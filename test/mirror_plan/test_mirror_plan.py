@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from mirror_plan.mirror_plan import LINK, MKDIR, RELINK, REMOVE, RENAME, MirrorPlan, PlanOperation
+
+
+class TestMirrorPlan:
+    """Test class for MirrorPlan functionality."""
+
+    def test_add_link_creates_parent_once(self, fs):
+        """Test that links in the same directory share one mkdir."""
+        fs.create_file('/lib/a.kepub')
+        fs.create_file('/lib/b.kepub')
+        plan = MirrorPlan()
+        plan.add_link('/lib/a.kepub', '/mirror/Series/1 - A.epub', os.stat('/lib/a.kepub'))
+        plan.add_link('/lib/b.kepub', '/mirror/Series/2 - B.epub', os.stat('/lib/b.kepub'))
+        assert [op.op for op in plan] == [MKDIR, LINK, LINK]
+        assert plan.operations[0].target == '/mirror/Series'
+
+    def test_link_records_source_signature(self, fs):
+        """Test that links carry the source inode and mtime."""
+        fs.create_file('/lib/a.kepub')
+        st = os.stat('/lib/a.kepub')
+        plan = MirrorPlan()
+        plan.add_link('/lib/a.kepub', '/mirror/A/A.epub', st, relink=True)
+        op = plan.operations[-1]
+        assert op.op == RELINK
+        assert (op.ino, op.mtime_ns) == (st.st_ino, st.st_mtime_ns)
+
+    def test_counts(self, fs):
+        """Test counting operations by kind."""
+        fs.create_file('/lib/a.kepub')
+        fs.create_file('/mirror/Old/Old.epub')
+        plan = MirrorPlan()
+        plan.add_link('/lib/a.kepub', '/mirror/A/A.epub', os.stat('/lib/a.kepub'))
+        plan.add_remove('/mirror/Old/Old.epub', os.stat('/mirror/Old/Old.epub'))
+        assert plan.counts() == {MKDIR: 1, LINK: 1, RELINK: 0, REMOVE: 1, RENAME: 0}
+
+    def test_write_read_round_trip(self, fs):
+        """Test that a written plan reads back identically."""
+        fs.create_file('/lib/Ünïcode.kepub')
+        fs.create_dir('/plans')
+        plan = MirrorPlan()
+        plan.add_link('/lib/Ünïcode.kepub', '/mirror/Ü/Ü.epub', os.stat('/lib/Ünïcode.kepub'))
+        plan.write('/plans/plan.jsonl')
+        assert not os.path.exists('/plans/plan.jsonl.tmp')
+
+        loaded = MirrorPlan.read('/plans/plan.jsonl')
+        assert loaded.operations == plan.operations
+
+    def test_read_rejects_unknown_operation(self, fs):
+        """Test that unknown operations are reported with their line number."""
+        fs.create_file('/plans/plan.jsonl', contents='{"op":"mkdir","target":"/m"}\n{"op":"chmod","target":"/m"}\n')
+        with pytest.raises(ValueError, match='line 2'):
+            MirrorPlan.read('/plans/plan.jsonl')
+
+    def test_operation_json_omits_empty_fields(self):
+        """Test that mkdir operations serialize compactly."""
+        assert PlanOperation(MKDIR, '/m').to_json() == '{"op":"mkdir","target":"/m"}'
@@ -0,0 +1,180 @@
+import os
+from unittest.mock import Mock
+
+from link_path_constructor import LinkPathConstructor
+from mirror_plan.mirror_plan import LINK, MKDIR, REMOVE, RELINK, RENAME, MirrorPlan
+from mirror_plan.mirror_planner import MirrorPlanner
+from mirror_plan.mirror_state import MirrorState
+from opf_parser.opf_parser import OPFParser
+
+
+def _parser(title, series=None, series_index=None):
+    parser = Mock(spec=OPFParser)
+    parser.get_title.return_value = title
+    parser.get_series.return_value = series
+    parser.get_series_index.return_value = series_index
+    parser.get_author.return_value = None
+    return parser
+
+
+class TestMirrorPlanner:
+    """Test class for MirrorPlanner functionality."""
+
+    def setup_method(self):
+        self.planner = MirrorPlanner(LinkPathConstructor('/mirror', '.epub'), '.kepub')
+
+    def test_plan_new_book(self, fs):
+        """Test that a new book is planned as mkdir plus link."""
+        fs.create_file('/lib/Author/Book (1)/metadata.opf')
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        plan = MirrorPlan()
+        link_path = self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan)
+        assert link_path == '/mirror/Book/Book.epub'
+        assert [op.op for op in plan] == [MKDIR, LINK]
+        assert plan.operations[1].source == '/lib/Author/Book (1)/Book.kepub'
+
+    def test_book_without_source_format(self, fs):
+        """Test that books without the source format are not planned."""
+        fs.create_file('/lib/Author/Book (1)/metadata.opf')
+        fs.create_file('/lib/Author/Book (1)/Book.pdf')
+        plan = MirrorPlan()
+        assert self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan) is None
+        assert len(plan) == 0
+
+    def test_up_to_date_link_is_not_planned(self, fs):
+        """Test that an existing link to the same inode needs no operation."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        os.makedirs('/mirror/Book')
+        os.link('/lib/Author/Book (1)/Book.kepub', '/mirror/Book/Book.epub')
+        plan = MirrorPlan()
+        self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan)
+        assert len(plan) == 0
+
+    def test_stale_link_is_relinked(self, fs):
+        """Test that a target pointing at another inode is relinked."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        fs.create_file('/mirror/Book/Book.epub')
+        plan = MirrorPlan()
+        self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan)
+        assert [op.op for op in plan] == [MKDIR, RELINK]
+
+    def test_link_of_another_book_is_a_collision(self, fs):
+        """Test that an existing link to another library file is kept rather than relinked."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        fs.create_file('/lib/Other/Book (2)/Book.kepub')
+        os.makedirs('/mirror/Book')
+        os.link('/lib/Other/Book (2)/Book.kepub', '/mirror/Book/Book.epub')
+        plan = MirrorPlan()
+        assert self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan) is None
+        assert self.planner.collisions == 1 and len(plan) == 0
+        assert self.planner.plan_book('/lib/Other/Book (2)/metadata.opf', _parser('Book'), plan) == \
+            '/mirror/Book/Book.epub'
+
+    def test_prune_removes_unplanned_files(self, fs):
+        """Test that pruning removes only unplanned destination-format files."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        fs.create_file('/mirror/Gone/Gone.epub')
+        fs.create_file('/mirror/Gone/cover.jpg')
+        plan = MirrorPlan()
+        self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan)
+        self.planner.plan_prune(plan)
+        removals = [op.target for op in plan if op.op == REMOVE]
+        assert removals == ['/mirror/Gone/Gone.epub']
+
+
+class TestMirrorPlannerState:
+    """Tests for cleaning up previous links through the mirror state."""
+
+    def setup_method(self):
+        self.state = MirrorState()
+        self.planner = MirrorPlanner(LinkPathConstructor('/mirror', '.epub'), '.kepub', state=self.state)
+
+    def test_changed_path_removes_previous_link(self, fs):
+        """Test that a book whose link path changed loses its old link."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        fs.create_file('/mirror/Old/Old.epub')
+        self.state.set('1', '/mirror/Old/Old.epub')
+        plan = MirrorPlan()
+        self.planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan)
+        assert [(op.op, op.target) for op in plan] == [
+            (MKDIR, '/mirror/Book'), (LINK, '/mirror/Book/Book.epub'), (REMOVE, '/mirror/Old/Old.epub')]
+        assert self.state.get('1') == '/mirror/Book/Book.epub'
+
+    def test_departed_book_is_removed(self, fs):
+        fs.create_file('/mirror/Gone/Gone.epub')
+        self.state.set('7', '/mirror/Gone/Gone.epub')
+        plan = MirrorPlan()
+        self.planner.plan_departed('7', plan)
+        assert [op.op for op in plan] == [REMOVE]
+        assert '7' not in self.state
+
+    def test_path_taken_over_by_another_book_is_kept(self, fs):
+        """Test that an old path now owned by another book is not removed."""
+        fs.create_file('/mirror/Shared/Shared.epub')
+        self.state.set('7', '/mirror/Shared/Shared.epub')
+        self.state.set('8', '/mirror/Shared/Shared.epub')
+        plan = MirrorPlan()
+        self.planner.plan_departed('7', plan)
+        assert len(plan) == 0
+
+    def test_check_owners_treats_owned_path_as_collision(self, fs):
+        """Test that a partial run does not overwrite another book's link."""
+        fs.create_file('/lib/Author/Book (1)/Book.kepub')
+        self.state.set('2', '/mirror/Book/Book.epub')
+        planner = MirrorPlanner(LinkPathConstructor('/mirror', '.epub'), '.kepub', state=self.state, check_owners=True)
+        plan = MirrorPlan()
+        assert planner.plan_book('/lib/Author/Book (1)/metadata.opf', _parser('Book'), plan) is None
+        assert planner.collisions == 1 and len(plan) == 0
+
+
+class TestMirrorPlannerRenames:
+    """Tests for renaming links of books whose path changed."""
+
+    def setup_method(self):
+        self.state = MirrorState()
+        self.planner = MirrorPlanner(LinkPathConstructor('/mirror', '.epub'), '.kepub', state=self.state)
+
+    def _mirrored(self, fs, book_id, title, link_path):
+        source = f'/lib/Author/{title} ({book_id})/{title}.kepub'
+        fs.create_file(source)
+        os.makedirs(os.path.dirname(link_path), exist_ok=True)
+        os.link(source, link_path)
+        self.state.set(str(book_id), link_path)
+        return f'/lib/Author/{title} ({book_id})/metadata.opf'
+
+    def test_moved_link_is_renamed(self, fs):
+        """Test that a book's previous link is renamed rather than recreated."""
+        opf_path = self._mirrored(fs, 1, 'Book', '/mirror/Old/Old.epub')
+        plan = MirrorPlan()
+        self.planner.plan_book(opf_path, _parser('Book'), plan)
+        assert [(op.op, op.source, op.target) for op in plan] == [
+            (RENAME, '/mirror/Old/Old.epub', '/mirror/Book/Book.epub')]
+        assert self.state.get('1') == '/mirror/Book/Book.epub'
+
+    def test_series_rename_becomes_directory_rename(self, fs):
+        """Test that renames moving every file of a directory collapse into one."""
+        plan = MirrorPlan()
+        for i in (1, 2):
+            opf_path = self._mirrored(fs, i, f'Book {i}', f'/mirror/Saga/{i} - Book {i}.epub')
+            self.planner.plan_book(opf_path, _parser(f'Book {i}', 'New Saga', i), plan)
+        self.planner.plan_directory_renames(plan)
+        assert [(op.op, op.source, op.target) for op in plan] == [(RENAME, '/mirror/Saga', '/mirror/New Saga')]
+
+    def test_partial_move_keeps_file_renames(self, fs):
+        """Test that a directory with books staying behind is not renamed."""
+        plan = MirrorPlan()
+        opf_path = self._mirrored(fs, 1, 'Book 1', '/mirror/Saga/1 - Book 1.epub')
+        self._mirrored(fs, 2, 'Book 2', '/mirror/Saga/2 - Book 2.epub')
+        self.planner.plan_book(opf_path, _parser('Book 1', 'New Saga', 1), plan)
+        self.planner.plan_directory_renames(plan)
+        assert [(op.op, op.source, op.target) for op in plan] == [
+            (RENAME, '/mirror/Saga/1 - Book 1.epub', '/mirror/New Saga/1 - Book 1.epub')]
+
+    def test_replaced_source_is_relinked(self, fs):
+        """Test that an old link to a different file is removed, not renamed."""
+        opf_path = self._mirrored(fs, 1, 'Book', '/mirror/Old/Old.epub')
+        os.remove('/lib/Author/Book (1)/Book.kepub')
+        fs.create_file('/lib/Author/Book (1)/Book.kepub', contents='new')
+        plan = MirrorPlan()
+        self.planner.plan_book(opf_path, _parser('Book'), plan)
+        assert [op.op for op in plan] == [MKDIR, LINK, REMOVE]
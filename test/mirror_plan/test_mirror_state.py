@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from mirror_plan.mirror_state import MirrorState
+
+
+class TestMirrorState:
+    """Test class for MirrorState functionality."""
+
+    def test_round_trip(self, fs):
+        """Test that a saved state loads with the same links and owners."""
+        state = MirrorState('/state.json')
+        state.set('1', '/mirror/A/A.epub')
+        state.set('2', '/mirror/B/B.epub')
+        state.save()
+        loaded = MirrorState('/state.json')
+        assert sorted(loaded.book_ids()) == ['1', '2']
+        assert loaded.get('2') == '/mirror/B/B.epub'
+        assert loaded.owner('/mirror/A/A.epub') == '1'
+
+    def test_moving_a_book_updates_owner(self):
+        state = MirrorState()
+        state.set('1', '/mirror/A.epub')
+        state.set('1', '/mirror/B.epub')
+        assert state.owner('/mirror/A.epub') is None
+        assert state.owner('/mirror/B.epub') == '1'
+        state.discard('1')
+        assert len(state) == 0 and state.owner('/mirror/B.epub') is None
+
+    def test_no_path_does_not_save(self, fs):
+        MirrorState().save()
+        assert not fs.exists('/state.json')
+
+    @pytest.mark.parametrize('contents', ['not json', json.dumps({'version': 99, 'links': {}}), '[]'])
+    def test_invalid_file(self, fs, contents):
+        """Test that an unreadable state file is reported, not silently reset."""
+        fs.create_file('/state.json', contents=contents)
+        with pytest.raises(ValueError, match='/state.json'):
+            MirrorState('/state.json')
@@ -0,0 +1,234 @@
+import errno
+import os
+import threading
+import time
+
+from conftest import FakeClock
+from io_scheduler import AdaptiveConcurrencyController, AdaptiveExecutor
+from mirror_plan.mirror_plan import MirrorPlan
+from mirror_plan.plan_applier import PlanApplier
+from retry_queue import RetryQueue
+
+
+def _plan_link(source, target, relink=False):
+    plan = MirrorPlan()
+    plan.add_link(source, target, os.stat(source), relink=relink)
+    return plan
+
+
+class TestPlanApplier:
+    """Test class for PlanApplier functionality."""
+
+    def test_apply_link(self, fs):
+        """Test that a valid plan creates directories and hard links."""
+        fs.create_file('/lib/a.kepub', contents='book')
+        summary = PlanApplier().apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub'))
+        assert os.stat('/mirror/A/A.epub').st_ino == os.stat('/lib/a.kepub').st_ino
+        assert summary == {'applied': 2, 'skipped': 0, 'stale': 0, 'failed': 0}
+
+    def test_dry_run_touches_nothing(self, fs):
+        """Test that dry run only prints the plan."""
+        fs.create_file('/lib/a.kepub')
+        summary = PlanApplier(dry_run=True).apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub'))
+        assert not os.path.exists('/mirror')
+        assert summary['applied'] == 2
+
+    def test_existing_target_is_skipped(self, fs):
+        """Test that links never overwrite an existing file."""
+        fs.create_file('/lib/a.kepub', contents='book')
+        fs.create_file('/mirror/A/A.epub', contents='other')
+        summary = PlanApplier().apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub'))
+        assert summary['skipped'] == 1
+        with open('/mirror/A/A.epub') as f:
+            assert f.read() == 'other'
+
+    def test_stale_source_is_skipped(self, fs):
+        """Test that a source replaced after planning is not linked."""
+        fs.create_file('/lib/a.kepub', contents='book')
+        plan = _plan_link('/lib/a.kepub', '/mirror/A/A.epub')
+        os.remove('/lib/a.kepub')
+        fs.create_file('/lib/a.kepub', contents='replaced')
+        summary = PlanApplier().apply(plan)
+        assert summary['stale'] == 1
+        assert not os.path.exists('/mirror/A/A.epub')
+
+    def test_relink_replaces_target(self, fs):
+        """Test that relinks point the target at the new source."""
+        fs.create_file('/lib/a.kepub', contents='book')
+        fs.create_file('/mirror/A/A.epub', contents='old')
+        PlanApplier().apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub', relink=True))
+        assert os.stat('/mirror/A/A.epub').st_ino == os.stat('/lib/a.kepub').st_ino
+        assert os.listdir('/mirror/A') == ['A.epub']
+
+    def test_remove_revalidates_target(self, fs):
+        """Test that removals only delete the file that was planned."""
+        fs.create_file('/mirror/A/A.epub')
+        fs.create_file('/mirror/B/B.epub')
+        plan = MirrorPlan()
+        plan.add_remove('/mirror/A/A.epub', os.stat('/mirror/A/A.epub'))
+        plan.add_remove('/mirror/B/B.epub', os.stat('/mirror/B/B.epub'))
+        os.remove('/mirror/B/B.epub')
+        fs.create_file('/mirror/B/B.epub', contents='new')
+        summary = PlanApplier().apply(plan)
+        assert not os.path.exists('/mirror/A/A.epub')
+        assert os.path.exists('/mirror/B/B.epub')
+        assert summary == {'applied': 1, 'skipped': 0, 'stale': 1, 'failed': 0}
+
+    def test_apply_with_executor(self, fs):
+        """Test that links run through an adaptive executor after directories exist."""
+        plan = MirrorPlan()
+        for i in range(20):
+            source = f'/lib/{i}.kepub'
+            fs.create_file(source)
+            plan.add_link(source, f'/mirror/{i % 3}/{i}.epub', os.stat(source))
+        executor = AdaptiveExecutor(AdaptiveConcurrencyController(max_concurrency=4, initial_concurrency=4))
+        summary = PlanApplier(executor=executor).apply(plan)
+        assert summary == {'applied': 23, 'skipped': 0, 'stale': 0, 'failed': 0}
+        assert sorted(os.listdir('/mirror/0')) == sorted(f'{i}.epub' for i in range(0, 20, 3))
+
+    def test_apply_with_workers(self, fs):
+        """Test that a worker pool applies every directory's operations."""
+        plan = MirrorPlan()
+        for i in range(20):
+            source = f'/lib/{i}.kepub'
+            fs.create_file(source)
+            plan.add_link(source, f'/mirror/A{i % 4}/S{i % 3}/{i}.epub', os.stat(source))
+        summary = PlanApplier(workers=4).apply(plan)
+        assert summary == {'applied': 32, 'skipped': 0, 'stale': 0, 'failed': 0}
+        assert sorted(os.listdir('/mirror/A0/S0')) == ['0.epub', '12.epub']
+
+    def test_directory_order_is_preserved(self, fs):
+        """Test that a removal and a link of the same path run in plan order."""
+        fs.create_file('/lib/a.kepub', contents='book')
+        fs.create_file('/mirror/A/A.epub', contents='old')
+        plan = MirrorPlan()
+        plan.add_remove('/mirror/A/A.epub', os.stat('/mirror/A/A.epub'))
+        plan.add_link('/lib/a.kepub', '/mirror/A/A.epub', os.stat('/lib/a.kepub'))
+        for i in range(10):
+            fs.create_file(f'/lib/{i}.kepub')
+            plan.add_link(f'/lib/{i}.kepub', f'/mirror/B{i}/{i}.epub', os.stat(f'/lib/{i}.kepub'))
+        summary = PlanApplier(workers=4).apply(plan)
+        assert summary['failed'] == summary['skipped'] == 0
+        assert os.stat('/mirror/A/A.epub').st_ino == os.stat('/lib/a.kepub').st_ino
+
+    def test_directories_run_concurrently(self, fs, monkeypatch):
+        """Test that slow links in different directories overlap."""
+        plan = MirrorPlan()
+        for i in range(8):
+            fs.create_file(f'/lib/{i}.kepub')
+            plan.add_link(f'/lib/{i}.kepub', f'/mirror/{i}/{i}.epub', os.stat(f'/lib/{i}.kepub'))
+        link = os.link
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_link(source, target):
+            with lock:
+                in_flight.append(target)
+                peak.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.remove(target)
+            link(source, target)
+
+        monkeypatch.setattr(os, 'link', slow_link)
+        PlanApplier(workers=8).apply(plan)
+        assert max(peak) > 1
+
+    def test_failures_are_collected(self, fs, monkeypatch, capsys):
+        """Test that a failed operation is reported without stopping the rest of the plan."""
+        plan = MirrorPlan()
+        for name in ('a', 'b', 'c'):
+            fs.create_file(f'/lib/{name}.kepub')
+            plan.add_link(f'/lib/{name}.kepub', f'/mirror/{name}/{name}.epub', os.stat(f'/lib/{name}.kepub'))
+        link = os.link
+
+        def flaky_link(source, target):
+            if target.endswith('b.epub'):
+                raise OSError(errno.EIO, 'Input/output error')
+            link(source, target)
+
+        monkeypatch.setattr(os, 'link', flaky_link)
+        applier = PlanApplier(workers=2)
+        summary = applier.apply(plan)
+        assert summary == {'applied': 5, 'skipped': 0, 'stale': 0, 'failed': 1}
+        assert os.path.exists('/mirror/a/a.epub') and os.path.exists('/mirror/c/c.epub')
+        assert [op.target for op, error in applier.failures] == ['/mirror/b/b.epub']
+        applier.report()
+        assert '1 operations failed' in capsys.readouterr().out
+
+    def test_rename_moves_entry(self, fs):
+        """Test that renames keep the inode and create the new parent directory."""
+        fs.create_file('/mirror/Saga/1 - A.epub')
+        ino = os.stat('/mirror/Saga').st_ino
+        plan = MirrorPlan()
+        plan.add_rename('/mirror/Saga', '/mirror/New/Saga', os.stat('/mirror/Saga'))
+        summary = PlanApplier(workers=2).apply(plan)
+        assert summary['applied'] == 1
+        assert os.stat('/mirror/New/Saga').st_ino == ino
+        assert not os.path.exists('/mirror/Saga')
+
+    def test_rename_never_overwrites(self, fs):
+        """Test that a rename onto a path that appeared after planning is skipped."""
+        fs.create_file('/mirror/A/A.epub', contents='book')
+        plan = MirrorPlan()
+        plan.add_rename('/mirror/A/A.epub', '/mirror/B/B.epub', os.stat('/mirror/A/A.epub'))
+        fs.create_file('/mirror/B/B.epub', contents='other')
+        summary = PlanApplier().apply(plan)
+        assert summary['skipped'] == 1
+        assert os.path.exists('/mirror/A/A.epub')
+
+    def _flaky(self, monkeypatch, name, fail_times, code=errno.EIO):
+        """Make ``os.<name>`` fail ``fail_times`` times per path before working."""
+        real = getattr(os, name)
+        failures = {}
+
+        def flaky(path, *args, **kwargs):
+            target = args[0] if name == 'link' else path
+            if failures.get(target, 0) < fail_times:
+                failures[target] = failures.get(target, 0) + 1
+                raise OSError(code, os.strerror(code), target)
+            return real(path, *args, **kwargs)
+
+        monkeypatch.setattr(os, name, flaky)
+        return failures
+
+    def test_transient_failure_is_retried(self, fs, monkeypatch):
+        """Test that a flaky link is set aside and applied by finish, after the others."""
+        plan = MirrorPlan()
+        for name in ('a', 'b', 'c'):
+            fs.create_file(f'/lib/{name}.kepub')
+            plan.add_link(f'/lib/{name}.kepub', f'/mirror/S/{name}.epub', os.stat(f'/lib/{name}.kepub'))
+        fs.create_file('/lib/d.kepub')
+        plan.add_link('/lib/d.kepub', '/mirror/T/d.epub', os.stat('/lib/d.kepub'))
+        self._flaky(monkeypatch, 'link', 2)
+        clock = FakeClock()
+        applier = PlanApplier(retries=RetryQueue(clock=clock, sleep=clock.sleep))
+        applier.apply(plan)
+        assert not os.path.exists('/mirror/S/a.epub')
+        applier.finish()
+        assert sorted(os.listdir('/mirror/S')) == ['a.epub', 'b.epub', 'c.epub']
+        assert applier.summary == {'applied': 6, 'skipped': 0, 'stale': 0, 'failed': 0}
+
+    def test_directory_retry_carries_its_links(self, fs, monkeypatch):
+        """Test that links into a directory that could not be created wait for it."""
+        fs.create_file('/lib/a.kepub')
+        self._flaky(monkeypatch, 'makedirs', 1, errno.ESTALE)
+        clock = FakeClock()
+        applier = PlanApplier(workers=2, retries=RetryQueue(clock=clock, sleep=clock.sleep))
+        applier.apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub'))
+        assert applier.summary['failed'] == 0 and not os.path.exists('/mirror/A')
+        applier.finish()
+        assert os.path.exists('/mirror/A/A.epub')
+
+    def test_retries_are_bounded(self, fs, monkeypatch, capsys):
+        """Test that an operation that keeps failing ends up reported as failed."""
+        fs.create_file('/lib/a.kepub')
+        self._flaky(monkeypatch, 'link', 100)
+        clock = FakeClock()
+        applier = PlanApplier(retries=RetryQueue(max_attempts=3, clock=clock, sleep=clock.sleep))
+        applier.apply(_plan_link('/lib/a.kepub', '/mirror/A/A.epub'))
+        applier.finish()
+        assert applier.summary['failed'] == 1 and applier.retries.retries == 2
+        applier.report()
+        assert "1 operations failed {'EIO': 1}" in capsys.readouterr().out
@@ -90,3 +90,36 @@ def test_title(contents, result):
 def test_author(contents, result):
     parser = OPFParser(contents)
     assert parser.get_author() == result
+
+
+def test_authors():
+    parser = OPFParser(HAS_EXT_LIB)
+    assert parser.get_authors() == ['Archie Goodwin', 'Chris Claremont', 'Gerry Conway', 'Roy Thomas',
+                                    'Steve Englehart', 'Steve Gerber', 'Tony Isabella']
+
+
+def test_languages():
+    assert OPFParser(HAS_EXT_LIB).get_languages() == ['en']
+
+
+def test_custom_columns():
+    columns = OPFParser(HAS_EXT_LIB).get_custom_columns()
+    assert columns == {'#comic_volume': '2021', '#ext_library': ['test-ext-lib'], '#pages': 474,
+                       '#source': ['Mylar'], '#type': 'Comic Collection'}
+
+
+@pytest.mark.parametrize("contents", [None, '', 'None'])
+def test_list_getters_without_metadata(contents):
+    parser = OPFParser(contents)
+    assert parser.get_authors() == [] and parser.get_tags() == [] and parser.get_custom_columns() == {}
+
+
+@pytest.mark.parametrize("contents, error", [
+    (HAS_EXT_LIB, False),
+    ('', True),
+    ('<package><metadata>', True),
+])
+def test_parse_error_is_reported(contents, error):
+    parser = OPFParser(contents)
+    assert parser.get_title() is None or not error
+    assert (parser.error is not None) == error
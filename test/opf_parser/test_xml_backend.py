@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from opf_parser import xml_backend
+from opf_parser.opf_parser import OPFParser
+from opf_parser.xml_backend import ElementTreeBackend, get_backend
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURES = sorted(os.listdir(FIXTURES_DIR))
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _extract_all(parser):
+    return {
+        'title': parser.get_title(),
+        'author': parser.get_author(),
+        'authors': parser.get_authors(),
+        'series': parser.get_series(),
+        'series_index': parser.get_series_index(),
+        'tags': parser.get_tags(),
+        'languages': parser.get_languages(),
+        'custom_columns': parser.get_custom_columns(),
+        'in_ext_lib': parser.in_ext_lib('test-ext-lib'),
+        'identifier': getattr(parser.extract_element('.//{http://purl.org/dc/elements/1.1/}identifier'), 'text', None),
+    }
+
+
+@pytest.mark.parametrize('fixture', FIXTURES)
+def test_lxml_matches_etree(fixture):
+    """Test that both backends extract identical metadata from every fixture."""
+    pytest.importorskip('lxml')
+    contents = _read_fixture(fixture)
+    expected = _extract_all(OPFParser(contents, get_backend('etree')))
+    assert _extract_all(OPFParser(contents, get_backend('lxml'))) == expected
+
+
+@pytest.mark.parametrize('backend', ['etree', 'lxml'])
+def test_fixture_values(backend):
+    """Test the extracted values themselves, not only backend agreement."""
+    if backend == 'lxml':
+        pytest.importorskip('lxml')
+    values = _extract_all(OPFParser(_read_fixture('unicode_entities.opf'), get_backend(backend)))
+    assert values['title'] == 'Ælfric’s “Grammar” <annotated> & more'
+    assert values['tags'] == ['Old English', 'Ünïcödé']
+    assert values['custom_columns'] == {'#ext_library': ['test-ext-lib', 'ångström']}
+    truncated = _extract_all(OPFParser(_read_fixture('truncated.opf'), get_backend(backend)))
+    assert truncated['title'] is None and truncated['custom_columns'] == {} and not truncated['in_ext_lib']
+    declared = _extract_all(OPFParser(_read_fixture('latin1_declaration.opf'), get_backend(backend)))
+    assert declared['title'] == 'Café Müller' and declared['authors'] == ['Günter Grass']
+    entities = _extract_all(OPFParser(_read_fixture('internal_entity.opf'), get_backend(backend)))
+    assert entities['title'] == 'Dune (Gollancz edition)' and entities['tags'] == ['Gollancz']
+    assert entities['series'] == 'The Gollancz Masterworks'
+
+
+@pytest.mark.parametrize('backend', ['etree', 'lxml'])
+def test_external_entities_are_not_loaded(backend, tmp_path):
+    """Test that an entity referring to a file is rejected rather than read."""
+    if backend == 'lxml':
+        pytest.importorskip('lxml')
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('secret')
+    contents = _read_fixture('internal_entity.opf').replace('"Gollancz"', f'SYSTEM "{secret.as_uri()}"')
+    assert OPFParser(contents, get_backend(backend)).get_title() is None
+
+
+def test_lxml_backend_is_thread_safe():
+    """Test that threads sharing the backend each get consistent results."""
+    pytest.importorskip('lxml')
+    backend = get_backend('lxml')
+    contents = [_read_fixture(name) for name in FIXTURES] * 50
+    expected = [_extract_all(OPFParser(c, get_backend('etree'))) for c in contents]
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(lambda c: _extract_all(OPFParser(c, backend)), contents)) == expected
+
+
+def test_auto_falls_back_to_etree(monkeypatch):
+    """Test that auto selects ElementTree when lxml is not installed."""
+    monkeypatch.setattr(xml_backend, 'lxml_etree', None)
+    monkeypatch.setattr(xml_backend, '_instances', {})
+    assert isinstance(get_backend(), ElementTreeBackend)
+    with pytest.raises(ImportError):
+        get_backend('lxml')
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend('sax')
+
+
+def test_backends_agree_on_named_elements():
+    """Test that the root element is not reported as a named element by either backend."""
+    pytest.importorskip('lxml')
+    contents = _read_fixture('latin1_declaration.opf')
+    names = [[name for name, content in backend.named_elements(backend.parse(contents))]
+             for backend in (get_backend('etree'), get_backend('lxml'))]
+    assert names[0] == names[1] == ['calibre:series', 'calibre:user_metadata:#ext_library']
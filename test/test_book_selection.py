@@ -0,0 +1,131 @@
+import pytest
+
+from calibre_library.book_catalog import BookCatalog, BookRecord
+from calibre_library.book_selection import ExtLibrarySelection, Selection, SelectionError, compile_selection
+from opf_parser.opf_parser import OPFParser
+from conftest import make_opf
+
+
+def _record(book_id, title, files=('book.kepub',), **opf_fields):
+    opf_path = f'/library/Author/{title} ({book_id})/metadata.opf'
+    return BookRecord.from_opf(opf_path, OPFParser(make_opf(book_id, title, **opf_fields)), files)
+
+
+class CountingCatalog(BookCatalog):
+    """Records how many books each selection had to look at."""
+
+    examined = 0
+
+    def __iter__(self):
+        for record in super().__iter__():
+            self.examined += 1
+            yield record
+
+    def records(self, book_ids):
+        records = super().records(book_ids)
+        self.examined += len(records)
+        return records
+
+
+@pytest.fixture
+def catalog():
+    return CountingCatalog([
+        _record(1, 'Hulk', tags=['Comics', 'Marvel'], series='Hulk Epic', series_index=6,
+                custom_columns={'#genre': ['Superhero'], '#pages': 474}),
+        _record(2, 'Akira', files=('book.cbz', 'cover.jpg', 'metadata.opf'), tags=['Manga'],
+                authors=['Katsuhiro Otomo'], languages=['ja', 'en'], ext_libs=['other-lib']),
+        _record(3, 'Dune', files=('book.epub', 'book.kepub'), tags=['Science Fiction'],
+                authors=['Frank Herbert'], custom_columns={'#read': True}),
+        _record(4, 'Le Petit Prince', tags=['Classics'], languages=['fr'], ext_libs=None),
+    ])
+
+
+def _titles(records):
+    return [r.title for r in records]
+
+
+class TestBookRecord:
+    """Tests for reading selectable metadata from an OPF."""
+
+    def test_from_opf(self, catalog):
+        """Test that every field and custom column is read."""
+        record = catalog.records({'2'})[0]
+        assert record.authors == ('Katsuhiro Otomo',)
+        assert record.languages == ('ja', 'en')
+        assert record.formats == ('.cbz',)
+        assert record.custom == {'#ext_library': ['other-lib']}
+        assert record.get_author() == 'Katsuhiro Otomo'
+
+    def test_empty_custom_columns_are_dropped(self):
+        """Test that null and empty-list columns are not recorded."""
+        record = _record(5, 'Empty', custom_columns={'#genre': [], '#pages': None}, ext_libs=None)
+        assert record.custom == {}
+        assert record.values('#genre') == ()
+
+
+class TestSelection:
+    """Tests for compiling and evaluating select specs."""
+
+    def test_field_is_case_insensitive(self, catalog):
+        """Test that values match regardless of case, as in Calibre's search."""
+        assert _titles(compile_selection({'tags': 'marvel'}).select(catalog)) == ['Hulk']
+
+    def test_field_list_matches_any_value(self, catalog):
+        """Test that a list of values selects books with any of them."""
+        assert _titles(compile_selection({'tags': ['Manga', 'Classics']}).select(catalog)) == ['Akira', 'Le Petit Prince']
+
+    def test_formats_with_or_without_dot(self, catalog):
+        """Test that formats are matched by extension."""
+        assert _titles(compile_selection({'formats': 'epub'}).select(catalog)) == ['Dune']
+        assert _titles(compile_selection({'formats': '.CBZ'}).select(catalog)) == ['Akira']
+
+    def test_custom_columns(self, catalog):
+        """Test scalar, list and boolean custom column values."""
+        assert _titles(compile_selection({'#genre': 'superhero'}).select(catalog)) == ['Hulk']
+        assert _titles(compile_selection({'#pages': 474}).select(catalog)) == ['Hulk']
+        assert _titles(compile_selection({'#read': True}).select(catalog)) == ['Dune']
+
+    def test_boolean_combinations(self, catalog):
+        """Test all, any, not and implicit conjunction of mapping keys."""
+        spec = {'any': [{'tags': 'Manga'}, {'languages': 'fr'}], 'not': {'#ext_library': 'other-lib'}}
+        assert _titles(compile_selection(spec).select(catalog)) == ['Le Petit Prince']
+        spec = [{'languages': 'en'}, {'not': {'tags': ['Comics', 'Manga']}}]
+        assert _titles(compile_selection(spec).select(catalog)) == ['Dune']
+
+    def test_indexed_selection_examines_only_candidates(self, catalog):
+        """Test that an indexed clause limits the books that are evaluated."""
+        selection = compile_selection({'all': [{'authors': 'Frank Herbert'}, {'not': {'languages': 'fr'}}]})
+        assert _titles(selection.select(catalog)) == ['Dune']
+        assert catalog.examined == 1
+
+    def test_any_with_unindexed_branch_falls_back_to_all_books(self, catalog):
+        """Test that a branch the indexes cannot answer forces a full pass."""
+        selection = compile_selection({'any': [{'tags': 'Manga'}, {'not': {'languages': 'en'}}]})
+        assert _titles(selection.select(catalog)) == ['Akira', 'Le Petit Prince']
+        assert catalog.examined == len(catalog)
+
+    def test_missing_value_selects_nothing(self, catalog):
+        """Test that an unknown value yields no candidates."""
+        assert compile_selection({'series': 'Nope', 'not': {'tags': 'x'}}).select(catalog) == []
+        assert catalog.examined == 0
+
+    def test_ext_library_default_keeps_original_matching(self):
+        """Test that ext_lib_name matches list members and substrings of text columns, case-sensitively."""
+        text = _record(5, 'Text', ext_libs=None, custom_columns={'#ext_library': 'Kobo, Kindle'})
+        listed = _record(6, 'Listed', ext_libs=['Kobo', 'Kindle'])
+        assert ExtLibrarySelection('Kobo').matches(text) and ExtLibrarySelection('Kobo').matches(listed)
+        assert not ExtLibrarySelection('kobo').matches(text)
+        assert not ExtLibrarySelection('Kob').matches(listed)
+        assert not ExtLibrarySelection('Kobo').matches(_record(7, 'None', ext_libs=None))
+
+    def test_selection_is_abstract(self):
+        with pytest.raises(TypeError):
+            Selection()
+
+    @pytest.mark.parametrize('spec', [
+        {}, [], 'tags', {'title': 'Dune'}, {'tags': []}, {'tags': None}, {'any': {'tags': 'x'}}, {'#': 'x'},
+    ])
+    def test_invalid_specs(self, spec):
+        """Test that malformed specs are rejected when compiled."""
+        with pytest.raises(SelectionError):
+            compile_selection(spec)
@@ -1,9 +1,10 @@
 import os
+import sqlite3
 from pathlib import Path
 
 import pytest
 
-from calibre_library.calibre_library import CalibreLibrary
+from calibre_library.calibre_library import CalibreLibrary, UnknownBookError
 
 FAKE_TEST_ROOT = '/fake/test/root'
 
@@ -209,3 +210,98 @@ def test_one(fs):
     fs.create_file(os.path.join(FAKE_TEST_ROOT, 'metadata.opf'))
     lib = CalibreLibrary(FAKE_TEST_ROOT)
     assert ['/fake/test/root/metadata.opf'] == lib.list_all_opf()
+
+
+class TestCalibreLibraryIterators:
+    """Tests for the generator APIs."""
+
+    def test_iter_opf_is_lazy(self, fs):
+        """Test that iter_opf yields before the walk is finished."""
+        for i in range(3):
+            fs.create_file(os.path.join(FAKE_TEST_ROOT, f'book{i}', 'metadata.opf'))
+        walked = CalibreLibrary(FAKE_TEST_ROOT).iter_opf()
+        first = next(walked)
+        assert first.endswith('metadata.opf')
+        assert sorted([first] + list(walked)) == sorted(CalibreLibrary(FAKE_TEST_ROOT).list_all_opf())
+
+    def test_iter_books_parses_each_opf(self, fs, make_book):
+        """Test that iter_books pairs each path with a parser."""
+        make_book(FAKE_TEST_ROOT, 7, 'Seven')
+        books = list(CalibreLibrary(FAKE_TEST_ROOT).iter_books())
+        assert len(books) == 1
+        path, parser = books[0]
+        assert path == os.path.join(FAKE_TEST_ROOT, 'Test Author', 'Seven (7)', 'metadata.opf')
+        assert parser.get_title() == 'Seven'
+
+    def test_book_id_from_directory_name(self):
+        """Test that Calibre ids are read from 'Title (id)' directories."""
+        assert CalibreLibrary.book_id('/lib/Author/Title (123)/metadata.opf') == '123'
+        assert CalibreLibrary.book_id('/lib/Author/Untitled/metadata.opf') == '/lib/Author/Untitled'
+
+
+class TestResolveBook:
+    """Tests for finding single books without walking the library."""
+
+    def test_id_from_metadata_db(self, tmp_path, make_book):
+        """Test that ids are looked up in Calibre's metadata.db."""
+        root = str(tmp_path)
+        opf_path = make_book(root, 12, 'Twelve')
+        with sqlite3.connect(os.path.join(root, 'metadata.db')) as db:
+            db.execute('CREATE TABLE books (id INTEGER PRIMARY KEY, path TEXT)')
+            db.execute("INSERT INTO books VALUES (12, 'Test Author/Twelve (12)')")
+        db.close()
+        lib = CalibreLibrary(root)
+        assert lib.resolve_book('12') == ('12', opf_path)
+        assert lib.resolve_book('13') == ('13', None)
+
+    def test_id_from_walk_cache(self, tmp_path, make_book):
+        """Test that the walk cache stands in for a missing metadata.db."""
+        root = str(tmp_path / 'library')
+        opf_path = make_book(root, 5, 'Five')
+        lib = CalibreLibrary(root, walk_cache_path=str(tmp_path / 'walk.json'), walk_trust_mtimes=True)
+        with pytest.raises(UnknownBookError):
+            lib.resolve_book('5')
+        lib.list_all_opf()
+        assert lib.resolve_book('5') == ('5', opf_path)
+        with pytest.raises(UnknownBookError):
+            lib.resolve_book('6')
+
+    def test_unknown_id_is_not_deleted(self, tmp_path, make_book):
+        """Test that an id is only reported gone when metadata.db says so."""
+        root = str(tmp_path)
+        with pytest.raises(UnknownBookError, match='neither a metadata.db nor the walk cache'):
+            CalibreLibrary(root).resolve_book('7')
+        with open(os.path.join(root, 'metadata.db'), 'w') as f:
+            f.write('not a database')
+        with pytest.raises(UnknownBookError, match='Could not look up book 7'):
+            CalibreLibrary(root).resolve_book('7')
+
+    def test_paths(self, fs, make_book):
+        """Test that book directories, files in them and OPFs all resolve to the book."""
+        opf_path = make_book(FAKE_TEST_ROOT, 3, 'Three')
+        book_dir = os.path.dirname(opf_path)
+        lib = CalibreLibrary(FAKE_TEST_ROOT)
+        for target in (book_dir, opf_path, os.path.join(book_dir, 'Three.kepub')):
+            assert lib.resolve_book(target) == ('3', opf_path)
+        assert lib.resolve_book(os.path.join(FAKE_TEST_ROOT, 'Test Author', 'Gone (4)')) == ('4', None)
+        assert lib.resolve_book('/elsewhere/Book (3)') is None
+        assert lib.resolve_book(FAKE_TEST_ROOT) is None
+
+
+class TestBookMtimes:
+    """Tests for listing when each book last changed."""
+
+    def test_from_metadata_db(self, tmp_path):
+        """Test that metadata.db's last_modified is used without walking the library."""
+        root = str(tmp_path)
+        with sqlite3.connect(os.path.join(root, 'metadata.db')) as db:
+            db.execute('CREATE TABLE books (id INTEGER PRIMARY KEY, path TEXT, last_modified TIMESTAMP)')
+            db.execute("INSERT INTO books VALUES (12, 'Test Author/Twelve (12)', '2024-05-01 12:00:00.5+00:00')")
+        db.close()
+        mtimes = CalibreLibrary(root).book_mtimes()
+        assert mtimes == {os.path.join(root, 'Test Author/Twelve (12)/metadata.opf'): 1714564800_500000000}
+
+    def test_from_opf_mtimes(self, fs, make_book):
+        opf_path = make_book(FAKE_TEST_ROOT, 3, 'Three')
+        os.utime(opf_path, ns=(5, 42))
+        assert CalibreLibrary(FAKE_TEST_ROOT).book_mtimes() == {opf_path: 42}
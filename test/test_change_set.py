@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from conftest import StubServer
+from change_set import ChangeSet, HttpNotifier, build_notifier
+from mirror_plan.mirror_plan import LINK, MKDIR, RELINK, REMOVE, RENAME, PlanOperation
+
+
+@pytest.fixture
+def stub_server():
+    with StubServer() as server:
+        yield server
+
+
+def _changes():
+    changes = ChangeSet('/mirror')
+    changes.record(PlanOperation(MKDIR, '/mirror/Saga'))
+    changes.record(PlanOperation(LINK, '/mirror/Saga/1 - A.epub', '/lib/a.kepub'))
+    changes.record(PlanOperation(RELINK, '/mirror/Saga/2 - B.epub', '/lib/b.kepub'))
+    changes.record(PlanOperation(REMOVE, '/mirror/Gone/Gone.epub'))
+    changes.record(PlanOperation(RENAME, '/mirror/New Title/New Title.epub', '/mirror/Old Title/Old Title.epub'))
+    return changes
+
+
+class TestChangeSet:
+    """Tests for collecting a run's changes by top-level folder."""
+
+    def test_changes_are_grouped_by_folder(self):
+        data = _changes().to_dict()
+        rename = {'from': 'Old Title/Old Title.epub', 'to': 'New Title/New Title.epub'}
+        assert data['folders'] == {
+            'Gone': {'added': [], 'removed': ['Gone/Gone.epub'], 'renamed': []},
+            'New Title': {'added': [], 'removed': [], 'renamed': [rename]},
+            'Old Title': {'added': [], 'removed': [], 'renamed': [rename]},
+            'Saga': {'added': ['Saga/1 - A.epub', 'Saga/2 - B.epub'], 'removed': [], 'renamed': []},
+        }
+
+    def test_folders_can_be_remapped(self):
+        """Test that folders are reported where the downstream server mounts the mirror."""
+        changes = _changes()
+        assert changes.folders()[0] == '/mirror/Gone'
+        assert changes.folders('/books') == ['/books/Gone', '/books/New Title', '/books/Old Title', '/books/Saga']
+
+    def test_directory_rename_within_folder_counts_once(self):
+        changes = ChangeSet('/mirror')
+        changes.record(PlanOperation(RENAME, '/mirror/Author/New Saga', '/mirror/Author/Saga'))
+        assert list(changes.to_dict()['folders']) == ['Author']
+        assert len(changes) == 1
+
+    def test_write(self, fs):
+        fs.create_dir('/state')
+        _changes().write('/state/changes.json')
+        with open('/state/changes.json', encoding='utf-8') as f:
+            assert json.load(f) == _changes().to_dict()
+        assert os.listdir('/state') == ['changes.json']
+
+
+class TestHttpNotifier:
+    """Tests for posting changed folders to a local endpoint."""
+
+    def test_notify_posts_folders(self, stub_server):
+        HttpNotifier(stub_server.url, mirror_path='/books', headers={'X-Api-Key': 'secret'}).notify(_changes())
+        [(path, headers, body)] = stub_server.requests
+        assert path == '/rescan'
+        assert headers['X-Api-Key'] == 'secret'
+        assert body['folders'] == ['/books/Gone', '/books/New Title', '/books/Old Title', '/books/Saga']
+        assert body['changes'] == _changes().to_dict()
+
+    def test_error_status_raises(self):
+        with StubServer(status=500) as server:
+            with pytest.raises(OSError):
+                HttpNotifier(server.url).notify(_changes())
+
+    def test_build_notifier(self):
+        notifier = build_notifier({'url': 'http://127.0.0.1:9/rescan', 'timeout': 2})
+        assert isinstance(notifier, HttpNotifier) and notifier.timeout == 2
+        with pytest.raises(ValueError, match='Unknown notifier type'):
+            build_notifier({'type': 'carrier-pigeon'})
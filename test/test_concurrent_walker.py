@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+from calibre_library.calibre_library import CalibreLibrary
+from calibre_library.concurrent_walker import ConcurrentWalker
+
+FAKE_TEST_ROOT = '/fake/test/root'
+
+
+class SlowWalker(ConcurrentWalker):
+    """Walker that simulates a network round trip per directory listing."""
+
+    def __init__(self, *args, latency=0.02, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def list_dir(self, path):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        try:
+            return super().list_dir(path)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _create_library(root, authors=10, books=3):
+    expected = []
+    for a in range(authors):
+        for b in range(books):
+            book_dir = os.path.join(root, f'Author {a}', f'Book {b} ({a * books + b})')
+            os.makedirs(book_dir)
+            for name in ('metadata.opf', 'book.kepub', 'cover.jpg'):
+                with open(os.path.join(book_dir, name), 'w'):
+                    pass
+            expected.append(os.path.join(book_dir, 'metadata.opf'))
+    return expected
+
+
+class TestConcurrentWalker:
+    """Test class for ConcurrentWalker functionality."""
+
+    def test_empty_path(self):
+        """Test that an empty path yields nothing."""
+        assert [] == list(ConcurrentWalker('').iter_opf())
+
+    def test_nonexistent_path(self):
+        """Test that a nonexistent path yields nothing."""
+        assert [] == list(ConcurrentWalker('/nonexistent/path').iter_opf())
+
+    def test_finds_same_files_as_os_walk(self, fs):
+        """Test that the walker finds exactly what the sequential walk finds."""
+        expected = _create_library(FAKE_TEST_ROOT)
+        fs.create_file(os.path.join(FAKE_TEST_ROOT, 'metadata.opf'))
+        fs.create_file(os.path.join(FAKE_TEST_ROOT, 'Author 0', 'metadata.opf.bak'))
+        expected.append(os.path.join(FAKE_TEST_ROOT, 'metadata.opf'))
+
+        result = list(ConcurrentWalker(FAKE_TEST_ROOT, max_workers=4).iter_opf())
+        assert sorted(expected) == sorted(result)
+        assert sorted(CalibreLibrary(FAKE_TEST_ROOT).list_all_opf()) == sorted(result)
+
+    def test_library_uses_walker_when_configured(self, fs):
+        """Test that CalibreLibrary walks concurrently with scan_workers > 1."""
+        expected = _create_library(FAKE_TEST_ROOT)
+        lib = CalibreLibrary(FAKE_TEST_ROOT, scan_workers=4)
+        assert sorted(expected) == sorted(lib.list_all_opf())
+
+    def test_respects_max_in_flight(self, tmp_path):
+        """Test that no more than max_in_flight listings run at once."""
+        _create_library(str(tmp_path), authors=12, books=2)
+        walker = SlowWalker(str(tmp_path), max_workers=8, max_in_flight=3, latency=0.005)
+        assert len(list(walker.iter_opf())) == 24
+        assert walker.peak_in_flight <= 3
+
+    def test_latency_bound_walk_speeds_up(self, tmp_path):
+        """Test that concurrency hides per-listing latency."""
+        expected = _create_library(str(tmp_path), authors=16, books=2)
+
+        start = time.perf_counter()
+        sequential = list(SlowWalker(str(tmp_path), max_workers=1).iter_opf())
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = list(SlowWalker(str(tmp_path), max_workers=8).iter_opf())
+        concurrent_time = time.perf_counter() - start
+
+        assert sorted(sequential) == sorted(concurrent) == sorted(expected)
+        assert concurrent_time < sequential_time / 3
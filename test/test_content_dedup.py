@@ -0,0 +1,121 @@
+import errno
+import os
+
+import pytest
+
+from content_dedup import ContentHashCache, file_digest, find_duplicates
+
+
+class CountingHasher:
+    def __init__(self):
+        self.hashed = []
+
+    def __call__(self, path):
+        self.hashed.append(path)
+        return file_digest(path)
+
+
+def _book(fs, book_id, contents, mtime_ns=None):
+    path = f'/library/{book_id}/book.kepub'
+    fs.create_file(path, contents=contents)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(book_id), path, os.stat(path)
+
+
+class TestContentHashCache:
+    """Tests for the persistent content hash cache."""
+
+    def test_digest_streams_file(self, fs):
+        """Test that digests depend only on content."""
+        fs.create_file('/a', contents='x' * 3_000_000)
+        fs.create_file('/b', contents='x' * 3_000_000)
+        fs.create_file('/c', contents='x' * 2_999_999 + 'y')
+        assert file_digest('/a') == file_digest('/b') != file_digest('/c')
+
+    def test_cached_across_runs(self, fs):
+        """Test that a saved cache answers unchanged files without hashing them."""
+        book = _book(fs, 1, 'same')
+        hasher = CountingHasher()
+        cache = ContentHashCache('/cache.jsonl', hasher)
+        first = cache.digests([book[1:]])
+        cache.save()
+
+        cache = ContentHashCache('/cache.jsonl', hasher)
+        assert cache.digests([book[1:]]) == first
+        assert hasher.hashed == [book[1]]
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_modified_file_is_rehashed(self, fs):
+        """Test that a changed mtime invalidates the entry."""
+        book = _book(fs, 1, 'same', mtime_ns=1_000)
+        cache = ContentHashCache('/cache.jsonl')
+        cache.digests([book[1:]])
+        cache.save()
+        with open('/library/1/book.kepub', 'w') as f:
+            f.write('changed')
+        cache = ContentHashCache('/cache.jsonl')
+        cache.digests([('/library/1/book.kepub', os.stat('/library/1/book.kepub'))])
+        assert (cache.hits, cache.misses) == (0, 1)
+
+    def test_save_drops_unseen_files(self, fs):
+        """Test that entries for files not seen in a run are not written back."""
+        books = [_book(fs, 1, 'a'), _book(fs, 2, 'b')]
+        cache = ContentHashCache('/cache.jsonl')
+        cache.digests([b[1:] for b in books])
+        cache.save()
+        cache = ContentHashCache('/cache.jsonl')
+        cache.mark_live(books[0][2])
+        cache.save()
+        with open('/cache.jsonl') as f:
+            assert len(f.readlines()) == 1
+
+
+class TestFindDuplicates:
+    """Tests for collapsing identical source files."""
+
+    def test_only_same_size_files_are_hashed(self, fs):
+        """Test that files with a unique size are never read."""
+        books = [_book(fs, 1, 'same'), _book(fs, 2, 'same'), _book(fs, 3, 'diff'), _book(fs, 4, 'longer')]
+        hasher = CountingHasher()
+        assert find_duplicates(books, ContentHashCache(hasher=hasher)) == {'2'}
+        assert sorted(hasher.hashed) == ['/library/1/book.kepub', '/library/2/book.kepub', '/library/3/book.kepub']
+
+    def test_hard_links_are_hashed_once(self, fs):
+        """Test that one inode reached through two books is read once."""
+        book = _book(fs, 1, 'same')
+        os.makedirs('/library/2')
+        os.link(book[1], '/library/2/book.kepub')
+        hasher = CountingHasher()
+        books = [book, ('2', '/library/2/book.kepub', os.stat('/library/2/book.kepub'))]
+        assert find_duplicates(books, ContentHashCache(hasher=hasher)) == {'2'}
+        assert len(hasher.hashed) == 1
+
+    def test_unreadable_file_is_left_out(self, fs):
+        """Test that a file that cannot be hashed is reported and never counted as a copy."""
+        books = [_book(fs, 1, 'same'), _book(fs, 2, 'same'), _book(fs, 3, 'same')]
+
+        def hasher(path):
+            if path == '/library/1/book.kepub':
+                raise OSError(errno.EIO, 'Input/output error', path)
+            return file_digest(path)
+
+        errors = []
+        assert find_duplicates(books, ContentHashCache(hasher=hasher), errors=errors) == {'3'}
+        assert [(path, error.errno) for path, error in errors] == [('/library/1/book.kepub', errno.EIO)]
+
+    @pytest.mark.parametrize('keep, duplicates', [
+        ('lowest_id', {'9', '10'}),
+        ('highest_id', {'2', '9'}),
+        ('newest', {'2', '10'}),
+        ('oldest', {'9', '10'}),
+    ])
+    def test_keep_rules(self, fs, keep, duplicates):
+        """Test that the keep rule picks which copy is mirrored."""
+        books = [_book(fs, 2, 'same', mtime_ns=1_000), _book(fs, 10, 'same', mtime_ns=2_000),
+                 _book(fs, 9, 'same', mtime_ns=3_000)]
+        assert find_duplicates(books, ContentHashCache(), keep) == duplicates
+
+    def test_unknown_keep_rule(self, fs):
+        with pytest.raises(ValueError):
+            find_duplicates([], ContentHashCache(), 'random')
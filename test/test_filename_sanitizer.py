@@ -0,0 +1,73 @@
+import random
+
+import pytest
+from pathvalidate import sanitize_filename as pathvalidate_sanitize_filename
+
+from filename_sanitizer import sanitize_filename
+
+# Characters that exercise every branch of pathvalidate's sanitizer: invalid
+# characters, dots and spaces at the edges, reserved-name fragments, unicode
+# whitespace and multi-byte characters near the truncation limit.
+FUZZ_ALPHABET = (
+    'abcCOMNLPTXUAROKR0123456789¹²³$'
+    ' ...'
+    '/\\:*?"<>|'
+    '\t\n\r\x0b\x0c\x00\x01\x1b\x7f'
+    '\x85\xa0 　'
+    'éßİıﬁ中文😀-_()[],;\'!'
+)
+
+RESERVED_FRAGMENTS = ['CON', 'con', 'Prn', 'aux', 'NUL', 'CLOCK$', 'COM1', 'lpt9', 'COM¹', 'LPT³', ':']
+
+
+def _random_name(rng):
+    kind = rng.random()
+    if kind < 0.2:
+        parts = [rng.choice(RESERVED_FRAGMENTS)]
+        parts.extend(rng.choice(['.', ' ', '.txt', 'x', '.con', ' .']) for _ in range(rng.randint(0, 3)))
+        return ''.join(parts)
+    if kind < 0.3:
+        return rng.choice(['a', 'é', '中', '😀']) * rng.randint(60, 300)
+    length = rng.randint(0, 40)
+    return ''.join(rng.choice(FUZZ_ALPHABET) for _ in range(length))
+
+
+@pytest.mark.parametrize("name", [
+    '', ' ', '   ', '　', '.', '..', '...', ' . ', '. .', ' .. ', 'a.', 'a ', ' a',
+    'CON', 'con.txt', 'con.con', 'CON.', 'COM¹', 'clock$', 'NUL ', ':', 'a:b', 'a/b', 'a\\b',
+    '1 - Incredible Hulk Epic Collection, Volume 6: Crisis On Counter-Earth.epub',
+    'a' * 300, 'é' * 200, '😀' * 70,
+])
+def test_matches_pathvalidate_known_cases(name):
+    assert sanitize_filename(name) == pathvalidate_sanitize_filename(name)
+
+
+def test_matches_pathvalidate_single_characters():
+    for codepoint in range(0x3100):
+        name = chr(codepoint)
+        for candidate in (name, f'a{name}', f'{name}a', f'a{name}a'):
+            assert sanitize_filename(candidate) == pathvalidate_sanitize_filename(candidate), repr(candidate)
+
+
+def test_matches_pathvalidate_fuzz():
+    rng = random.Random(20251019)
+    for _ in range(20000):
+        name = _random_name(rng)
+        assert sanitize_filename(name) == pathvalidate_sanitize_filename(name), repr(name)
+
+
+def test_none_sanitizes_to_empty_string():
+    assert sanitize_filename(None) == pathvalidate_sanitize_filename(None) == ''
+
+
+def test_rejects_non_strings():
+    with pytest.raises(TypeError):
+        sanitize_filename(42)
+
+
+def test_repeated_components_hit_the_cache():
+    sanitize_filename.cache_clear()
+    for _ in range(5):
+        sanitize_filename('Incredible Hulk Epic Collection')
+    info = sanitize_filename.cache_info()
+    assert (info.hits, info.misses) == (4, 1)
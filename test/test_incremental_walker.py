@@ -0,0 +1,158 @@
+import os
+import shutil
+
+import pytest
+
+from calibre_library import incremental_walker
+from calibre_library.calibre_library import CalibreLibrary
+from calibre_library.incremental_walker import IncrementalWalker, filesystem_type
+
+
+def _create_book(root, author, title):
+    book_dir = os.path.join(root, author, title)
+    os.makedirs(book_dir)
+    for name in ('metadata.opf', 'book.kepub'):
+        with open(os.path.join(book_dir, name), 'w'):
+            pass
+    return os.path.join(book_dir, 'metadata.opf')
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = str(tmp_path / 'library')
+    for a in range(5):
+        for b in range(4):
+            _create_book(root, f'Author {a}', f'Book {b} ({a * 4 + b})')
+    return root
+
+
+@pytest.fixture
+def stat_calls(monkeypatch):
+    calls = []
+    original_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        calls.append(path)
+        return original_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    return calls
+
+
+def _walker(library, tmp_path, **kwargs):
+    kwargs.setdefault('racy_window_ns', 0)
+    return IncrementalWalker(library, str(tmp_path / 'walk.json'), max_workers=4, **kwargs)
+
+
+def _expected(library):
+    return sorted(os.path.join(d, f) for d, _, files in os.walk(library) for f in files if f == 'metadata.opf')
+
+
+class TestIncrementalWalker:
+    """Tests for directory-mtime pruning of library walks."""
+
+    def test_unchanged_library_costs_one_stat_per_author(self, library, tmp_path, stat_calls):
+        """Test that a second walk lists nothing and stats only the root and author dirs."""
+        assert sorted(_walker(library, tmp_path).iter_opf()) == _expected(library)
+        stat_calls.clear()
+        walker = _walker(library, tmp_path)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert walker.listed == 0
+        assert len([p for p in stat_calls if p.startswith(library)]) == 1 + 5
+
+    def test_added_book_relists_only_its_author(self, library, tmp_path):
+        """Test that a new book is found by listing its author and the book alone."""
+        list(_walker(library, tmp_path).iter_opf())
+        _create_book(library, 'Author 2', 'New Book (99)')
+        walker = _walker(library, tmp_path)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert walker.listed == 2
+
+    def test_opf_written_after_the_walk_is_found(self, library, tmp_path):
+        """Test that a book directory listed before its OPF existed is checked again."""
+        book_dir = os.path.join(library, 'Author 1', 'Pending (50)')
+        os.makedirs(book_dir)
+        open(os.path.join(book_dir, 'book.kepub'), 'w').close()
+        list(_walker(library, tmp_path).iter_opf())
+        author_mtime = os.stat(os.path.dirname(book_dir)).st_mtime_ns
+        open(os.path.join(book_dir, 'metadata.opf'), 'w').close()
+        assert os.stat(os.path.dirname(book_dir)).st_mtime_ns == author_mtime
+        walker = _walker(library, tmp_path)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert walker.listed == 1
+
+    def test_removed_book_and_new_author(self, library, tmp_path):
+        """Test that removals and new top-level directories are picked up."""
+        list(_walker(library, tmp_path).iter_opf())
+        shutil.rmtree(os.path.join(library, 'Author 0', 'Book 1 (1)'))
+        new_opf = _create_book(library, 'Author 9', 'Fresh (100)')
+        found = sorted(_walker(library, tmp_path).iter_opf())
+        assert found == _expected(library)
+        assert new_opf in found and len(found) == 20
+
+    def test_racy_directories_are_listed_again(self, library, tmp_path):
+        """Test that directories modified just before the last walk are not trusted."""
+        list(_walker(library, tmp_path, racy_window_ns=10**12).iter_opf())
+        walker = _walker(library, tmp_path, racy_window_ns=10**12)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert walker.listed == 1 + 5 + 20
+
+    def test_untrusted_mtimes_walk_everything(self, library, tmp_path):
+        """Test that the cache is neither used nor written when mtimes are untrusted."""
+        walker = _walker(library, tmp_path, trust_mtimes=False)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert not os.path.exists(tmp_path / 'walk.json')
+
+    def test_cache_for_another_library_is_ignored(self, library, tmp_path):
+        other = str(tmp_path / 'other')
+        _create_book(other, 'Someone', 'Else (1)')
+        list(_walker(other, tmp_path).iter_opf())
+        walker = _walker(library, tmp_path)
+        assert sorted(walker.iter_opf()) == _expected(library)
+        assert walker.listed == 1 + 5 + 20
+
+    def test_incomplete_walk_does_not_save(self, library, tmp_path):
+        walk = _walker(library, tmp_path).iter_opf()
+        next(walk)
+        walk.close()
+        assert not os.path.exists(tmp_path / 'walk.json')
+
+    def test_library_uses_walk_cache(self, library, tmp_path):
+        """Test that CalibreLibrary walks incrementally when given a cache path."""
+        lib = CalibreLibrary(library, walk_cache_path=str(tmp_path / 'walk.json'), walk_trust_mtimes=True)
+        assert sorted(lib.list_all_opf()) == _expected(library)
+        assert os.path.exists(tmp_path / 'walk.json')
+
+
+def test_filesystem_type(tmp_path, monkeypatch):
+    """Test that the longest matching mount point decides the filesystem type."""
+    mounts = tmp_path / 'mounts'
+    mounts.write_text('/dev/sda1 / ext4 rw 0 0\n'
+                      '//nas/books /mnt/my\\040books cifs rw 0 0\n')
+    monkeypatch.setattr(incremental_walker, 'MOUNTS_PATH', str(mounts))
+    assert filesystem_type('/mnt/my books/Author') == 'cifs'
+    assert filesystem_type('/mnt/my booksshelf') == 'ext4'
+    walker = IncrementalWalker('/mnt/my books', str(tmp_path / 'walk.json'))
+    assert not walker.mtimes_trustworthy(os.stat(tmp_path))
+
+
+def test_filesystem_type_from_mount_command(tmp_path, monkeypatch):
+    """Test that the output of mount is used where there is no /proc, as on macOS."""
+    output = tmp_path / 'mount.txt'
+    output.write_text('/dev/disk3s1s1 on / (apfs, sealed, local, read-only, journaled)\n'
+                      '//GUEST:@nas._smb._tcp.local/Books on /Volumes/My Books (smbfs, nodev, nosuid, mounted by me)\n')
+    monkeypatch.setattr(incremental_walker, 'MOUNTS_PATH', str(tmp_path / 'missing'))
+    monkeypatch.setattr(incremental_walker, 'MOUNT_COMMAND', ('cat', str(output)))
+    assert filesystem_type('/Volumes/My Books/Author') == 'smbfs'
+    assert filesystem_type('/Users/reader') == 'apfs'
+
+
+def test_unknown_filesystem_is_not_trusted(tmp_path, monkeypatch):
+    """Test that mtimes are not trusted when the mount table cannot be read."""
+    monkeypatch.setattr(incremental_walker, 'MOUNTS_PATH', str(tmp_path / 'missing'))
+    monkeypatch.setattr(incremental_walker, 'MOUNT_COMMAND', (str(tmp_path / 'no-such-command'),))
+    assert filesystem_type(str(tmp_path)) is None
+    walker = IncrementalWalker(str(tmp_path), str(tmp_path / 'walk.json'))
+    assert not walker.mtimes_trustworthy(os.stat(tmp_path))
+    assert IncrementalWalker(str(tmp_path), str(tmp_path / 'walk.json'), trust_mtimes=True).mtimes_trustworthy(
+        os.stat(tmp_path))
@@ -0,0 +1,157 @@
+import os
+import statistics
+import threading
+import time
+
+import pytest
+
+import io_scheduler
+from calibre_library.concurrent_walker import ConcurrentWalker
+from io_scheduler import AdaptiveConcurrencyController, AdaptiveExecutor, lower_io_priority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowFilesystem:
+    """Simulated storage whose latency grows once more than ``capacity``
+    operations are outstanding, like a saturated NAS."""
+
+    def __init__(self, base_latency, capacity):
+        self.base_latency = base_latency
+        self.capacity = capacity
+        self.in_flight = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def read(self, item):
+        with self._lock:
+            self.in_flight += 1
+            latency = self.base_latency * max(1.0, self.in_flight / self.capacity)
+        time.sleep(latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.latencies.append(latency)
+        return item
+
+
+class TestAdaptiveConcurrencyController:
+    """Test class for AdaptiveConcurrencyController functionality."""
+
+    def test_additive_increase_below_target(self):
+        """Test that the limit grows by one per healthy window up to the maximum."""
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(max_concurrency=4, target_latency=0.05,
+                                                   sample_window=2, clock=clock)
+        limits = []
+        for _ in range(5):
+            clock.now += 1
+            controller.record(0.01)
+            controller.record(0.01)
+            limits.append(controller.limit)
+        assert limits == [2, 3, 4, 4, 4]
+
+    def test_multiplicative_decrease_above_target(self):
+        """Test that a slow window halves the limit, never below the minimum."""
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(max_concurrency=16, min_concurrency=2,
+                                                   initial_concurrency=16, target_latency=0.05,
+                                                   sample_window=3, clock=clock)
+        limits = []
+        for _ in range(4):
+            clock.now += 1
+            for _ in range(3):
+                controller.record(0.2)
+            limits.append(controller.limit)
+        assert limits == [8, 4, 2, 2]
+
+    def test_median_ignores_single_outlier(self):
+        """Test that one slow operation in a window does not cut the limit."""
+        controller = AdaptiveConcurrencyController(max_concurrency=8, initial_concurrency=4,
+                                                   target_latency=0.05, sample_window=3,
+                                                   clock=FakeClock())
+        for latency in (0.01, 5.0, 0.01):
+            controller.record(latency)
+        assert controller.limit == 5
+
+    def test_ops_ceiling_decreases_limit(self):
+        """Test that exceeding the ops-per-second ceiling cuts the limit."""
+        clock = FakeClock()
+        controller = AdaptiveConcurrencyController(max_concurrency=16, initial_concurrency=8,
+                                                   max_ops_per_second=10, sample_window=10, clock=clock)
+        clock.now = 0.5
+        for _ in range(10):
+            controller.record(0.001)
+        assert controller.limit == 4
+
+    def test_from_config(self):
+        """Test building a controller from an io_control config block."""
+        controller = AdaptiveConcurrencyController.from_config(
+            {'target_latency_ms': 40, 'max_ops_per_second': 100, 'max_workers': 6, 'min_workers': 2})
+        assert controller.target_latency == pytest.approx(0.04)
+        assert controller.max_ops_per_second == 100
+        assert (controller.min_concurrency, controller.max_concurrency, controller.limit) == (2, 6, 2)
+
+    def test_pacing_holds_ops_ceiling(self):
+        """Test that operation starts are paced to the ceiling even with spare workers."""
+        controller = AdaptiveConcurrencyController(max_concurrency=8, initial_concurrency=8,
+                                                   max_ops_per_second=200)
+        start = time.perf_counter()
+        list(AdaptiveExecutor(controller).map(lambda x: x, range(21)))
+        assert time.perf_counter() - start >= 20 / 200 * 0.9
+
+
+class TestAdaptiveExecutor:
+    """Test class for AdaptiveExecutor functionality."""
+
+    def test_map_preserves_order(self):
+        """Test that results come back in input order."""
+        controller = AdaptiveConcurrencyController(max_concurrency=4, initial_concurrency=4)
+        assert list(AdaptiveExecutor(controller).map(lambda x: x * 2, range(50))) == list(range(0, 100, 2))
+
+    def test_never_exceeds_limit(self):
+        """Test that no more operations run at once than the controller allows."""
+        slow_fs = SlowFilesystem(base_latency=0.002, capacity=100)
+        controller = AdaptiveConcurrencyController(max_concurrency=3, initial_concurrency=3)
+        peak = []
+
+        def read(item):
+            peak.append(controller.in_flight)
+            return slow_fs.read(item)
+
+        list(AdaptiveExecutor(controller).map(read, range(30)))
+        assert max(peak) <= 3
+
+    def test_converges_on_saturated_storage(self):
+        """Test that concurrency settles where the simulated NAS holds the target latency."""
+        slow_fs = SlowFilesystem(base_latency=0.002, capacity=4)
+        controller = AdaptiveConcurrencyController(max_concurrency=32, initial_concurrency=32,
+                                                   target_latency=0.004, sample_window=8)
+        results = list(AdaptiveExecutor(controller).map(slow_fs.read, range(400)))
+
+        assert results == list(range(400))
+        assert controller.limit <= 16
+        settled = slow_fs.latencies[len(slow_fs.latencies) // 2:]
+        assert statistics.median(settled) <= 0.004 * 1.5
+
+    def test_walker_with_controller(self, fs):
+        """Test that the concurrent walker honours a controller."""
+        for i in range(10):
+            fs.create_file(os.path.join('/lib', f'Author {i}', 'Book (1)', 'metadata.opf'))
+        controller = AdaptiveConcurrencyController(max_concurrency=4, initial_concurrency=2)
+        walker = ConcurrentWalker('/lib', max_workers=4, controller=controller)
+        assert len(list(walker.iter_opf())) == 10
+
+
+def test_lower_io_priority_without_ioprio(monkeypatch):
+    """Test that only niceness is changed where ioprio is unavailable."""
+    calls = []
+    monkeypatch.setattr(io_scheduler.os, 'nice', calls.append)
+    monkeypatch.setattr(io_scheduler.platform, 'system', lambda: 'Darwin')
+    assert lower_io_priority(5) is False
+    assert calls == [5]
@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import runner
+from metrics_exporter import RunMetrics
+from mirror_plan.mirror_plan import LINK, PlanOperation
+
+METRICS_PATH = '/textfile/calibre_mirror.prom'
+
+
+class FixedClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestRunMetrics:
+    """Test class for RunMetrics functionality."""
+
+    def test_render_exposition_format(self):
+        """Test that samples render with HELP/TYPE headers and labels."""
+        metrics = RunMetrics(clock=FixedClock(1700000000.5))
+        metrics.set('books_scanned', 10, group='komga')
+        metrics.inc('books_linked', group='komga')
+        metrics.inc('books_linked', group='komga')
+        metrics.finish_group('komga', success=True)
+        text = metrics.render()
+
+        assert '# TYPE calibre_mirror_books_scanned gauge\n' in text
+        assert 'calibre_mirror_books_scanned{group="komga"} 10\n' in text
+        assert 'calibre_mirror_books_linked{group="komga"} 2\n' in text
+        assert 'calibre_mirror_last_success_timestamp_seconds{group="komga"} 1700000000.5\n' in text
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes and backslashes in group names stay valid."""
+        metrics = RunMetrics()
+        metrics.set('errors', 0, group='a "quoted" \\ name')
+        assert 'calibre_mirror_errors{group="a \\"quoted\\" \\\\ name"} 0' in metrics.render()
+
+    def test_failed_run_keeps_previous_last_success(self, fs):
+        """Test that a failing run carries the last success timestamp forward."""
+        fs.create_dir('/textfile')
+        good = RunMetrics(clock=FixedClock(100.0))
+        good.finish_group('a "b"', success=True)
+        good.write_textfile(METRICS_PATH)
+
+        bad = RunMetrics(clock=FixedClock(200.0))
+        bad.finish_group('a "b"', success=False)
+        bad.write_textfile(METRICS_PATH)
+
+        with open(METRICS_PATH) as f:
+            text = f.read()
+        assert 'calibre_mirror_last_success_timestamp_seconds{group="a \\"b\\""} 100.0' in text
+        assert 'calibre_mirror_last_run_timestamp_seconds{group="a \\"b\\""} 200.0' in text
+
+    def test_write_is_atomic(self, fs):
+        """Test that no temporary file is left next to the metrics file."""
+        fs.create_dir('/textfile')
+        RunMetrics().write_textfile(METRICS_PATH)
+        assert os.listdir('/textfile') == ['calibre_mirror.prom']
+
+    def test_cache_hit_ratio(self):
+        metrics = RunMetrics()
+        metrics.record_cache('g', 'sanitize_filename', hits=3, misses=1)
+        assert metrics.get('cache_hit_ratio', group='g', cache='sanitize_filename') == 0.75
+
+    def test_groups_write_only_their_own_textfile(self, fs):
+        """Test that groups with separate textfiles never export the same series twice."""
+        fs.create_dir('/textfile')
+        metrics = RunMetrics(clock=FixedClock(100.0))
+        for group, path in (('a', '/textfile/a.prom'), ('b', '/textfile/b.prom'), ('c', '/textfile/a.prom')):
+            metrics.set('books_scanned', 1, group=group)
+            metrics.record_cache(group, 'sanitize_filename', hits=1, misses=1)
+            metrics.finish_group(group, success=True)
+            metrics.write_textfile(path, group)
+
+        def groups(path):
+            with open(path) as f:
+                return set(re.findall(r'group="(\w+)"', f.read()))
+        assert groups('/textfile/a.prom') == {'a', 'c'}
+        assert groups('/textfile/b.prom') == {'b'}
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Test that links recorded from the applier's worker threads all count."""
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            metrics = RunMetrics()
+            op = PlanOperation(LINK, '/mirror/a.epub', '/library/a.kepub')
+            with ThreadPoolExecutor(8) as executor:
+                list(executor.map(lambda i: metrics.record_applied('g', op), range(20_000)))
+        finally:
+            sys.setswitchinterval(interval)
+        assert metrics.get('books_linked', group='g') == 20_000
+
+
+def test_runner_writes_metrics(fs, make_book):
+    """Test that a run publishes counts and durations for its config group."""
+    fs.create_dir('/textfile')
+    make_book('/library', 1, 'Book One', series='Saga', series_index=1)
+    make_book('/library', 2, 'Book Two', series='Saga', series_index=2)
+    make_book('/library', 3, 'Elsewhere', ext_libs=['other-lib'])
+    config_group = {'name': 'komga', 'library_path': '/library', 'mirror_path': '/mirror',
+                    'dry_run': False, 'metrics_path': METRICS_PATH}
+
+    metrics = RunMetrics()
+    runner.run_config_group(config_group, metrics)
+
+    assert metrics.get('books_scanned', group='komga') == 3
+    assert metrics.get('books_matched', group='komga') == 2
+    assert metrics.get('books_linked', group='komga') == 2
+    assert metrics.get('collisions', group='komga') == 0
+    assert metrics.get('errors', group='komga') == 0
+    for stage in ('scan', 'plan', 'apply'):
+        assert metrics.get('stage_duration_seconds', group='komga', stage=stage) >= 0
+    with open(METRICS_PATH) as f:
+        assert 'calibre_mirror_last_success_timestamp_seconds{group="komga"}' in f.read()
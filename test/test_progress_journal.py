@@ -0,0 +1,148 @@
+import errno
+import os
+
+import pytest
+
+import runner
+from mirror_plan.mirror_plan import MKDIR, PlanOperation
+from mirror_plan.plan_applier import PlanApplier
+from progress_journal import ProgressJournal
+from retry_queue import RetryQueue
+
+JOURNAL_PATH = '/state/journal.jsonl'
+LIBRARY = '/library'
+MIRROR = '/mirror'
+
+
+class CrashingApplier(PlanApplier):
+    """Applier that dies after a number of links, like a killed process."""
+
+    def __init__(self, crash_after, **kwargs):
+        super().__init__(**kwargs)
+        self.crash_after = crash_after
+        self.linked = []
+
+    def apply_operation(self, op):
+        if op.op != MKDIR:
+            if len(self.linked) == self.crash_after:
+                raise KeyboardInterrupt
+            self.linked.append(op.target)
+        super().apply_operation(op)
+
+
+class TestProgressJournal:
+    """Test class for ProgressJournal functionality."""
+
+    def test_fresh_journal_is_not_resumed(self, fs):
+        """Test that a missing journal starts a fresh run."""
+        fs.create_dir('/state')
+        journal = ProgressJournal(JOURNAL_PATH)
+        assert not journal.resumed
+        assert journal.completed == {}
+
+    def test_entries_survive_close(self, fs):
+        """Test that an unfinished journal is reloaded with its entries."""
+        fs.create_dir('/state')
+        journal = ProgressJournal(JOURNAL_PATH, fsync_every=10)
+        journal.record_book('1', '/mirror/A/A.epub')
+        journal.record_operation(PlanOperation(MKDIR, '/mirror/A'))
+        journal.close()
+
+        reopened = ProgressJournal(JOURNAL_PATH)
+        assert reopened.resumed
+        assert reopened.completed == {'1': '/mirror/A/A.epub'}
+        assert reopened.is_applied(PlanOperation(MKDIR, '/mirror/A'))
+
+    def test_fsync_is_batched(self, fs, monkeypatch):
+        """Test that fsync runs once per fsync_every entries."""
+        fs.create_dir('/state')
+        calls = []
+        monkeypatch.setattr(os, 'fsync', calls.append)
+        journal = ProgressJournal(JOURNAL_PATH, fsync_every=3)
+        for i in range(7):
+            journal.record_book(str(i))
+        assert len(calls) == 2
+
+    def test_torn_last_line_is_dropped(self, fs):
+        """Test that a partially written entry is discarded and overwritten."""
+        fs.create_file(JOURNAL_PATH, contents='{"book":"1","link":null}\n{"book":"2","li')
+        journal = ProgressJournal(JOURNAL_PATH)
+        assert journal.completed == {'1': None}
+        journal.record_book('3')
+        journal.close()
+        with open(JOURNAL_PATH) as f:
+            assert f.read() == '{"book":"1","link":null}\n{"book":"3","link":null}\n'
+
+    @pytest.mark.parametrize('bad_line', ['[1, 2]', '{"op":"explode","target":"/mirror/x"}', '42'])
+    def test_bad_entry_ends_the_journal(self, fs, bad_line):
+        """Test that a well-formed line that is not a journal entry is treated like a torn one."""
+        fs.create_file(JOURNAL_PATH, contents=f'{{"book":"1","link":null}}\n{bad_line}\n{{"book":"2","link":null}}\n')
+        journal = ProgressJournal(JOURNAL_PATH)
+        assert journal.completed == {'1': None}
+        journal.close()
+        with open(JOURNAL_PATH) as f:
+            assert f.read() == '{"book":"1","link":null}\n'
+
+    def test_finish_truncates(self, fs):
+        """Test that finishing a run leaves an empty journal."""
+        fs.create_dir('/state')
+        journal = ProgressJournal(JOURNAL_PATH)
+        journal.record_book('1')
+        journal.finish()
+        assert os.path.getsize(JOURNAL_PATH) == 0
+        assert not ProgressJournal(JOURNAL_PATH).resumed
+
+
+class TestJournaledRun:
+    """Test resuming an interrupted run through the runner."""
+
+    def setup_method(self):
+        self.config_group = {'library_path': LIBRARY, 'mirror_path': MIRROR, 'dry_run': False,
+                             'journal_path': JOURNAL_PATH, 'journal_fsync_every': 2}
+
+    def test_resume_skips_completed_books(self, fs, make_book, monkeypatch):
+        """Test that a killed run resumes without rereading finished books."""
+        fs.create_dir('/state')
+        for i in range(1, 8):
+            make_book(LIBRARY, i, f'Book {i}')
+
+        journal = ProgressJournal(JOURNAL_PATH, fsync_every=2)
+        with pytest.raises(KeyboardInterrupt):
+            runner.run_journaled(self.config_group, journal,
+                                 CrashingApplier(5, on_applied=journal.record_operation))
+        journal.close()
+
+        resumed = ProgressJournal(JOURNAL_PATH, fsync_every=2)
+        assert resumed.resumed
+        done = set(resumed.completed)
+        assert len(done) == 4
+
+        read = []
+        original_read_opf = runner.read_opf
+        monkeypatch.setattr(runner, 'read_opf', lambda file: read.append(file) or original_read_opf(file))
+        runner.run_journaled(self.config_group, resumed, PlanApplier(on_applied=resumed.record_operation))
+        resumed.finish()
+
+        assert len(read) == 3
+        assert sorted(os.listdir(MIRROR)) == sorted(f'Book {i}' for i in range(1, 8))
+        assert os.path.getsize(JOURNAL_PATH) == 0
+
+    def test_book_with_deferred_link_is_not_completed(self, fs, make_book):
+        """Test that a book whose link was set aside for a retry is redone if the run dies before finish."""
+        fs.create_dir('/state')
+        for i in range(1, 4):
+            make_book(LIBRARY, i, f'Book {i}')
+
+        class FlakyApplier(PlanApplier):
+            def apply_operation(self, op):
+                if op.op != MKDIR and 'Book 2' in op.target:
+                    raise OSError(errno.EIO, 'Input/output error', op.target)
+                super().apply_operation(op)
+
+        journal = ProgressJournal(JOURNAL_PATH, fsync_every=2)
+        runner.run_journaled(self.config_group, journal,
+                             FlakyApplier(on_applied=journal.record_operation, retries=RetryQueue()))
+        journal.close()  # killed before applier.finish()
+
+        resumed = ProgressJournal(JOURNAL_PATH)
+        assert sorted(resumed.completed) == ['1', '3']
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from recency_cursor import RecencyCursor
+
+CURSOR_PATH = '/state/cursor.json'
+
+
+def _books(*mtimes):
+    """Books named after their id, keyed ``(mtime_ns, id)``."""
+    return {f'book{i}': (mtime, str(i)) for i, mtime in enumerate(mtimes)}
+
+
+def _run(cursor, books, budget):
+    """Process at most ``budget`` books in cursor order, like one time-budgeted run."""
+    order = cursor.order(books)
+    for book in order[:budget]:
+        cursor.done(books[book])
+    cursor.advance(books, finished=budget >= len(order))
+    return order[:budget]
+
+
+class TestRecencyCursor:
+    """Tests for ordering time-budgeted runs newest first and resuming the backfill."""
+
+    def test_first_run_is_newest_first(self):
+        assert RecencyCursor().order(_books(10, 30, 20)) == ['book1', 'book2', 'book0']
+
+    def test_backfill_resumes_across_runs(self):
+        cursor = RecencyCursor()
+        books = _books(10, 20, 30, 40, 50)
+        assert _run(cursor, books, 2) == ['book4', 'book3']
+        assert _run(cursor, books, 2) == ['book2', 'book1']
+        assert _run(cursor, books, 2) == ['book0']
+        assert cursor.backfill is None
+        assert _run(cursor, books, 2) == ['book4', 'book3']
+
+    def test_new_books_come_before_the_backfill(self):
+        """Test that books changed since the last run are handled before the backfill continues."""
+        cursor = RecencyCursor()
+        books = _books(10, 20, 30, 40)
+        _run(cursor, books, 2)
+        books['book4'] = (50, '4')
+        books['book1'] = (60, '1')  # edited
+        assert _run(cursor, books, 3) == ['book1', 'book4', 'book0']
+        assert cursor.backfill is None
+
+    def test_interrupted_new_books_are_backfilled(self):
+        """Test that new books a run had no time for are not skipped by later runs."""
+        cursor = RecencyCursor()
+        books = _books(10, 20)
+        _run(cursor, books, 2)
+        books.update({'book2': (30, '2'), 'book3': (40, '3'), 'book4': (50, '4')})
+        assert _run(cursor, books, 1) == ['book4']
+        assert _run(cursor, books, 2) == ['book3', 'book2']
+
+    def test_pending_books_hold_the_backfill_mark(self):
+        """Test that a book waiting for a retry when the run stopped is done by the next run."""
+        cursor = RecencyCursor()
+        books = _books(10, 20, 30, 40)
+        cursor.order(books)
+        cursor.done(books['book2'])  # book3 failed with a transient error and is still queued
+        cursor.advance(books, finished=False, pending=[books['book3']])
+        assert cursor.order(books) == ['book3', 'book2', 'book1', 'book0']
+
+    def test_run_without_progress_keeps_marks(self):
+        cursor = RecencyCursor()
+        books = _books(10, 20, 30)
+        _run(cursor, books, 1)
+        marks = (cursor.high_water, cursor.backfill)
+        _run(cursor, books, 0)
+        assert (cursor.high_water, cursor.backfill) == marks
+
+    def test_save_and_load(self, fs):
+        fs.create_dir('/state')
+        cursor = RecencyCursor(CURSOR_PATH)
+        books = _books(10, 20, 30)
+        _run(cursor, books, 2)
+        cursor.save()
+        loaded = RecencyCursor(CURSOR_PATH)
+        assert (loaded.high_water, loaded.backfill) == ((30, '2'), (10, '0'))
+        assert loaded.order(books) == ['book0']
+
+    def test_invalid_file(self, fs):
+        fs.create_file(CURSOR_PATH, contents=json.dumps({'version': 99}))
+        with pytest.raises(ValueError, match='Invalid recency cursor file'):
+            RecencyCursor(CURSOR_PATH)
@@ -0,0 +1,87 @@
+import errno
+
+import pytest
+
+from conftest import FakeClock
+from retry_queue import RetryQueue, classify, error_class, is_transient
+
+
+def _queue(clock, **kwargs):
+    return RetryQueue(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def _eio():
+    return OSError(errno.EIO, 'Input/output error')
+
+
+class TestClassification:
+    """Tests for telling transient errors from permanent ones."""
+
+    @pytest.mark.parametrize('code', [errno.EAGAIN, errno.EIO, errno.ESTALE])
+    def test_network_errors_are_transient(self, code):
+        assert is_transient(OSError(code, 'flaky'))
+
+    def test_permanent_errors(self):
+        assert not is_transient(FileNotFoundError(errno.ENOENT, 'gone'))
+        assert not is_transient(PermissionError(errno.EACCES, 'denied'))
+        assert not is_transient(ValueError('malformed OPF'))
+
+    def test_classify(self):
+        failures = [('a', _eio()), ('b', _eio()), ('c', FileNotFoundError(errno.ENOENT, 'gone')),
+                    ('d', ValueError('bad'))]
+        assert error_class(failures[0][1]) == 'EIO'
+        assert classify(failures) == {'EIO': 2, 'ENOENT': 1, 'ValueError': 1}
+
+
+class TestRetryQueue:
+    """Tests for deferring transient failures with backoff and a budget."""
+
+    def test_delay_doubles_up_to_max(self):
+        clock = FakeClock()
+        queue = _queue(clock, base_delay=1, max_delay=3, max_attempts=10)
+        for attempts in range(1, 5):
+            assert queue.defer('book', _eio(), attempts)
+            assert queue.due() == []
+            list(queue.drain())
+        assert clock.sleeps == [1, 2, 3, 3]
+
+    def test_permanent_error_is_not_deferred(self):
+        queue = _queue(FakeClock())
+        assert not queue.defer('book', FileNotFoundError(errno.ENOENT, 'gone'))
+        assert len(queue) == 0
+
+    def test_attempts_and_budget_are_bounded(self):
+        queue = _queue(FakeClock(), max_attempts=3, budget=2)
+        assert not queue.defer('a', _eio(), attempts=3)
+        assert queue.defer('a', _eio()) and queue.defer('b', _eio())
+        assert not queue.defer('c', _eio())
+        assert queue.retries == 2
+
+    def test_drain_yields_in_due_order(self):
+        clock = FakeClock()
+        queue = _queue(clock, base_delay=1)
+        queue.defer('late', _eio(), attempts=3)
+        queue.defer('early', _eio())
+        assert [item for item, attempts in queue.drain()] == ['early', 'late']
+        assert clock.now == 4
+
+    def test_items_deferred_while_draining_are_drained(self):
+        queue = _queue(FakeClock())
+        queue.defer('book', _eio())
+        seen = []
+        for item, attempts in queue.drain():
+            seen.append(attempts)
+            queue.defer(item, _eio(), attempts + 1)
+        assert seen == [1, 2, 3, 4]
+
+    def test_report(self, capsys):
+        queue = _queue(FakeClock())
+        queue.report('Reading')
+        assert capsys.readouterr().out == ''
+        queue.fail('/lib/a/metadata.opf', _eio())
+        queue.report('Reading')
+        assert "Reading: 0 retries, 1 failed {'EIO': 1}" in capsys.readouterr().out
+
+    def test_from_config(self):
+        queue = RetryQueue.from_config({'max_attempts': 2, 'budget': 7})
+        assert (queue.max_attempts, queue.budget, queue.base_delay) == (2, 7, 0.5)
@@ -0,0 +1,650 @@
+import errno
+import io
+import itertools
+import json
+import os
+from functools import partial
+
+import pytest
+import yaml
+
+import apply_plan
+import runner
+import sync_books
+from conftest import FakeClock, StubServer, make_opf
+from calibre_library import book_catalog
+from calibre_library.book_selection import SelectionError
+from calibre_library.concurrent_walker import ConcurrentWalker
+from content_dedup import ContentHashCache, file_digest
+from metrics_exporter import RunMetrics
+from mirror_plan import mirror_planner
+from mirror_plan.mirror_plan import MirrorPlan
+from mirror_plan.mirror_state import MirrorState
+from mirror_plan.plan_applier import PlanApplier
+from retry_queue import RetryQueue, error_class
+
+LIBRARY = '/library'
+
+
+def _mirror_tree(root):
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            tree[os.path.relpath(path, root)] = os.stat(path).st_ino
+    return tree
+
+
+def _config(mirror, **extra):
+    return {'library_path': LIBRARY, 'mirror_path': mirror, 'dry_run': False, **extra}
+
+
+class TestStreamMode:
+    """Tests for streaming books from scan through link in one pass."""
+
+    def _make_library(self, make_book):
+        make_book(LIBRARY, 1, 'One', series='Saga', series_index=1)
+        make_book(LIBRARY, 2, 'Two', series='Saga', series_index=2)
+        make_book(LIBRARY, 3, 'Solo')
+        make_book(LIBRARY, 4, 'Other', ext_libs=['other-lib'])
+        make_book(LIBRARY, 5, 'Pdf Only', formats=('.pdf',))
+
+    def test_stream_matches_batch_mode(self, fs, make_book):
+        """Test that streaming produces the same mirror as plan-then-apply."""
+        self._make_library(make_book)
+        runner.run_config_group(_config('/batch'), RunMetrics())
+        runner.run_config_group(_config('/stream', stream=True), RunMetrics())
+        assert _mirror_tree('/stream') == _mirror_tree('/batch')
+        assert sorted(_mirror_tree('/stream')) == ['Saga/1 - One.epub', 'Saga/2 - Two.epub', 'Solo/Solo.epub']
+
+    def test_first_link_before_walk_finishes(self, fs, make_book, monkeypatch):
+        """Test that books are linked while later OPFs are still unread."""
+        self._make_library(make_book)
+        events = []
+        original_read_opf = runner.read_opf
+
+        def read_opf(file):
+            events.append('read')
+            return original_read_opf(file)
+
+        class RecordingApplier(PlanApplier):
+            def apply_operation(self, op):
+                events.append('apply')
+                super().apply_operation(op)
+
+        monkeypatch.setattr(runner, 'read_opf', read_opf)
+        runner.stream_config_group(_config('/stream', stream=True), RecordingApplier())
+        assert events.index('apply') < len(events) - events[::-1].index('read') - 1
+
+    def test_batch_collision_does_not_follow_scan_order(self, fs, make_book, monkeypatch):
+        """Test that two books with one link path keep the existing link when the scan order changes."""
+        make_book(LIBRARY, 1, 'Dune', authors=['Alice'])
+        make_book(LIBRARY, 2, 'Dune', authors=['Bob'])
+        runner.run_config_group(_config('/batch'), RunMetrics())
+        tree = _mirror_tree('/batch')
+        scan_library = runner.scan_library
+        monkeypatch.setattr(runner, 'scan_library', lambda *args: scan_library(*args)[::-1])
+        metrics = RunMetrics()
+        summary = runner.run_config_group(_config('/batch', name='b'), metrics)
+        assert summary['applied'] == 0
+        assert metrics.get('collisions', group='b') == 1
+        assert _mirror_tree('/batch') == tree
+
+    def test_stream_collision_keeps_first_link(self, fs, make_book):
+        """Test that two books with one link path do not overwrite each other run after run."""
+        make_book(LIBRARY, 1, 'Dune')
+        make_book(LIBRARY, 2, 'Dune', authors=['Other Author'])
+        config = _config('/stream', name='s', stream=True, state_path='/state.json')
+        runner.run_config_group(config, RunMetrics())
+        tree = _mirror_tree('/stream')
+        assert list(tree) == ['Dune/Dune.epub']
+        for _ in range(2):
+            metrics = RunMetrics()
+            summary = runner.run_config_group(config, metrics)
+            assert summary['applied'] == 0
+            assert metrics.get('collisions', group='s') == 1
+            assert _mirror_tree('/stream') == tree
+
+    def test_stream_relinks_replaced_format(self, fs, make_book):
+        """Test that a link to a format file Calibre has since replaced is still updated."""
+        opf_path = make_book(LIBRARY, 1, 'Solo')
+        runner.run_config_group(_config('/stream', stream=True), RunMetrics())
+        source = os.path.join(os.path.dirname(opf_path), 'Solo.kepub')
+        os.remove(source)
+        with open(source, 'w') as f:
+            f.write('new edition')
+        runner.run_config_group(_config('/stream', stream=True), RunMetrics())
+        assert _mirror_tree('/stream') == {'Solo/Solo.epub': os.stat(source).st_ino}
+
+    def test_stream_writes_plan_file(self, fs, make_book):
+        """Test that stream mode writes the plan incrementally."""
+        self._make_library(make_book)
+        fs.create_dir('/plans')
+        runner.run_config_group(_config('/stream', stream=True, dry_run=True,
+                                        plan_path='/plans/plan.jsonl'), RunMetrics())
+        assert MirrorPlan.read('/plans/plan.jsonl').counts()['link'] == 3
+        assert not os.path.exists('/stream')
+
+
+class TestScheduledRuns:
+    """Tests for newest-first runs within a time budget."""
+
+    def _config(self, **schedule):
+        return _config('/mirror', state_path='/state/state.json',
+                       schedule={'cursor_path': '/state/cursor.json', **schedule})
+
+    def _make_book(self, make_book, book_id, title):
+        opf_path = make_book(LIBRARY, book_id, title)
+        os.utime(opf_path, ns=(book_id, book_id))
+        return opf_path
+
+    def _run(self, config, monkeypatch):
+        """Run with every OPF read taking a second of a fake clock."""
+        clock = FakeClock()
+        read_opf = runner.read_opf
+
+        def slow_read_opf(file):
+            clock.sleep(1)
+            return read_opf(file)
+
+        monkeypatch.setattr(runner, 'read_opf', slow_read_opf)
+        applier = PlanApplier(dry_run=False)
+        runner.run_scheduled(config, applier, clock=clock)
+        monkeypatch.setattr(runner, 'read_opf', read_opf)
+        return sorted(_mirror_tree('/mirror'))
+
+    def test_budget_leaves_the_backfill_for_later_runs(self, fs, make_book, monkeypatch):
+        """Test that each run links the newest books first and a new book jumps the backfill."""
+        fs.create_dir('/state')
+        for book_id in (1, 2, 3, 4):
+            self._make_book(make_book, book_id, f'Book {book_id}')
+        config = self._config(budget_seconds=2)
+        assert self._run(config, monkeypatch) == ['Book 3/Book 3.epub', 'Book 4/Book 4.epub']
+        self._make_book(make_book, 5, 'Book 5')
+        assert self._run(config, monkeypatch) == [f'Book {i}/Book {i}.epub' for i in (2, 3, 4, 5)]
+        assert self._run(config, monkeypatch) == [f'Book {i}/Book {i}.epub' for i in (1, 2, 3, 4, 5)]
+
+    def test_book_waiting_for_retry_is_not_skipped(self, fs, make_book, monkeypatch):
+        """Test that a book still queued for a retry when the budget ran out is picked up next run."""
+        fs.create_dir('/state')
+        for book_id in (1, 2, 3, 4):
+            self._make_book(make_book, book_id, f'Book {book_id}')
+        config = self._config(budget_seconds=2)
+        config['retry'] = {'base_delay': 100}
+        clock = FakeClock()
+        read_opf = runner.read_opf
+        failed = []
+
+        def flaky_read_opf(file):
+            clock.sleep(1)
+            if 'Book 4' in file and not failed:
+                failed.append(file)
+                raise OSError(errno.EIO, 'Input/output error', file)
+            return read_opf(file)
+
+        monkeypatch.setattr(runner, 'read_opf', flaky_read_opf)
+        runner.run_scheduled(config, PlanApplier(dry_run=False), retries=RetryQueue.from_config(config['retry']),
+                             clock=clock)
+        assert sorted(_mirror_tree('/mirror')) == ['Book 3/Book 3.epub']
+        monkeypatch.setattr(runner, 'read_opf', read_opf)
+        assert self._run(config, monkeypatch) == ['Book 3/Book 3.epub', 'Book 4/Book 4.epub']
+
+    def test_departed_books_are_removed_up_front(self, fs, make_book):
+        """Test that books missing from the library listing lose their links within the budget."""
+        fs.create_dir('/state')
+        self._make_book(make_book, 1, 'One')
+        gone = self._make_book(make_book, 2, 'Two')
+        config = self._config(budget_seconds=60)
+        runner.run_config_group(config, RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+        fs.remove_object(os.path.dirname(gone))
+        runner.run_config_group(config, RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub']
+
+
+class TestSelection:
+    """Tests for select specs and the shared library catalog."""
+
+    def test_select_spec(self, fs, make_book):
+        """Test that a select spec replaces ext_lib_name membership."""
+        make_book(LIBRARY, 1, 'Hulk', tags=['Comics'])
+        make_book(LIBRARY, 2, 'Akira', tags=['Manga'], languages=['ja'], ext_libs=None)
+        make_book(LIBRARY, 3, 'Dune', tags=['Science Fiction'])
+        select = {'any': [{'tags': 'manga'}, {'#ext_library': 'test-ext-lib', 'not': {'tags': 'Comics'}}]}
+        runner.run_config_group(_config('/mirror', select=select), RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['Akira/Akira.epub', 'Dune/Dune.epub']
+
+    def test_groups_share_one_catalog(self, fs, make_book, monkeypatch):
+        """Test that groups over the same library read each OPF only once per run."""
+        make_book(LIBRARY, 1, 'Hulk', tags=['Comics'])
+        make_book(LIBRARY, 2, 'Akira', tags=['Manga'])
+        reads = []
+        original_read_opf = runner.read_opf
+
+        def read_opf(file):
+            reads.append(file)
+            return original_read_opf(file)
+
+        monkeypatch.setattr(runner, 'read_opf', read_opf)
+        catalogs = {}
+        metrics = RunMetrics()
+        runner.run_config_group(_config('/comics', name='comics', select={'tags': 'Comics'}), metrics, catalogs)
+        runner.run_config_group(_config('/manga', name='manga', select={'tags': 'Manga'}), metrics, catalogs)
+        assert len(reads) == 2
+        assert sorted(_mirror_tree('/comics')) == ['Hulk/Hulk.epub']
+        assert sorted(_mirror_tree('/manga')) == ['Akira/Akira.epub']
+        assert metrics.get('books_matched', group='manga') == 1
+        assert metrics.get('books_scanned', group='manga') == 2
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_only_selected_books_are_listed(self, fs, make_book, monkeypatch, stream):
+        """Test that book directories the walk already saw are listed again only for selected books."""
+        make_book(LIBRARY, 1, 'Hulk', tags=['Comics'])
+        make_book(LIBRARY, 2, 'Akira', tags=['Manga'])
+        make_book(LIBRARY, 3, 'Dune', tags=['Science Fiction'])
+        listed = []
+        list_book_dir = runner.list_book_dir
+
+        def counting_list_book_dir(book_dir):
+            listed.append(os.path.basename(book_dir))
+            return list_book_dir(book_dir)
+
+        monkeypatch.setattr(runner, 'list_book_dir', counting_list_book_dir)
+        runner.run_config_group(_config('/mirror', select={'tags': 'Manga'}, stream=stream), RunMetrics())
+        assert listed == ['Akira (2)']
+        assert sorted(_mirror_tree('/mirror')) == ['Akira/Akira.epub']
+
+    def test_unlistable_selected_book_keeps_its_link(self, fs, make_book, monkeypatch, capsys):
+        make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        config = _config('/mirror', state_path='/state.json', prune_mirror=True)
+        runner.run_config_group(config, RunMetrics())
+        list_book_dir = runner.list_book_dir
+
+        def failing_list_book_dir(book_dir):
+            if 'One' in book_dir:
+                raise PermissionError(errno.EACCES, 'Permission denied', book_dir)
+            return list_book_dir(book_dir)
+
+        monkeypatch.setattr(runner, 'list_book_dir', failing_list_book_dir)
+        summary = runner.run_config_group(config, RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+        assert summary['applied'] == 0
+        assert 'Could not list' in capsys.readouterr().out
+
+    def test_unlistable_book_in_formats_selection_keeps_its_link(self, fs, make_book, monkeypatch):
+        """Test that a failed listing while matching formats fails only that book."""
+        make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        config = _config('/mirror', name='m', select={'formats': 'kepub'}, state_path='/state.json',
+                         prune_mirror=True)
+        runner.run_config_group(config, RunMetrics())
+        make_book(LIBRARY, 3, 'Three')
+        listdir = book_catalog.os.listdir
+
+        def failing_listdir(path):
+            if 'One' in path:
+                raise OSError(errno.EIO, 'Input/output error', path)
+            return listdir(path)
+
+        monkeypatch.setattr(book_catalog.os, 'listdir', failing_listdir)
+        metrics = RunMetrics()
+        runner.run_config_group(config, metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Three/Three.epub', 'Two/Two.epub']
+        assert metrics.get('errors', group='m') == 1
+
+    def test_invalid_select_fails_before_scanning(self, fs):
+        """Test that a malformed spec is reported without touching the library."""
+        with pytest.raises(SelectionError):
+            runner.run_config_group(_config('/mirror', select={'title': 'x'}), RunMetrics())
+        assert not os.path.exists('/mirror')
+
+
+class TestDedup:
+    """Tests for collapsing duplicate imports in batch runs."""
+
+    def test_duplicates_are_mirrored_once(self, fs, make_book):
+        """Test that identical files under different books get one mirror entry."""
+        make_book(LIBRARY, 7, 'Dune')
+        second = make_book(LIBRARY, 3, 'Dune Copy')
+        with open(os.path.join(os.path.dirname(second), 'Dune Copy.kepub'), 'w') as f:
+            f.write('Dune.kepub')
+        make_book(LIBRARY, 5, 'Solo')
+        metrics = RunMetrics()
+        fs.create_dir('/cache')
+        runner.run_config_group(_config('/mirror', name='m', dedup={'cache_path': '/cache/hashes.jsonl'}), metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['Dune Copy/Dune Copy.epub', 'Solo/Solo.epub']
+        assert metrics.get('duplicates', group='m') == 1
+        assert os.path.getsize('/cache/hashes.jsonl') > 0
+
+    def test_unreadable_file_is_mirrored_and_reported(self, fs, make_book, monkeypatch):
+        """Test that a source file failing to hash leaves only its own book out of dedup."""
+        make_book(LIBRARY, 7, 'Dune')
+        second = make_book(LIBRARY, 3, 'Dune Copy')
+        with open(os.path.join(os.path.dirname(second), 'Dune Copy.kepub'), 'w') as f:
+            f.write('Dune.kepub')
+        make_book(LIBRARY, 5, 'Solo')
+
+        def hasher(path):
+            if path.endswith('Dune Copy.kepub'):
+                raise OSError(errno.EIO, 'Input/output error', path)
+            return file_digest(path)
+
+        monkeypatch.setattr(runner, 'ContentHashCache', partial(ContentHashCache, hasher=hasher))
+        metrics = RunMetrics()
+        runner.run_config_group(_config('/mirror', name='m', dedup=True), metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['Dune Copy/Dune Copy.epub', 'Dune/Dune.epub', 'Solo/Solo.epub']
+        assert metrics.get('errors', group='m') == 1
+
+
+class TestTargetedSync:
+    """Tests for re-mirroring single books without a full run."""
+
+    def _sync_config(self, **extra):
+        return _config('/mirror', state_path='/state.json', **extra)
+
+    def _setup(self, fs, make_book):
+        opf_paths = {
+            'one': make_book(LIBRARY, 1, 'One', series='Saga', series_index=1),
+            'two': make_book(LIBRARY, 2, 'Two'),
+        }
+        runner.run_config_group(self._sync_config(), RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['Saga/1 - One.epub', 'Two/Two.epub']
+        return opf_paths
+
+    def _rewrite(self, opf_path, book_id, title, **opf_fields):
+        with open(opf_path, 'w', encoding='utf-8') as f:
+            f.write(make_opf(book_id, title, **opf_fields))
+
+    def test_edited_book_moves(self, fs, make_book):
+        """Test that syncing an edited book renames its link to the new path."""
+        opf_paths = self._setup(fs, make_book)
+        self._rewrite(opf_paths['one'], 1, 'One', series='Saga', series_index=3)
+        summary = runner.sync_config_group(self._sync_config(), [os.path.dirname(opf_paths['one'])])
+        assert summary == {'applied': 1, 'skipped': 0, 'stale': 0, 'failed': 0}
+        assert sorted(_mirror_tree('/mirror')) == ['Saga/3 - One.epub', 'Two/Two.epub']
+
+    def test_deselected_and_deleted_books_are_removed(self, fs, make_book):
+        """Test that books leaving the selection or the library lose their links."""
+        opf_paths = self._setup(fs, make_book)
+        self._rewrite(opf_paths['one'], 1, 'One', series='Saga', series_index=1, ext_libs=['other'])
+        fs.remove_object(os.path.dirname(opf_paths['two']))
+        runner.sync_config_group(self._sync_config(), [opf_paths['one'], os.path.dirname(opf_paths['two'])])
+        assert _mirror_tree('/mirror') == {}
+        runner.run_config_group(self._sync_config(), RunMetrics())
+        assert _mirror_tree('/mirror') == {}
+
+    def test_unresolvable_id_keeps_its_link(self, fs, make_book, capsys):
+        """Test that an id neither metadata.db nor the walk cache knows is not taken for a deleted book."""
+        self._setup(fs, make_book)
+        assert runner.sync_config_group(self._sync_config(), ['2']) is None
+        assert sorted(_mirror_tree('/mirror')) == ['Saga/1 - One.epub', 'Two/Two.epub']
+        assert 'Book 2 is in neither a metadata.db nor the walk cache' in capsys.readouterr().out
+
+    def test_other_library_is_untouched(self, fs, make_book):
+        self._setup(fs, make_book)
+        assert runner.sync_config_group(self._sync_config(), ['/elsewhere/Book (1)']) is None
+
+    def test_sync_books_reads_stdin(self, fs, make_book, monkeypatch):
+        """Test the command line entry point with book ids on stdin."""
+        opf_paths = self._setup(fs, make_book)
+        self._rewrite(opf_paths['two'], 2, 'Two Revised')
+        fs.create_file('/config.yaml', contents=yaml.safe_dump(self._sync_config()))
+        monkeypatch.setattr(runner, 'CONFIG_PATH', '/config.yaml')
+        assert sync_books.main([], io.StringIO(f'{os.path.dirname(opf_paths["two"])}\n\n')) == 0
+        assert sorted(_mirror_tree('/mirror')) == ['Saga/1 - One.epub', 'Two Revised/Two Revised.epub']
+        assert sync_books.main([], io.StringIO('')) == 2
+
+
+class TestRenames:
+    """Tests for renaming links when book metadata changes."""
+
+    def _config(self, **extra):
+        return _config('/mirror', name='m', state_path='/state.json', prune_mirror=True, **extra)
+
+    def test_series_rename_moves_directory(self, fs, make_book):
+        """Test that renaming a series renames its mirror directory instead of relinking each book."""
+        opf_paths = [make_book(LIBRARY, i, f'Book {i}', series='Saga', series_index=i) for i in (1, 2)]
+        make_book(LIBRARY, 3, 'Solo')
+        runner.run_config_group(self._config(), RunMetrics())
+        dir_ino = os.stat('/mirror/Saga').st_ino
+        for i, opf_path in enumerate(opf_paths, start=1):
+            with open(opf_path, 'w', encoding='utf-8') as f:
+                f.write(make_opf(i, f'Book {i}', series='Saga Reborn', series_index=i))
+        metrics = RunMetrics()
+        summary = runner.run_config_group(self._config(), metrics)
+        assert summary == {'applied': 1, 'skipped': 0, 'stale': 0, 'failed': 0}
+        assert sorted(_mirror_tree('/mirror')) == [
+            'Saga Reborn/1 - Book 1.epub', 'Saga Reborn/2 - Book 2.epub', 'Solo/Solo.epub']
+        assert os.stat('/mirror/Saga Reborn').st_ino == dir_ino
+        assert metrics.get('renames', group='m') == 1
+
+    def test_title_change_renames_file(self, fs, make_book):
+        """Test that a book leaving its series directory is renamed on its own."""
+        opf_paths = [make_book(LIBRARY, i, f'Book {i}', series='Saga', series_index=i) for i in (1, 2)]
+        runner.run_config_group(self._config(), RunMetrics())
+        with open(opf_paths[0], 'w', encoding='utf-8') as f:
+            f.write(make_opf(1, 'Book 1', series='Saga', series_index=1.5))
+        summary = runner.run_config_group(self._config(), RunMetrics())
+        assert summary == {'applied': 1, 'skipped': 0, 'stale': 0, 'failed': 0}
+        assert sorted(_mirror_tree('/mirror')) == ['Saga/1.5 - Book 1.epub', 'Saga/2 - Book 2.epub']
+
+
+class TestChangeFeed:
+    """Tests for publishing each run's changed paths."""
+
+    def test_run_writes_and_posts_changes(self, fs, make_book):
+        """Test that a run reports only the folders it touched."""
+        make_book(LIBRARY, 1, 'One', series='Saga', series_index=1)
+        make_book(LIBRARY, 2, 'Two')
+        fs.create_dir('/state')
+        config = _config('/mirror', state_path='/state/state.json', changes_path='/state/changes.json')
+        runner.run_config_group(config, RunMetrics())
+        with open('/state/changes.json', encoding='utf-8') as f:
+            assert sorted(json.load(f)['folders']) == ['Saga', 'Two']
+
+        make_book(LIBRARY, 3, 'Three', series='Saga', series_index=2)
+        with StubServer() as server:
+            runner.run_config_group({**config, 'notify': {'url': server.url, 'mirror_path': '/books'}}, RunMetrics())
+        [(path, headers, body)] = server.requests
+        assert body['folders'] == ['/books/Saga']
+        assert body['changes']['folders']['Saga']['added'] == ['Saga/2 - Three.epub']
+
+    def test_failed_notification_does_not_fail_run(self, fs, make_book, capsys):
+        make_book(LIBRARY, 1, 'One')
+        summary = runner.run_config_group(_config('/mirror', notify={'url': 'http://127.0.0.1:9/rescan'}), RunMetrics())
+        assert summary['applied'] == 2
+        assert 'Could not notify downstream' in capsys.readouterr().out
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_applied_plan_updates_state_and_changes(self, fs, make_book, monkeypatch, stream):
+        """Test that applying a dry run's plan records its links and changes as a regular run would."""
+        opf_path = make_book(LIBRARY, 1, 'One')
+        fs.create_dir('/state')
+        config = _config('/mirror', stream=stream, state_path='/state/state.json',
+                         changes_path='/state/changes.json')
+        runner.run_config_group(config, RunMetrics())
+        with open(opf_path, 'w', encoding='utf-8') as f:
+            f.write(make_opf(1, 'Renamed'))
+        make_book(LIBRARY, 2, 'Two')
+        os.remove('/state/changes.json')
+
+        config = {**config, 'dry_run': True, 'plan_path': '/state/plan.jsonl'}
+        runner.run_config_group(config, RunMetrics())
+        assert MirrorState('/state/state.json').get('1') == '/mirror/One/One.epub'
+        with open('/config.yaml', 'w', encoding='utf-8') as f:
+            yaml.safe_dump(config, f)
+        monkeypatch.setattr(runner, 'CONFIG_PATH', '/config.yaml')
+        assert apply_plan.main(['/state/plan.jsonl']) == 0
+
+        assert sorted(_mirror_tree('/mirror')) == ['Renamed/Renamed.epub', 'Two/Two.epub']
+        state = MirrorState('/state/state.json')
+        assert (state.get('1'), state.get('2')) == ('/mirror/Renamed/Renamed.epub', '/mirror/Two/Two.epub')
+        assert not os.path.exists(runner.pending_state_path('/state/plan.jsonl'))
+        with open('/state/changes.json', encoding='utf-8') as f:
+            assert sorted(json.load(f)['folders']) == ['One', 'Renamed', 'Two']
+
+
+class TestErrorIsolation:
+    """Tests for keeping one bad book or directory from failing or skewing a run."""
+
+    def _config(self, **extra):
+        return _config('/mirror', name='m', state_path='/state.json', prune_mirror=True,
+                       retry={'base_delay': 0}, **extra)
+
+    def test_malformed_opf_keeps_its_link(self, fs, make_book, capsys):
+        """Test that a book whose OPF no longer parses is reported instead of removed."""
+        opf_path = make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        runner.run_config_group(self._config(), RunMetrics())
+        with open(opf_path, 'w', encoding='utf-8') as f:
+            f.write('<package><metadata>')
+        metrics = RunMetrics()
+        runner.run_config_group(self._config(), metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+        assert metrics.get('errors', group='m') == 1
+        assert "1 failed {'OPFParseError': 1}" in capsys.readouterr().out
+
+    def test_flaky_read_is_retried(self, fs, make_book, monkeypatch):
+        """Test that a read failing with EIO is retried after the other books."""
+        make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        read_opf = runner.read_opf
+        reads = []
+
+        def flaky_read_opf(file):
+            reads.append(file)
+            if 'One' in file and reads.count(file) < 3:
+                raise OSError(errno.EIO, 'Input/output error', file)
+            return read_opf(file)
+
+        monkeypatch.setattr(runner, 'read_opf', flaky_read_opf)
+        summary = runner.run_config_group(self._config(), RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+        assert summary['failed'] == 0
+        assert reads[-1] == f'{LIBRARY}/Test Author/One (1)/metadata.opf' and len(reads) == 4
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_flaky_stat_while_planning_is_retried(self, fs, make_book, monkeypatch, stream):
+        """Test that a source file failing to stat with ESTALE is planned again after the other books."""
+        make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        stat = mirror_planner.os.stat
+        failures = []
+
+        def flaky_stat(path, *args, **kwargs):
+            if str(path).endswith('One.kepub') and len(failures) < 2:
+                failures.append(path)
+                raise OSError(errno.ESTALE, 'Stale file handle', path)
+            return stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(mirror_planner.os, 'stat', flaky_stat)
+        metrics = RunMetrics()
+        summary = runner.run_config_group(self._config(stream=stream), metrics)
+        assert len(failures) == 2
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+        assert summary['failed'] == 0 and metrics.get('errors', group='m') == 0
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_unstatable_source_keeps_its_link(self, fs, make_book, monkeypatch, stream):
+        """Test that a book whose source file cannot be stat'ed keeps its link and does not stop the group."""
+        make_book(LIBRARY, 1, 'One')
+        make_book(LIBRARY, 2, 'Two')
+        runner.run_config_group(self._config(), RunMetrics())
+        make_book(LIBRARY, 3, 'Three')
+        stat = mirror_planner.os.stat
+
+        def failing_stat(path, *args, **kwargs):
+            if str(path).endswith('One.kepub'):
+                raise OSError(errno.ESTALE, 'Stale file handle', path)
+            return stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(mirror_planner.os, 'stat', failing_stat)
+        metrics = RunMetrics()
+        runner.run_config_group(self._config(stream=stream), metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Three/Three.epub', 'Two/Two.epub']
+        assert metrics.get('errors', group='m') == 1
+
+    def test_unlistable_directory_keeps_links(self, fs, make_book, monkeypatch):
+        """Test that books under a directory that cannot be listed are not treated as deleted."""
+        make_book(LIBRARY, 1, 'One', authors=['Alice'])
+        make_book(LIBRARY, 2, 'Two', authors=['Bob'])
+        runner.run_config_group(self._config(scan_workers=2), RunMetrics())
+        scan_dir = ConcurrentWalker.scan_dir
+
+        def failing_scan_dir(path):
+            if path.endswith('Bob'):
+                raise PermissionError(errno.EACCES, 'Permission denied', path)
+            return scan_dir(path)
+
+        monkeypatch.setattr(ConcurrentWalker, 'scan_dir', staticmethod(failing_scan_dir))
+        runner.run_config_group(self._config(scan_workers=2), RunMetrics())
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub', 'Two/Two.epub']
+
+    def test_unlistable_directory_fails_stream_run(self, fs, make_book, monkeypatch):
+        """Test that a directory a streaming walk could not list counts as an error of the run."""
+        make_book(LIBRARY, 1, 'One', authors=['Alice'])
+        make_book(LIBRARY, 2, 'Two', authors=['Bob'])
+        scan_dir = ConcurrentWalker.scan_dir
+
+        def failing_scan_dir(path):
+            if path.endswith('Bob'):
+                raise PermissionError(errno.EACCES, 'Permission denied', path)
+            return scan_dir(path)
+
+        monkeypatch.setattr(ConcurrentWalker, 'scan_dir', staticmethod(failing_scan_dir))
+        metrics = RunMetrics()
+        runner.run_config_group(self._config(scan_workers=2, stream=True), metrics)
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub']
+        assert metrics.get('errors', group='m') == 1
+        assert metrics.get('last_success_timestamp_seconds', group='m') is None
+
+    def test_failing_group_does_not_stop_others(self, fs, make_book, monkeypatch):
+        make_book(LIBRARY, 1, 'One')
+        configs = [_config('/broken', select={'nonsense': 'x'}), _config('/mirror')]
+        fs.create_file('/config.yaml', contents=yaml.safe_dump_all(configs))
+        monkeypatch.setattr(runner, 'CONFIG_PATH', '/config.yaml')
+        assert runner.main() == 1
+        assert sorted(_mirror_tree('/mirror')) == ['One/One.epub']
+
+
+class TestFaultInjection:
+    """A fault-injecting filesystem under a 100k-book library."""
+
+    BOOKS = 100_000
+    FLAKY = 12
+
+    def test_flaky_files_cannot_stall_a_large_run(self, monkeypatch):
+        """Test that a handful of flaky files are retried after the healthy books, within the budget."""
+        opf = make_opf(1, 'Book')
+        files = [f'/library/Author/Book ({i})/metadata.opf' for i in range(self.BOOKS)]
+        flaky = {files[i * (self.BOOKS // self.FLAKY)]: 2 for i in range(self.FLAKY)}
+        codes = itertools.cycle((errno.EIO, errno.EAGAIN, errno.ESTALE))
+        flaky[files[-1]] = 100  # never recovers
+        broken = files[1]
+        clock = FakeClock()
+        yielded_before_sleep = []
+
+        def faulty_read_opf(file):
+            if flaky.get(file, 0) > 0:
+                flaky[file] -= 1
+                raise OSError(errno.ESTALE if file == files[-1] else next(codes), 'flaky', file)
+            return '<package><metadata>' if file == broken else opf
+
+        def sleep(seconds):
+            if not yielded_before_sleep:
+                yielded_before_sleep.append(len(records))
+            clock.sleep(seconds)
+
+        monkeypatch.setattr(runner, 'read_opf', faulty_read_opf)
+        retries = RetryQueue(max_attempts=4, budget=100, clock=clock, sleep=sleep)
+        records = []
+        for record in runner.iter_records({}, files, retries):
+            records.append(record)
+
+        assert len(records) == self.BOOKS - 2
+        # Every healthy book came through before the run waited on any retry.
+        assert yielded_before_sleep[0] >= self.BOOKS - self.FLAKY - 2
+        assert clock.now <= 0.5 * (1 + 2 + 4)
+        errors = {file: error_class(error) for file, error in retries.failures}
+        assert errors == {broken: 'OPFParseError', files[-1]: 'ESTALE'}